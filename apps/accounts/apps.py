@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class AccountsConfig(AppConfig):
+    """
+    Configuração do app de contas.
+    """
+
+    name = 'apps.accounts'
+
+    def ready(self):
+        """
+        Registra os signals do app.
+        """
+
+        from . import signals  # noqa: F401
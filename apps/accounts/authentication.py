@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from shared.metrics import registry
+
+LOOKUPS = registry.counter(
+    "auth_user_cache_lookups_total",
+    "Usuários do JWT buscados no cache, por resultado (hit, sem consulta ao banco, ou miss).",
+    labels=("result",)
+)
+
+# Versão de cada usuário no cache do Django, compartilhado entre os
+# processos: faz parte da chave do UserCache e muda a cada alteração
+VERSION_KEY = "accounts:user:version:{}"
+
+
+def get_user_version(user_id):
+    """
+    Retorna a versão do usuário, criando uma nova quando ela não está no
+    cache (primeiro acesso ou cache expurgado).
+    """
+
+    version = cache.get(VERSION_KEY.format(user_id))
+    if version is None:
+        version = int(time.time() * 1000000)
+        cache.add(VERSION_KEY.format(user_id), version, timeout=None)
+        version = cache.get(VERSION_KEY.format(user_id), version)
+
+    return version
+
+
+def bump_user_version(user_id):
+    """
+    Gera uma nova versão do usuário, invalidando as suas entradas do
+    UserCache em todos os processos.
+    """
+
+    previous = cache.get(VERSION_KEY.format(user_id), 0)
+    cache.set(VERSION_KEY.format(user_id), max(int(time.time() * 1000000), previous + 1), timeout=None)
+
+
+class UserCache:
+    """
+    Cache em memória, por processo, dos usuários já autenticados, com
+    tempo de expiração (AUTH_USER_CACHE_TIMEOUT) e descarte dos menos
+    usados recentemente quando passa de AUTH_USER_CACHE_SIZE entradas.
+    As chaves são o id do usuário, o identificador (jti) do token e a
+    versão do usuário no cache do Django.
+
+    As alterações do usuário (post_save e post_delete) removem as suas
+    entradas neste processo e geram uma nova versão, que os demais
+    processos passam a procurar. Alterações que não enviam os signals
+    (ex: QuerySet.update) só são vistas quando a entrada expira.
+    """
+
+    def __init__(self):
+        """
+        Construtor.
+        """
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Retorna o usuário da chave ou None, contando os acertos e as faltas.
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                user = entry[0]
+            else:
+                if entry is not None:
+                    del self.entries[key]
+
+                self.misses += 1
+                user = None
+
+        LOOKUPS.inc(result="miss" if user is None else "hit")
+
+        return user
+
+    def set(self, key, user):
+        """
+        Guarda o usuário, descartando as entradas menos usadas recentemente.
+        """
+
+        timeout = settings.AUTH_USER_CACHE_TIMEOUT
+        if timeout <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (user, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.AUTH_USER_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """
+        Remove as entradas do usuário.
+        """
+
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        """
+        Remove todas as entradas e zera os contadores.
+        """
+
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Tamanho do cache e contadores de acertos e faltas.
+        """
+
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    Autenticação JWT que busca o usuário do token no UserCache e só
+    consulta o banco na primeira requisição de cada token ou após a
+    expiração ou invalidação da entrada. A versão do usuário é lida do
+    cache do Django a cada requisição.
+    """
+
+    def get_user(self, validated_token):
+        """
+        Retorna o usuário do token, do cache ou do banco de dados.
+        """
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        key = (user_id, validated_token.get(api_settings.JTI_CLAIM), get_user_version(user_id))
+        user = user_cache.get(key)
+        if user is None:
+            user = super(CachedJWTAuthentication, self).get_user(validated_token)
+            user_cache.set(key, user)
+
+        return user
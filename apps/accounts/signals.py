@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import bump_user_version, user_cache
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """
+    Remove o usuário alterado ou excluído (ex: desativado ou com outra
+    senha) do cache da autenticação deste processo e, quando a transação
+    for confirmada, gera uma nova versão do usuário para os demais.
+    """
+
+    user_id = instance.pk
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: bump_user_version(user_id))
@@ -0,0 +1,107 @@
+from unittest import mock
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import user_cache
+from .models import User
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CachedJWTAuthenticationTestCase(APITestCase):
+    """
+    Testes do cache de usuários da autenticação JWT.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            name='Fulano',
+            email='fulano@gmail.com',
+            password='django1234'
+        )
+        self.url = reverse('cnab-stores')
+
+    def authenticate(self, user):
+        """
+        Envia um token de acesso novo do usuário nas próximas requisições.
+        """
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    def test_user_is_resolved_from_cache(self):
+        """
+        Só a primeira requisição de cada token busca o usuário no banco.
+        """
+
+        self.authenticate(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        self.assertEqual(user_cache.stats(), {"size": 1, "hits": 0, "misses": 1})
+
+        with mock.patch.object(User.objects, "get", side_effect=AssertionError) as get:
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+        get.assert_not_called()
+        self.assertEqual(user_cache.stats(), {"size": 1, "hits": 1, "misses": 1})
+
+        self.authenticate(self.user)
+        self.client.get(self.url)
+        self.assertEqual(user_cache.stats()["misses"], 2)
+
+    def test_cache_is_invalidated_by_user_changes(self):
+        """
+        Alterar ou excluir o usuário remove as suas entradas do cache.
+        """
+
+        self.authenticate(self.user)
+        self.client.get(self.url)
+        self.user.name = "Ciclano"
+        self.user.save()
+        self.assertEqual(user_cache.stats()["size"], 0)
+
+        self.client.get(self.url)
+        self.user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_of_other_processes_is_invalidated_by_version(self):
+        """
+        As entradas dos demais processos, que não recebem o signal, deixam
+        de ser usadas pela nova versão do usuário no cache compartilhado.
+        """
+
+        self.authenticate(self.user)
+        self.client.get(self.url)
+        with mock.patch.object(user_cache, "invalidate"), self.captureOnCommitCallbacks(execute=True):
+            self.user.name = "Ciclano"
+            self.user.save()
+
+        self.assertEqual(user_cache.stats()["size"], 1)
+        with mock.patch("apps.accounts.authentication.JWTAuthentication.get_user", return_value=self.user) as get_user:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        get_user.assert_called_once()
+        self.assertEqual(user_cache.stats()["misses"], 2)
+
+    @override_settings(AUTH_USER_CACHE_SIZE=2)
+    def test_cache_expires_and_is_bounded(self):
+        """
+        As entradas expiram pelo tempo e as menos usadas são descartadas.
+        """
+
+        for _ in range(3):
+            self.authenticate(self.user)
+            self.client.get(self.url)
+
+        self.assertEqual(user_cache.stats()["size"], 2)
+
+        with mock.patch("apps.accounts.authentication.time.monotonic", return_value=10 ** 9):
+            self.client.get(self.url)
+
+        self.assertEqual(user_cache.stats(), {"size": 2, "hits": 0, "misses": 4})
@@ -0,0 +1,57 @@
+import asyncio
+import weakref
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from .views import CNABViewSet
+
+# Semáforo de uploads simultâneos de cada event loop
+_upload_slots = weakref.WeakKeyDictionary()
+
+# View do DRF do upload síncrono, chamada pelo upload assíncrono
+sync_upload = CNABViewSet.as_view({"post": "cnab"})
+
+
+def upload_slots():
+    """
+    Semáforo que limita os uploads processados ao mesmo tempo no event
+    loop atual a CNAB_ASYNC_UPLOADS. Os demais aguardam sem ocupar threads.
+    """
+
+    loop = asyncio.get_event_loop()
+    if loop not in _upload_slots:
+        _upload_slots[loop] = asyncio.Semaphore(settings.CNAB_ASYNC_UPLOADS)
+
+    return _upload_slots[loop]
+
+
+def upload_request(request):
+    """
+    Parte síncrona do upload, executada em uma thread do executor: passa
+    a requisição pela mesma view do endpoint síncrono /cnab/upload/, com a
+    autenticação, as permissões, o throttling e o tratamento de exceções
+    do DRF, renderiza a resposta e fecha as conexões com o banco abertas
+    pela thread.
+    """
+
+    try:
+        return sync_upload(request).render()
+    finally:
+        connections.close_all()
+
+
+async def upload(request):
+    """
+    Upload do CNAB para servidores ASGI. O corpo da requisição é recebido
+    de forma assíncrona pelo Django, e a view do DRF (leitura, parser e
+    banco) roda no executor de threads, limitada pelo semáforo de uploads,
+    para que um cliente lento não bloqueie o processo. A resposta é a
+    mesma do endpoint síncrono /cnab/upload/.
+    """
+
+    async with upload_slots():
+        return await sync_to_async(upload_request, thread_sensitive=False)(request)
+
+
+# A autenticação é feita pelo token JWT, sem cookies de sessão
+upload.csrf_exempt = True
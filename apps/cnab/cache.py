@@ -0,0 +1,114 @@
+import time
+from functools import wraps
+from hashlib import md5
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+from rest_framework.views import status
+from shared.renderers import NDJSONRenderer
+
+# Versão dos dados de cada usuário: instante, em milissegundos,
+# da última importação que alterou as suas lojas
+VERSION_KEY = "cnab:version:{}"
+
+# Resposta de uma URL para um usuário em uma versão dos dados
+RESPONSE_KEY = "cnab:response:{}:{}:{}"
+
+# Representação de uma loja já serializada, válida enquanto
+# a loja não for alterada (updated_at)
+FRAGMENT_KEY = "cnab:store:{}:{}"
+
+
+def fragment_key(store):
+    """
+    Chave do fragmento serializado da loja. Cada lote ingerido atualiza
+    o updated_at das lojas que receberam transações, então as demais
+    lojas mantêm os seus fragmentos.
+    """
+
+    return FRAGMENT_KEY.format(store.pk, store.updated_at.timestamp())
+
+
+def get_version(user_id):
+    """
+    Retorna a versão dos dados do usuário, criando uma nova quando ela
+    não está no cache (primeiro acesso ou cache expurgado).
+    """
+
+    version = cache.get(VERSION_KEY.format(user_id))
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(VERSION_KEY.format(user_id), version, timeout=None)
+        version = cache.get(VERSION_KEY.format(user_id), version)
+
+    return version
+
+
+def bump_version(user_id):
+    """
+    Gera uma nova versão dos dados do usuário, invalidando as suas
+    respostas em cache. A versão nova fica sempre em um segundo posterior
+    ao da anterior, pois o Last-Modified tem a precisão de segundos.
+    """
+
+    previous = cache.get(VERSION_KEY.format(user_id), 0)
+    version = max(int(time.time() * 1000), (previous // 1000 + 1) * 1000)
+    cache.set(VERSION_KEY.format(user_id), version, timeout=None)
+
+    return version
+
+
+def bump_versions(stores):
+    """
+    Gera uma nova versão para os donos das lojas informadas (queryset)
+    quando a transação atual for confirmada, para que uma leitura
+    concorrente não guarde no cache os dados antigos na versão nova.
+    """
+
+    user_ids = list(stores.order_by().values_list("user_id", flat=True).distinct())
+    transaction.on_commit(lambda: [bump_version(user_id) for user_id in user_ids])
+
+
+def cached_response(view):
+    """
+    Decorator das actions de leitura: guarda a resposta no cache por
+    usuário, URL e versão dos dados e envia o ETag e o Last-Modified.
+    Requisições condicionais (If-None-Match / If-Modified-Since) de uma
+    versão que não mudou são respondidas com 304 consultando apenas o cache.
+    As respostas NDJSON, enviadas aos poucos, não passam pelo cache.
+    """
+
+    @wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            return view(self, request, *args, **kwargs)
+
+        user_id = request.user.pk
+        url = request.build_absolute_uri()
+        version = get_version(user_id)
+        etag = quote_etag(md5(f"{user_id}:{version}:{url}".encode()).hexdigest())
+        last_modified = version // 1000
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = RESPONSE_KEY.format(user_id, version, md5(url.encode()).hexdigest())
+            data = cache.get(key)
+            if data is not None:
+                response = Response(data, status=status.HTTP_200_OK)
+            else:
+                response = view(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+                cache.set(key, response.data, settings.CNAB_CACHE_TIMEOUT)
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = "private, no-cache"
+
+        return response
+
+    return wrapper
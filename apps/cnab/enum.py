@@ -32,3 +32,14 @@ class TransactionSignal(Enum):
     TED = "+"
     DOC = "+"
     RENT = "-"
+
+
+class JobStatus(models.TextChoices):
+    """
+    Situação de um job de importação de CNAB.
+    """
+
+    PENDING = "pending", "Pendente"
+    RUNNING = "running", "Processando"
+    DONE = "done", "Concluído"
+    FAILED = "failed", "Falhou"
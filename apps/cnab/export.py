@@ -0,0 +1,83 @@
+import csv
+import io
+import zlib
+from django.conf import settings
+from .models import CNAB
+
+# Colunas do CSV e os campos correspondentes do CNAB e da loja
+COLUMNS = (
+    ("id", "id"),
+    ("loja", "store__title"),
+    ("cpf", "store__cpf"),
+    ("dono", "store__owner"),
+    ("tipo", "transaction_type"),
+    ("sinal", "transaction_signal"),
+    ("data", "date"),
+    ("hora", "time"),
+    ("valor", "value"),
+    ("cartao", "card"),
+)
+
+# Tamanho aproximado, em caracteres, de cada pedaço do CSV enviado
+BUFFER_SIZE = 64 * 1024
+
+
+def export_rows(queryset=None):
+    """
+    Lê as transações, com os dados da loja, do cursor do banco em blocos
+    de CNAB_STREAM_CHUNK_SIZE linhas, sem instanciar os modelos.
+    """
+
+    queryset = CNAB.objects.all() if queryset is None else queryset
+    rows = queryset.values_list(*(field for _, field in COLUMNS))
+
+    for row in rows.iterator(chunk_size=settings.CNAB_STREAM_CHUNK_SIZE):
+        row = list(row)
+        row[6] = row[6].isoformat()
+        row[7] = row[7].isoformat()
+        row[8] = f"{row[8]:.2f}"
+        yield row
+
+
+def iter_csv(rows):
+    """
+    Escreve as linhas em CSV e entrega o texto codificado em UTF-8 em
+    pedaços de aproximadamente BUFFER_SIZE caracteres.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column for column, _ in COLUMNS])
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= BUFFER_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(chunks):
+    """
+    Comprime os pedaços no formato gzip à medida que são gerados.
+    """
+
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def export_csv(queryset=None, compress=False):
+    """
+    Pipeline da exportação: transações do banco -> CSV -> gzip opcional.
+    """
+
+    chunks = iter_csv(export_rows(queryset))
+
+    return gzip_stream(chunks) if compress else chunks
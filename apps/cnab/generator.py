@@ -0,0 +1,113 @@
+import random
+from datetime import date, timedelta
+from .parser import TRANSACTION_CODES
+
+# Tamanho dos campos de texto do layout do CNAB
+OWNER_SIZE = 14
+STORE_SIZE = 18
+
+# Primeiro dia das transações geradas
+START_DATE = date(2019, 1, 1)
+
+# Quantidade de registros recentes de onde as linhas duplicadas são sorteadas
+DUPLICATE_POOL = 10000
+
+# Linhas gravadas por vez no arquivo
+WRITE_BATCH = 10000
+
+
+def parse_type_mix(spec):
+    """
+    Converte a proporção de tipos de transação informada como texto em
+    pesos por código. Ex: "1=3,4=1" gera três débitos para cada crédito.
+    """
+
+    mix = {}
+    for item in spec.split(","):
+        code, _, weight = item.partition("=")
+        code = code.strip()
+        if code.encode() not in TRANSACTION_CODES:
+            raise ValueError(f"Tipo de transação inválido: {code}.")
+
+        try:
+            mix[code] = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f"Peso inválido para o tipo {code}: {weight}.")
+
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Informe ao menos um tipo de transação com peso positivo.")
+
+    return mix
+
+
+def generate_records(lines, stores=10, types=None, duplicate_rate=0.0, seed=None, prefix="LOJA"):
+    """
+    Gera linhas válidas de CNAB (81 bytes, com a quebra de linha) de
+    stores lojas, com a proporção de tipos de transação types
+    ({código: peso}, todos iguais por padrão).
+
+    Cada linha nova tem uma data e hora diferente das demais, então só
+    se repetem as linhas sorteadas como duplicadas, com a probabilidade
+    duplicate_rate, entre as recentes. O mesmo seed gera o mesmo arquivo.
+    """
+
+    names = [f"{prefix} {number:04d}" for number in range(1, stores + 1)]
+    if stores < 1 or len(names[-1]) > STORE_SIZE:
+        raise ValueError(f"O nome das lojas ({names[-1] if names else prefix}) deve ter até {STORE_SIZE} caracteres.")
+
+    rng = random.Random(seed)
+    mix = types or {code.decode(): 1.0 for code in TRANSACTION_CODES}
+    codes, weights = list(mix), list(mix.values())
+    shops = [
+        (f"{rng.randrange(10 ** 11):011d}", f"DONO {number:04d}".ljust(OWNER_SIZE), name.ljust(STORE_SIZE))
+        for number, name in enumerate(names, start=1)
+    ]
+
+    recent = []
+    unique = 0
+    for _ in range(lines):
+        if recent and rng.random() < duplicate_rate:
+            yield rng.choice(recent)
+            continue
+
+        day, second = divmod(unique, 86400)
+        cpf, owner, store = shops[rng.randrange(stores)]
+        record = "".join((
+            rng.choices(codes, weights)[0],
+            (START_DATE + timedelta(days=day)).strftime("%Y%m%d"),
+            f"{rng.randint(1, 10 ** 7):010d}",
+            cpf,
+            f"{rng.randrange(10 ** 4):04d}****{rng.randrange(10 ** 4):04d}",
+            f"{second // 3600:02d}{second // 60 % 60:02d}{second % 60:02d}",
+            owner,
+            store,
+            "\n"
+        )).encode()
+
+        if len(recent) < DUPLICATE_POOL:
+            recent.append(record)
+        else:
+            recent[unique % DUPLICATE_POOL] = record
+
+        unique += 1
+        yield record
+
+
+def write_cnab(output, lines, **options):
+    """
+    Grava no arquivo binário output as linhas geradas pelo
+    generate_records e retorna a quantidade de bytes gravados.
+    """
+
+    size = 0
+    buffer = []
+    for record in generate_records(lines, **options):
+        buffer.append(record)
+        if len(buffer) >= WRITE_BATCH:
+            size += output.write(b"".join(buffer))
+            buffer = []
+
+    if buffer:
+        size += output.write(b"".join(buffer))
+
+    return size
@@ -0,0 +1,276 @@
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from django.db import transaction
+from rest_framework.views import status
+from shared.exception import GenericException
+from shared.timing import phase
+from .cache import bump_versions
+from .ingestion import CNABIngestion
+from .metrics import record_ingestion
+from .models import CNABUpload, Store
+from .parser import parse_record, InvalidRecord, InvalidRecordLength
+from .reader import invalid_record
+
+logger = logging.getLogger(__name__)
+
+# Campo do formulário com o arquivo de CNAB
+FILE_FIELD = "file"
+
+# Tamanho máximo, em bytes, de uma linha ainda sem quebra de linha. Um
+# registro tem 81 caracteres, e os nomes acentuados ocupam mais de um byte.
+MAX_LINE_SIZE = 4 * 81
+
+
+@contextmanager
+def parse_on_receive(request, user, params):
+    """
+    Instala o CNABUploadHandler na requisição do Django, antes da leitura
+    do corpo, quando CNAB_PARSE_ON_RECEIVE está ativo. O upload com
+    mode=async continua usando os handlers padrões, pois o worker precisa
+    do arquivo armazenado. Se a leitura do corpo falhar, por exemplo com
+    a conexão interrompida pelo cliente, a ingestão é desfeita.
+    """
+
+    handler = None
+    if settings.CNAB_PARSE_ON_RECEIVE and params.get("mode") != "async":
+        handler = CNABUploadHandler(user, request)
+        request.upload_handlers.insert(0, handler)
+
+    try:
+        yield
+    except BaseException:
+        if handler is not None:
+            handler.abort()
+        raise
+
+
+class ReceivedCNAB:
+    """
+    Arquivo de CNAB já ingerido pelo CNABUploadHandler. Fica no lugar do
+    arquivo enviado em request.FILES, com o seu SHA-256 e as estatísticas
+    da ingestão, pois o conteúdo não é armazenado.
+    """
+
+    def __init__(self, name, content_type, size, sha256, stats, store_ids):
+        """
+        Construtor.
+        """
+
+        self.name = name
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+        self.stats = stats
+        self.store_ids = store_ids
+
+
+class CNABUploadHandler(FileUploadHandler):
+    """
+    Handler de upload que converte e ingere o CNAB enquanto o corpo da
+    requisição é recebido, sem armazenar o arquivo em memória ou em disco.
+
+    Cada chunk recebido é cortado nas quebras de linha e os registros são
+    convertidos e agrupados em lotes de CNAB_BATCH_SIZE, ingeridos pelo
+    CNABIngestion assim que completos. Todos os lotes são ingeridos em
+    uma única transação, confirmada apenas com o arquivo completo: um
+    arquivo recusado no meio não deixa nenhuma transação gravada, ao custo
+    de manter as lojas bloqueadas enquanto o cliente envia o restante do
+    arquivo. O SHA-256 só é conhecido ao fim do corpo, então um arquivo já
+    registrado para o usuário é convertido, mas a sua ingestão é desfeita
+    antes de ser confirmada. Arquivos maiores que CNAB_UPLOAD_MAX_SIZE, de
+    outro tipo ou com um registro inválido são recusados sem ler o
+    restante do corpo.
+    """
+
+    def __init__(self, user, request=None):
+        """
+        Construtor.
+        """
+
+        super(CNABUploadHandler, self).__init__(request)
+        self.user = user
+        self.active = False
+        self.transaction = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        """
+        Recusa a requisição pelo Content-Length, antes de ler o corpo.
+        """
+
+        if content_length > settings.CNAB_UPLOAD_MAX_SIZE:
+            raise self.too_large()
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        """
+        Assume o arquivo do campo file, validando o seu tipo.
+        """
+
+        super(CNABUploadHandler, self).new_file(
+            field_name, file_name, content_type, content_length, charset, content_type_extra
+        )
+
+        if field_name != FILE_FIELD:
+            return
+
+        if content_type != "text/plain":
+            raise GenericException(
+                "Formato de arquivo inválido, deve ser do tipo text/plain.",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+
+        self.active = True
+        self.start = time.perf_counter()
+        self.ingestion = CNABIngestion(self.user)
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.line = 0
+        self.remainder = b""
+        self.batch = []
+        self.transaction = transaction.atomic()
+        self.transaction.__enter__()
+
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        """
+        Converte as linhas completas do chunk e guarda o restante para o
+        próximo. Retorna None para que os demais handlers não armazenem o arquivo.
+        """
+
+        if not self.active:
+            return raw_data
+
+        try:
+            self.receive_chunk(raw_data)
+        except BaseException:
+            self.abort()
+            raise
+
+        return None
+
+    def receive_chunk(self, raw_data):
+        """
+        Corta o chunk nas quebras de linha e converte as linhas completas.
+        """
+
+        self.size += len(raw_data)
+        if self.size > settings.CNAB_UPLOAD_MAX_SIZE:
+            raise self.too_large()
+
+        self.digest.update(raw_data)
+        data = self.remainder + raw_data
+        cut = data.rfind(b"\n") + 1
+        self.remainder = data[cut:]
+        if len(self.remainder) > MAX_LINE_SIZE:
+            raise invalid_record(InvalidRecordLength(self.line + 1))
+
+        for line in data[:cut].splitlines(True):
+            self.receive_line(line)
+
+    def file_complete(self, file_size):
+        """
+        Ingere a última linha e o último lote e retorna o ReceivedCNAB. A
+        ingestão só é confirmada se o arquivo ainda não foi registrado
+        para o usuário; do contrário o registro responde o upload.
+        """
+
+        if not self.active:
+            return None
+
+        self.active = False
+        try:
+            if self.remainder:
+                self.receive_line(self.remainder)
+
+            self.flush()
+        except BaseException:
+            self.abort()
+            raise
+
+        sha256 = self.digest.hexdigest()
+        if CNABUpload.objects.filter(user=self.user, sha256=sha256).exists():
+            self.abort()
+            return ReceivedCNAB(self.file_name, self.content_type, self.size, sha256, None, set())
+
+        self.commit()
+        bump_versions(Store.objects.filter(id__in=self.ingestion.store_ids))
+        self.ingestion.seconds = time.perf_counter() - self.start
+        stats = self.ingestion.stats()
+        logger.info(
+            "CNAB ingerido durante o upload: %(lines)s linhas, %(inserted)s inseridas, "
+            "%(duplicates)s duplicadas, %(rejected)s rejeitadas em %(seconds)ss",
+            stats
+        )
+        record_ingestion(stats, "upload")
+
+        return ReceivedCNAB(self.file_name, self.content_type, self.size, sha256, stats, self.ingestion.store_ids)
+
+    def upload_interrupted(self):
+        """
+        Desfaz a ingestão quando o corpo termina sem completar o arquivo.
+        """
+
+        self.abort()
+
+    def receive_line(self, line):
+        """
+        Converte uma linha e ingere o lote quando ele fica completo.
+        """
+
+        self.line += 1
+        try:
+            self.batch.append(parse_record(line))
+        except InvalidRecord as error:
+            error.line = self.line
+            raise invalid_record(error)
+
+        if len(self.batch) >= self.ingestion.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Ingere o lote atual na transação do arquivo.
+        """
+
+        if not self.batch:
+            return
+
+        with phase("write"):
+            self.ingestion.ingest_batch(self.batch)
+
+        self.batch = []
+
+    def commit(self):
+        """
+        Confirma a transação do arquivo.
+        """
+
+        atomic, self.transaction = self.transaction, None
+        atomic.__exit__(None, None, None)
+
+    def abort(self):
+        """
+        Desfaz a transação do arquivo, se ainda estiver aberta.
+        """
+
+        self.active = False
+        if self.transaction is None:
+            return
+
+        atomic, self.transaction = self.transaction, None
+        transaction.set_rollback(True)
+        atomic.__exit__(None, None, None)
+
+    def too_large(self):
+        """
+        Erro do arquivo maior que o tamanho máximo.
+        """
+
+        return GenericException(
+            f"O arquivo de CNAB deve ter no máximo {settings.CNAB_UPLOAD_MAX_SIZE} bytes.",
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
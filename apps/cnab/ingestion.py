@@ -0,0 +1,305 @@
+import logging
+import time
+from decimal import Decimal
+from itertools import islice
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from shared.timing import phase
+from .cache import bump_versions
+from .models import CNAB, Store, cnab_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Campos obrigatórios de cada linha, os mesmos validados pelo StoreSerializer
+REQUIRED_FIELDS = (
+    "transaction_type", "transaction_signal", "date", "value",
+    "cpf", "card", "time", "owner", "store"
+)
+
+# Campos de cada CNAB inserido
+CNAB_FIELDS = (
+    "store_id", "transaction_type", "transaction_signal",
+    "date", "time", "value", "card", "fingerprint"
+)
+
+
+def batched(iterable, size):
+    """
+    Agrupa os itens de um iterável em listas de no máximo size elementos.
+    """
+
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+
+        yield batch
+
+
+def timed_batches(records, size):
+    """
+    Agrupa os registros em lotes como o batched, medindo na fase "parse"
+    o tempo de leitura e conversão de cada lote.
+    """
+
+    batches = batched(records, size)
+    while True:
+        with phase("parse"):
+            batch = next(batches, None)
+
+        if batch is None:
+            return
+
+        yield batch
+
+
+def normalize(record):
+    """
+    Valida os campos obrigatórios e converte o valor em centavos
+    para o decimal do banco de dados. Retorna None se faltar algum campo.
+    """
+
+    for field in REQUIRED_FIELDS:
+        if record.get(field) in (None, ""):
+            return None
+
+    record["value"] = Decimal(record["value"]).scaleb(-2)
+
+    return record
+
+
+def balance_deltas(cnabs):
+    """
+    Agrupa as transações inseridas por loja no formato do livro de
+    saldos: {id: [quantidade, créditos, débitos]}.
+    """
+
+    deltas = {}
+    for cnab in cnabs:
+        delta = deltas.setdefault(cnab.store_id, [0, 0, 0])
+        delta[0] += 1
+        delta[1 if cnab.transaction_signal == "+" else 2] += cnab.value
+
+    return deltas
+
+
+def create_stores(user, stores, batch_size):
+    """
+    Cria as lojas do usuário com um único INSERT e retorna quantas foram
+    criadas. Se outra ingestão do usuário criou alguma delas ao mesmo
+    tempo, cria as restantes uma a uma, contando apenas as inseridas aqui.
+    """
+
+    try:
+        with transaction.atomic():
+            Store.objects.bulk_create(stores, batch_size=batch_size)
+        return len(stores)
+    except IntegrityError:
+        created = 0
+        for store in stores:
+            _, inserted = Store.objects.get_or_create(
+                user=user,
+                title=store.title,
+                defaults={"cpf": store.cpf, "owner": store.owner}
+            )
+            created += inserted
+
+        return created
+
+
+class CNABIngestion:
+    """
+    Motor de ingestão em lote dos CNABs.
+
+    Resolve as lojas de cada lote com uma única consulta, cria as que faltam
+    com bulk_create e insere os CNABs em lotes dentro de uma única transação.
+    As transações são deduplicadas pela impressão digital, que tem um índice
+    único no banco. O livro de saldos das lojas é atualizado junto com
+    cada lote.
+    """
+
+    def __init__(self, user, batch_size=None, on_batch=None, atomic=True, stores=None):
+        """
+        Construtor. O on_batch, quando informado, é chamado com a
+        própria ingestão ao fim de cada lote. Com atomic=False cada lote
+        é confirmado na sua própria transação. O stores permite informar
+        as lojas do usuário já resolvidas (título -> id).
+        """
+
+        self.user = user
+        self.batch_size = batch_size or settings.CNAB_BATCH_SIZE
+        self.on_batch = on_batch
+        self.atomic = atomic
+        self.stores = dict(stores or {})
+        self.lines = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.stores_created = 0
+        self.seconds = 0.0
+
+    def run(self, records):
+        """
+        Ingere os registros convertidos pelo parser do CNAB e retorna as
+        estatísticas. Ao final, invalida as respostas em cache dos donos
+        das lojas ingeridas.
+        """
+
+        start = time.perf_counter()
+        try:
+            if self.atomic:
+                with transaction.atomic():
+                    self.__ingest(records)
+            else:
+                self.__ingest(records)
+        finally:
+            if self.stores:
+                bump_versions(Store.objects.filter(id__in=self.store_ids))
+
+        self.seconds = time.perf_counter() - start
+        stats = self.stats()
+        logger.info(
+            "CNAB ingerido: %(lines)s linhas, %(inserted)s inseridas, %(duplicates)s duplicadas, "
+            "%(rejected)s rejeitadas em %(seconds)ss (%(rows_per_second)s linhas/s)",
+            stats
+        )
+
+        return stats
+
+    def __ingest(self, records):
+        """
+        Ingere os registros lote a lote. Quando não há uma transação
+        externa, cada lote é confirmado na sua própria transação.
+        """
+
+        for batch in timed_batches(records, self.batch_size):
+            with phase("write"), transaction.atomic(savepoint=False):
+                self.ingest_batch(batch)
+
+            if self.on_batch:
+                self.on_batch(self)
+
+    @property
+    def store_ids(self):
+        """
+        Ids das lojas dos registros ingeridos.
+        """
+
+        return set(self.stores.values())
+
+    def stats(self):
+        """
+        Estatísticas da ingestão.
+        """
+
+        return {
+            "lines": self.lines,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "stores_created": self.stores_created,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.lines / self.seconds, 2) if self.seconds else 0.0
+        }
+
+    def ingest_batch(self, records):
+        """
+        Ingere um lote de registros.
+        """
+
+        rows = []
+        for record in records:
+            self.lines += 1
+            row = normalize(record)
+            if row is None:
+                self.rejected += 1
+                continue
+
+            rows.append(row)
+
+        if not rows:
+            return
+
+        self.__resolve_stores(rows)
+        self.__lock_stores(rows)
+
+        for row in rows:
+            row["store_id"] = self.stores[row["store"]]
+            row["fingerprint"] = cnab_fingerprint(
+                self.user.pk, row["store"], row["transaction_type"], row["transaction_signal"],
+                row["date"], row["time"], row["value"], row["card"]
+            )
+
+        existing = self.__existing_fingerprints(rows)
+
+        cnabs = []
+        for row in rows:
+            if row["fingerprint"] in existing:
+                self.duplicates += 1
+                continue
+
+            existing.add(row["fingerprint"])
+            cnabs.append(CNAB(**{field: row[field] for field in CNAB_FIELDS}))
+
+        CNAB.objects.bulk_create(cnabs, batch_size=self.batch_size, ignore_conflicts=True)
+        Store.objects.apply_balances(balance_deltas(cnabs))
+        self.inserted += len(cnabs)
+
+    def __resolve_stores(self, rows):
+        """
+        Busca as lojas do usuário do lote com uma consulta e cria as que
+        não existem, inclusive se outra ingestão as criar ao mesmo tempo.
+        """
+
+        missing = {}
+        for row in rows:
+            if row["store"] not in self.stores and row["store"] not in missing:
+                missing[row["store"]] = row
+
+        if not missing:
+            return
+
+        self.stores.update(
+            Store.objects.filter(user=self.user, title__in=missing).values_list("title", "id")
+        )
+
+        new_stores = [
+            Store(user=self.user, title=title, cpf=row["cpf"], owner=row["owner"])
+            for title, row in missing.items() if title not in self.stores
+        ]
+
+        if new_stores:
+            self.stores_created += create_stores(self.user, new_stores, self.batch_size)
+            self.stores.update(
+                Store.objects.filter(user=self.user, title__in=[store.title for store in new_stores])
+                .values_list("title", "id")
+            )
+
+    def __lock_stores(self, rows):
+        """
+        Bloqueia as lojas do lote até o fim da transação, sempre na mesma
+        ordem para evitar deadlocks. Assim duas ingestões concorrentes da
+        mesma loja não consultam as impressões digitais ao mesmo tempo e o
+        livro de saldos conta cada transação uma única vez.
+        """
+
+        store_ids = {self.stores[row["store"]] for row in rows}
+        list(
+            Store.objects.select_for_update()
+            .filter(id__in=store_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def __existing_fingerprints(self, rows):
+        """
+        Carrega, pelo índice único, as impressões digitais do lote que já
+        estão armazenadas.
+        """
+
+        return set(
+            CNAB.objects.filter(fingerprint__in={row["fingerprint"] for row in rows})
+            .order_by()
+            .values_list("fingerprint", flat=True)
+        )
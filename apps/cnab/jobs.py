@@ -0,0 +1,148 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from shared.exception import GenericException
+from .enum import JobStatus
+from .metrics import record_ingestion
+from .models import UploadJob, CNABUpload
+from .parallel import ParallelIngestion, is_parallel
+from .reader import parse_file, validate_content_type, fingerprint
+from .staging import get_ingestion
+
+logger = logging.getLogger(__name__)
+
+# Campos do job atualizados a cada lote importado
+PROGRESS_FIELDS = ("lines", "inserted", "duplicates", "rejected")
+
+
+def enqueue(user, file, sha256):
+    """
+    Armazena o arquivo de CNAB e cria o job de importação na fila. Se o
+    usuário já enviou o mesmo arquivo e ele ainda não foi processado,
+    retorna o job existente sem armazenar o arquivo de novo. Retorna o
+    job e se ele foi criado.
+    """
+
+    validate_content_type(file)
+    job = UploadJob.objects.queued(user, sha256)
+    if job is not None:
+        return job, False
+
+    return UploadJob.objects.create(user=user, file=file, sha256=sha256, size=file.size), True
+
+
+class Lease:
+    """
+    Renova o lease do job (updated_at) em uma thread, a cada terço do
+    CNAB_JOB_LEASE, enquanto o job é processado. Cobre as etapas que não
+    salvam o progresso por lote, como a contagem das linhas e a ingestão
+    paralela, para que outro worker não reserve o job no meio delas.
+    """
+
+    def __init__(self, job):
+        """
+        Construtor.
+        """
+
+        self.job = job
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"cnab-job-{job.pk}-lease", daemon=True)
+
+    def run(self):
+        """
+        Renova o lease até o fim do processamento.
+        """
+
+        try:
+            while not self.stopped.wait(settings.CNAB_JOB_LEASE / 3):
+                UploadJob.objects.filter(pk=self.job.pk, status=JobStatus.RUNNING).update(updated_at=timezone.now())
+        finally:
+            connection.close()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+        return False
+
+
+def count_lines(job):
+    """
+    Primeira passada pelo arquivo: valida todos os registros, sem tocar
+    no banco de dados, e retorna a quantidade de linhas.
+    """
+
+    job.file.open("rb")
+    total = 0
+    for _ in parse_file(job.file):
+        total += 1
+
+    return total
+
+
+def process_job(job):
+    """
+    Processa um job reservado da fila, em paralelo quando o arquivo é
+    grande o suficiente. O arquivo é validado por completo antes da
+    importação e cada lote é confirmado na sua própria transação, para
+    que o progresso fique visível no endpoint de status. Um job que falhar
+    pode ser reenviado, pois as linhas já importadas são ignoradas como
+    duplicadas. Ao terminar, o arquivo entra no registro de uploads e é
+    removido do armazenamento; o arquivo de um job que falhou é mantido.
+    Durante o processamento o lease do job é renovado (Lease); se o worker
+    parar, o job é reservado de novo quando o lease vencer.
+    """
+
+    def progress(ingestion):
+        for field in PROGRESS_FIELDS:
+            setattr(job, field, getattr(ingestion, field))
+
+        job.save(update_fields=PROGRESS_FIELDS + ("updated_at",))
+
+    with Lease(job):
+        try:
+            if is_parallel(job.size):
+                stats = ParallelIngestion(job.user).run(job.file.path)
+                job.total_lines = stats["lines"]
+                for field in PROGRESS_FIELDS:
+                    setattr(job, field, stats[field])
+
+                job.save(update_fields=PROGRESS_FIELDS + ("total_lines", "updated_at"))
+            else:
+                job.total_lines = count_lines(job)
+                job.save(update_fields=("total_lines", "updated_at"))
+
+                job.file.open("rb")
+                stats = get_ingestion(job.user, on_batch=progress, atomic=False).run(parse_file(job.file))
+
+            if not job.sha256:
+                job.file.open("rb")
+                job.sha256 = fingerprint(job.file)
+
+            CNABUpload.objects.register(job.user, job.sha256, job.size, job.total_lines)
+            record_ingestion(stats, "job")
+        except GenericException as error:
+            job.status = JobStatus.FAILED
+            job.error = str(error.detail)
+        except Exception as error:
+            logger.exception("Falha ao processar o job de CNAB %s", job.pk)
+            job.status = JobStatus.FAILED
+            job.error = str(error)
+        else:
+            job.status = JobStatus.DONE
+        finally:
+            job.file.close()
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=("status", "error", "finished_at", "updated_at"))
+
+    if job.status == JobStatus.DONE:
+        job.file.delete(save=False)
+        job.save(update_fields=("file",))
+
+    return job
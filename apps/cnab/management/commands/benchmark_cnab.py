@@ -0,0 +1,196 @@
+import json
+import os
+import platform
+import resource
+import tempfile
+import time
+import tracemalloc
+import uuid
+import django
+from django.conf import settings
+from django.core.files import File
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.cnab import vectorized
+from apps.cnab.generator import parse_type_mix, write_cnab
+from apps.cnab.reader import parse_file
+from apps.cnab.staging import get_ingestion
+from apps.cnab.uploads import represent_stores
+from shared.renderers import FastJSONRenderer
+from shared.timing import measure
+
+
+def rate(count, seconds):
+    """
+    Quantidade por segundo, arredondada.
+    """
+
+    return round(count / seconds, 2) if seconds else 0.0
+
+
+def megabytes(size):
+    """
+    Converte bytes em megabytes, arredondado.
+    """
+
+    return round(size / 1024 / 1024, 2)
+
+
+class Command(BaseCommand):
+    """
+    Benchmark da importação de CNAB com arquivos sintéticos.
+    """
+
+    help = (
+        "Mede o parser, a ingestão, a resposta do upload, o pico de memória e as consultas SQL "
+        "com arquivos sintéticos de CNAB de cada tamanho e grava os resultados em JSON."
+    )
+
+    def add_arguments(self, parser):
+        """
+        Argumentos do comando.
+        """
+
+        parser.add_argument("--sizes", default="1000,100000,1000000", help="Quantidades de linhas, separadas por vírgula.")
+        parser.add_argument("--stores", type=int, default=10, help="Quantidade de lojas de cada arquivo.")
+        parser.add_argument("--types", help="Proporção dos tipos de transação. Ex: 1=3,4=1. Padrão: todos iguais.")
+        parser.add_argument("--duplicates", type=float, default=0.0, help="Proporção de linhas duplicadas, de 0 a 1.")
+        parser.add_argument("--seed", type=int, default=42, help="Semente do gerador dos arquivos.")
+        parser.add_argument("--output", default="-", help="Arquivo JSON com os resultados. Padrão: saída padrão.")
+        parser.add_argument(
+            "--tracemalloc", action="store_true",
+            help="Mede também o pico de memória alocada pelo Python (deixa a ingestão mais lenta)."
+        )
+        parser.add_argument(
+            "--current-database", action="store_true",
+            help="Usa o banco configurado em vez de um banco de teste descartável."
+        )
+
+    def handle(self, *args, **options):
+        """
+        Executa o benchmark de cada tamanho em um banco de teste
+        descartável, do mesmo motor do banco configurado (ex: DATABASE=sqlite).
+        """
+
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",")]
+            types = parse_type_mix(options["types"]) if options["types"] else None
+        except ValueError as error:
+            raise CommandError(f"Parâmetros inválidos: {error}")
+
+        old_name = None
+        if not options["current_database"]:
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                results = []
+                for lines in sizes:
+                    results.append(self.run(directory, lines, types, options))
+                    if old_name is not None:
+                        call_command("flush", interactive=False, verbosity=0)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "parser": "numpy" if settings.CNAB_PARSER == "numpy" and vectorized.is_available() else "python",
+            "ingestion_backend": settings.CNAB_INGESTION_BACKEND,
+            "batch_size": settings.CNAB_BATCH_SIZE,
+            "seed": options["seed"],
+            "results": results
+        }
+
+        if options["output"] == "-":
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, indent=2)
+
+    def run(self, directory, lines, types, options):
+        """
+        Gera o arquivo com a quantidade de linhas e mede cada etapa do upload.
+        """
+
+        token = uuid.uuid4().hex[:6]
+        path = os.path.join(directory, f"cnab-{lines}.txt")
+        with open(path, "wb") as output:
+            size = write_cnab(
+                output, lines, stores=options["stores"], types=types,
+                duplicate_rate=options["duplicates"], seed=options["seed"], prefix=f"B{token}"
+            )
+
+        user = User.objects.create_user(email=f"benchmark-{token}@example.com", name="Benchmark", password=None)
+
+        # Parser: leitura e conversão, sem o banco
+        with open(path, "rb") as file:
+            start = time.perf_counter()
+            parsed = sum(1 for _ in parse_file(File(file)))
+            parse_seconds = time.perf_counter() - start
+
+        if options["tracemalloc"]:
+            tracemalloc.start()
+
+        # Ingestão: parser e escrita no banco, com as consultas SQL
+        with open(path, "rb") as file, measure() as timer:
+            ingestion = get_ingestion(user)
+            stats = ingestion.run(parse_file(File(file)))
+
+        # Resposta do upload: lojas do arquivo serializadas e renderizadas em JSON
+        with measure() as response_timer:
+            start = time.perf_counter()
+            data = represent_stores(user, ingestion.store_ids)
+            serialize_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            content = FastJSONRenderer().render({"success": True, "results": data})
+            render_seconds = time.perf_counter() - start
+
+        traced = None
+        if options["tracemalloc"]:
+            traced = megabytes(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        result = {
+            "lines": lines,
+            "file_bytes": size,
+            "stores": options["stores"],
+            "duplicate_rate": options["duplicates"],
+            "parse": {"seconds": round(parse_seconds, 3), "lines_per_second": rate(parsed, parse_seconds)},
+            "ingestion": dict(
+                stats,
+                queries=timer.queries,
+                sql_seconds=round(timer.sql, 3),
+                phases={
+                    name: {"seconds": round(seconds, 3), "queries": queries, "sql_seconds": round(sql, 3)}
+                    for name, (seconds, queries, sql) in timer.phases.items()
+                }
+            ),
+            "response": {
+                "serialize_seconds": round(serialize_seconds, 3),
+                "render_seconds": round(render_seconds, 3),
+                "bytes": len(content),
+                "queries": response_timer.queries
+            },
+            "memory": {
+                # ru_maxrss é o pico do processo desde o início, em KB no Linux
+                "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+                "peak_traced_mb": traced
+            }
+        }
+
+        self.stderr.write(
+            f"{lines} linhas: parser {result['parse']['lines_per_second']} linhas/s, "
+            f"ingestão {stats['rows_per_second']} linhas/s, {timer.queries} consultas, "
+            f"resposta {result['response']['serialize_seconds'] + result['response']['render_seconds']:.3f}s"
+        )
+
+        return result
@@ -0,0 +1,78 @@
+import timeit
+from django.core.management.base import BaseCommand
+from apps.cnab.enum import TransactionType, TransactionSignal
+from apps.cnab.parser import parse_record
+
+
+def legacy_extract(line):
+    """
+    Extração por linha usada antes do módulo parser, mantida apenas
+    como referência para o benchmark.
+    """
+
+    transaction_map = {
+        "1": {"type": TransactionType.DEBIT.value, "signal": TransactionSignal.DEBIT.value},
+        "2": {"type": TransactionType.BILL.value, "signal": TransactionSignal.BILL.value},
+        "3": {"type": TransactionType.FINANCING.value, "signal": TransactionSignal.FINANCING.value},
+        "4": {"type": TransactionType.CREDIT.value, "signal": TransactionSignal.CREDIT.value},
+        "5": {"type": TransactionType.RECEIVEMENT.value, "signal": TransactionSignal.RECEIVEMENT.value},
+        "6": {"type": TransactionType.SALES.value, "signal": TransactionSignal.SALES.value},
+        "7": {"type": TransactionType.TED.value, "signal": TransactionSignal.TED.value},
+        "8": {"type": TransactionType.DOC.value, "signal": TransactionSignal.DOC.value},
+        "9": {"type": TransactionType.RENT.value, "signal": TransactionSignal.RENT.value},
+    }
+
+    return {
+        "transaction_type": transaction_map[line[0:1]]["type"],
+        "transaction_signal": transaction_map[line[0:1]]["signal"],
+        "date": f"{line[1:5]}-{line[5:7]}-{line[7:9]}",
+        "value": round(float(line[9:19]) / 100, 2),
+        "cpf": f"{line[19:22]}.{line[22:25]}.{line[25:28]}-{line[28:30]}",
+        "card": line[30:42],
+        "time": f"{line[42:44]}:{line[44:46]}:{line[46:48]}",
+        "owner": line[48:62].strip(),
+        "store": line[62:].strip().replace("\n", "")
+    }
+
+
+class Command(BaseCommand):
+    """
+    Micro benchmark do custo por linha do parser do CNAB.
+    """
+
+    help = "Compara o custo por linha do parser do CNAB com a extração por linha anterior."
+
+    def add_arguments(self, parser):
+        """
+        Argumentos do comando.
+        """
+
+        parser.add_argument("--file", default="./apps/cnab/mocks/CNAB.txt", help="Arquivo de CNAB usado como amostra.")
+        parser.add_argument("--repeat", type=int, default=5, help="Quantidade de repetições.")
+        parser.add_argument("--number", type=int, default=2000, help="Passagens pelo arquivo em cada repetição.")
+
+    def handle(self, *args, **options):
+        """
+        Executa o benchmark.
+        """
+
+        with open(options["file"], "rb") as file:
+            lines = file.readlines()
+
+        total = len(lines) * options["number"]
+
+        def legacy():
+            for line in lines:
+                legacy_extract(line.decode())
+
+        def current():
+            for line in lines:
+                parse_record(line)
+
+        results = {}
+        for name, function in (("legacy", legacy), ("parser", current)):
+            best = min(timeit.repeat(function, repeat=options["repeat"], number=options["number"]))
+            results[name] = best / total * 1e6
+            self.stdout.write(f"{name:>8}: {results[name]:.3f} µs/linha")
+
+        self.stdout.write(f"{'speedup':>8}: {results['legacy'] / results['parser']:.2f}x")
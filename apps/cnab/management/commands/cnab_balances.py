@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from apps.cnab.cache import bump_versions
+from apps.cnab.models import Store
+
+
+class Command(BaseCommand):
+    """
+    Verifica ou reconstrói o livro de saldos das lojas.
+    """
+
+    help = "Compara o livro de saldos das lojas com as transações e, com --rebuild, o recalcula."
+
+    def add_arguments(self, parser):
+        """
+        Argumentos do comando.
+        """
+
+        parser.add_argument("--rebuild", action="store_true", help="Recalcula o livro de saldos de todas as lojas.")
+
+    def handle(self, *args, **options):
+        """
+        Executa a verificação ou a reconstrução.
+        """
+
+        if options["rebuild"]:
+            updated = Store.objects.rebuild_balances()
+            bump_versions(Store.objects.all())
+            self.stdout.write(f"Livro de saldos reconstruído para {updated} lojas.")
+            return
+
+        mismatches = Store.objects.with_balance_mismatches()
+        for store in mismatches:
+            self.stdout.write(
+                f"{store.title}: livro ({store.transactions_count}, {store.credit_total}, {store.debit_total}) "
+                f"!= transações ({store.computed_count}, {store.computed_credit}, {store.computed_debit})"
+            )
+
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} lojas com o livro de saldos divergente. Use --rebuild para corrigir.")
+
+        self.stdout.write("Livro de saldos consistente.")
@@ -0,0 +1,51 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from apps.accounts.models import User
+from apps.cnab.export import export_csv
+from apps.cnab.models import CNAB
+
+
+class Command(BaseCommand):
+    """
+    Exporta as transações do CNAB em CSV.
+    """
+
+    help = "Exporta as transações, com os dados das lojas, em CSV (opcionalmente compactado com gzip)."
+
+    def add_arguments(self, parser):
+        """
+        Argumentos do comando.
+        """
+
+        parser.add_argument("--output", default="-", help="Arquivo de saída. Padrão: saída padrão.")
+        parser.add_argument("--gzip", action="store_true", help="Compacta o CSV com gzip.")
+        parser.add_argument("--user", help="E-mail do usuário: exporta apenas as transações das suas lojas.")
+
+    def handle(self, *args, **options):
+        """
+        Grava o CSV aos poucos, sem carregar as transações em memória.
+        """
+
+        queryset = CNAB.objects.all()
+        if options["user"]:
+            user = User.objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"Usuário {options['user']} não encontrado.")
+
+            queryset = queryset.filter(store__user=user)
+
+        if options["output"] == "-":
+            self.write(sys.stdout.buffer, queryset, options["gzip"])
+        else:
+            with open(options["output"], "wb") as output:
+                self.write(output, queryset, options["gzip"])
+
+    def write(self, output, queryset, compress):
+        """
+        Escreve os pedaços do CSV na saída.
+        """
+
+        for chunk in export_csv(queryset, compress=compress):
+            output.write(chunk)
+
+        output.flush()
@@ -0,0 +1,46 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from apps.cnab.generator import parse_type_mix, write_cnab
+
+
+class Command(BaseCommand):
+    """
+    Gera arquivos sintéticos de CNAB.
+    """
+
+    help = "Gera um arquivo de CNAB válido com a quantidade de linhas, lojas, tipos e duplicatas informados."
+
+    def add_arguments(self, parser):
+        """
+        Argumentos do comando.
+        """
+
+        parser.add_argument("--lines", type=int, default=1000, help="Quantidade de linhas.")
+        parser.add_argument("--stores", type=int, default=10, help="Quantidade de lojas.")
+        parser.add_argument("--types", help="Proporção dos tipos de transação. Ex: 1=3,4=1. Padrão: todos iguais.")
+        parser.add_argument("--duplicates", type=float, default=0.0, help="Proporção de linhas duplicadas, de 0 a 1.")
+        parser.add_argument("--seed", type=int, help="Semente do gerador, para repetir o mesmo arquivo.")
+        parser.add_argument("--output", default="-", help="Arquivo de saída. Padrão: saída padrão.")
+
+    def handle(self, *args, **options):
+        """
+        Grava o arquivo aos poucos, sem montá-lo em memória.
+        """
+
+        try:
+            generator = {
+                "lines": options["lines"],
+                "stores": options["stores"],
+                "types": parse_type_mix(options["types"]) if options["types"] else None,
+                "duplicate_rate": options["duplicates"],
+                "seed": options["seed"]
+            }
+
+            if options["output"] == "-":
+                write_cnab(sys.stdout.buffer, **generator)
+                sys.stdout.buffer.flush()
+            else:
+                with open(options["output"], "wb") as output:
+                    write_cnab(output, **generator)
+        except ValueError as error:
+            raise CommandError(str(error))
@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from apps.cnab.jobs import process_job
+from apps.cnab.models import UploadJob
+
+
+class Command(BaseCommand):
+    """
+    Worker que consome a fila de jobs de importação de CNAB.
+    """
+
+    help = "Processa os jobs de importação de CNAB pendentes no banco de dados."
+
+    def add_arguments(self, parser):
+        """
+        Argumentos do comando.
+        """
+
+        parser.add_argument("--once", action="store_true", help="Processa os jobs pendentes e encerra.")
+        parser.add_argument("--interval", type=float, default=2.0, help="Segundos de espera quando a fila está vazia.")
+
+    def handle(self, *args, **options):
+        """
+        Reserva e processa os jobs da fila.
+        """
+
+        while True:
+            close_old_connections()
+            job = UploadJob.objects.claim_next()
+
+            if job is None:
+                if options["once"]:
+                    return
+
+                time.sleep(options["interval"])
+                continue
+
+            process_job(job)
+            self.stdout.write(f"Job {job.pk}: {job.status} ({job.lines} linhas, {job.inserted} inseridas)")
@@ -0,0 +1,63 @@
+from shared.metrics import registry
+
+# Faixas, em bytes, do tamanho dos arquivos enviados: de 1 KB a 1 GB
+SIZE_BUCKETS = tuple(1024 * 10 ** exponent for exponent in range(7))
+
+UPLOADS = registry.counter(
+    "cnab_uploads_total",
+    "Uploads de CNAB, por resultado (ingested, duplicate ou queued).",
+    labels=("result",)
+)
+
+UPLOAD_BYTES = registry.histogram(
+    "cnab_upload_bytes",
+    "Tamanho em bytes dos arquivos de CNAB enviados.",
+    buckets=SIZE_BUCKETS
+)
+
+LINES = registry.counter("cnab_lines_total", "Linhas de CNAB lidas pelas ingestões.")
+
+INSERTED = registry.counter("cnab_transactions_inserted_total", "Transações inseridas pelas ingestões.")
+
+DUPLICATES = registry.counter(
+    "cnab_transactions_duplicated_total",
+    "Transações ignoradas por já estarem armazenadas."
+)
+
+REJECTED = registry.counter("cnab_lines_rejected_total", "Linhas ignoradas por campos em branco.")
+
+PARSE_ERRORS = registry.counter("cnab_parse_errors_total", "Registros inválidos que recusaram um arquivo.")
+
+INGESTION_SECONDS = registry.histogram(
+    "cnab_ingestion_seconds",
+    "Duração das ingestões, por origem (upload ou job).",
+    labels=("source",)
+)
+
+INGESTION_RATE = registry.gauge(
+    "cnab_ingestion_rows_per_second",
+    "Linhas por segundo da última ingestão, por origem (upload ou job).",
+    labels=("source",)
+)
+
+STORES_CREATED = registry.counter("cnab_stores_created_total", "Lojas criadas pelas importações.")
+
+STORE_FRAGMENTS = registry.counter(
+    "cnab_store_fragments_total",
+    "Lojas serializadas em listas, por resultado do cache de fragmentos (hit ou miss).",
+    labels=("result",)
+)
+
+
+def record_ingestion(stats, source):
+    """
+    Registra as estatísticas de uma ingestão concluída.
+    """
+
+    LINES.inc(stats["lines"])
+    INSERTED.inc(stats["inserted"])
+    DUPLICATES.inc(stats["duplicates"])
+    REJECTED.inc(stats["rejected"])
+    STORES_CREATED.inc(stats["stores_created"])
+    INGESTION_SECONDS.observe(stats["seconds"], source=source)
+    INGESTION_RATE.set(stats["rows_per_second"], source=source)
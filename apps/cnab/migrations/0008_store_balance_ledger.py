@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 16:14
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def rebuild_balances(apps, schema_editor):
+    """
+    Preenche o livro de saldos das lojas existentes a partir das transações.
+    """
+
+    Store = apps.get_model('cnab', 'Store')
+    CNAB = apps.get_model('cnab', 'CNAB')
+    cnabs = CNAB.objects.filter(store=models.OuterRef('pk')).order_by().values('store')
+    amount = models.DecimalField(decimal_places=3, max_digits=20)
+
+    def aggregate(queryset, function, output_field):
+        return Coalesce(
+            models.Subquery(queryset.annotate(result=function).values('result')[:1], output_field=output_field),
+            models.Value(0),
+            output_field=output_field
+        )
+
+    Store.objects.update(
+        transactions_count=aggregate(cnabs, models.Count('id'), models.IntegerField()),
+        credit_total=aggregate(cnabs.filter(transaction_signal='+'), models.Sum('value'), amount),
+        debit_total=aggregate(cnabs.filter(transaction_signal='-'), models.Sum('value'), amount)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0007_upload_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='store',
+            name='credit_total',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='debit_total',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=20),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='transactions_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(rebuild_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 16:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cnab', '0008_store_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CNABUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('lines', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cnab_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'cnab_upload',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0009_cnab_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cnab',
+            name='fingerprint',
+            field=models.CharField(max_length=40, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-18 16:21
+
+import hashlib
+from django.db import migrations
+
+
+def populate_fingerprints(apps, schema_editor):
+    """
+    Calcula a impressão digital das transações existentes, em lotes.
+    Cópia do cnab_fingerprint do momento desta migração.
+    """
+
+    CNAB = apps.get_model('cnab', 'CNAB')
+    queryset = CNAB.objects.filter(fingerprint__isnull=True).select_related('store').order_by('id')
+
+    while True:
+        batch = list(queryset[:1000])
+        if not batch:
+            return
+
+        for cnab in batch:
+            key = "|".join((
+                cnab.store.title, cnab.transaction_type, cnab.transaction_signal,
+                cnab.date.isoformat(), cnab.time.isoformat(), f"{cnab.value:.2f}", cnab.card
+            ))
+            cnab.fingerprint = hashlib.sha1(key.encode()).hexdigest()
+
+        CNAB.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0010_cnab_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_fingerprints, migrations.RunPython.noop),
+    ]
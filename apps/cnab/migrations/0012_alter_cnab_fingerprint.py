@@ -0,0 +1,65 @@
+# Generated by Django 3.2 on 2026-10-18 16:22
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Remove as transações repetidas inseridas antes da deduplicação,
+    mantendo a de menor id de cada impressão digital, e recalcula o
+    livro de saldos das lojas afetadas.
+    """
+
+    Store = apps.get_model('cnab', 'Store')
+    CNAB = apps.get_model('cnab', 'CNAB')
+    groups = list(
+        CNAB.objects.order_by().values('fingerprint')
+        .annotate(first=models.Min('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+        .values_list('fingerprint', 'first')
+    )
+
+    store_ids = set()
+    for start in range(0, len(groups), 1000):
+        batch = groups[start:start + 1000]
+        duplicates = CNAB.objects.filter(fingerprint__in=[group[0] for group in batch]).exclude(
+            id__in=[group[1] for group in batch]
+        )
+        store_ids.update(duplicates.values_list('store_id', flat=True).distinct())
+        duplicates.delete()
+
+    if not store_ids:
+        return
+
+    cnabs = CNAB.objects.filter(store=models.OuterRef('pk')).order_by().values('store')
+    amount = models.DecimalField(decimal_places=3, max_digits=20)
+
+    def aggregate(queryset, function, output_field):
+        return Coalesce(
+            models.Subquery(queryset.annotate(result=function).values('result')[:1], output_field=output_field),
+            models.Value(0),
+            output_field=output_field
+        )
+
+    Store.objects.filter(id__in=store_ids).update(
+        transactions_count=aggregate(cnabs, models.Count('id'), models.IntegerField()),
+        credit_total=aggregate(cnabs.filter(transaction_signal='+'), models.Sum('value'), amount),
+        debit_total=aggregate(cnabs.filter(transaction_signal='-'), models.Sum('value'), amount)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0011_populate_cnab_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='cnab',
+            name='fingerprint',
+            field=models.CharField(max_length=40, unique=True),
+        ),
+    ]
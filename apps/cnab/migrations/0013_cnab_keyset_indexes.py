@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0012_alter_cnab_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='cnab',
+            options={'ordering': ('-date', '-time', '-id')},
+        ),
+        migrations.AddIndex(
+            model_name='cnab',
+            index=models.Index(fields=['date', 'time', 'id'], name='cnab_date_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cnab',
+            index=models.Index(fields=['store', 'date', 'time', 'id'], name='cnab_store_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cnab',
+            index=models.Index(fields=['card', 'date', 'time', 'id'], name='cnab_card_date_time_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0013_cnab_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='store',
+            index=models.Index(fields=['user', 'created_at'], name='store_user_created_at_idx'),
+        ),
+    ]
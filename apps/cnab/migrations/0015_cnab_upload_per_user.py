@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 16:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0014_store_user_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='cnabupload',
+            name='sha256',
+            field=models.CharField(max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='uploadjob',
+            index=models.Index(fields=['user', 'sha256'], name='upload_job_user_sha256_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cnabupload',
+            constraint=models.UniqueConstraint(fields=('user', 'sha256'), name='cnab_upload_user_sha256_uniq'),
+        ),
+    ]
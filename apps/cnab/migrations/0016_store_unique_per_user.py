@@ -0,0 +1,85 @@
+# Generated by Django 3.2 on 2026-10-18 16:54
+
+import hashlib
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+
+
+def rebuild_fingerprints(apps, owner):
+    """
+    Recalcula a impressão digital das transações existentes, em lotes,
+    com ou sem o dono da loja na chave. Cópia do cnab_fingerprint do
+    momento desta migração.
+    """
+
+    CNAB = apps.get_model('cnab', 'CNAB')
+    queryset = CNAB.objects.select_related('store').order_by('id')
+
+    last = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last)[:1000])
+        if not batch:
+            return
+
+        for cnab in batch:
+            prefix = (str(cnab.store.user_id),) if owner else ()
+            key = "|".join(prefix + (
+                cnab.store.title, cnab.transaction_type, cnab.transaction_signal,
+                cnab.date.isoformat(), cnab.time.isoformat(), f"{cnab.value:.2f}", cnab.card
+            ))
+            cnab.fingerprint = hashlib.sha1(key.encode()).hexdigest()
+
+        CNAB.objects.bulk_update(batch, ['fingerprint'])
+        last = batch[-1].id
+
+
+def add_owner_to_fingerprints(apps, schema_editor):
+    """
+    A impressão digital passa a incluir o dono da loja, pois o título só
+    é único por usuário.
+    """
+
+    rebuild_fingerprints(apps, owner=True)
+
+
+def remove_owner_from_fingerprints(apps, schema_editor):
+    """
+    Volta a impressão digital para a chave sem o dono da loja. Só é
+    possível enquanto nenhum título de loja se repete entre usuários: do
+    contrário o título único e as impressões digitais sem o dono colidem.
+    """
+
+    Store = apps.get_model('cnab', 'Store')
+    shared = list(
+        Store.objects.order_by('title').values('title')
+        .annotate(count=models.Count('id'))
+        .filter(count__gt=1)
+        .values_list('title', flat=True)[:10]
+    )
+    if shared:
+        raise IrreversibleError(
+            "A migração cnab.0016_store_unique_per_user não pode ser desfeita: os títulos de loja "
+            f"{', '.join(shared)} pertencem a mais de um usuário. Renomeie ou remova essas lojas antes."
+        )
+
+    rebuild_fingerprints(apps, owner=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnab', '0015_cnab_upload_per_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='store',
+            name='title',
+            field=models.CharField(max_length=19),
+        ),
+        migrations.AddConstraint(
+            model_name='store',
+            constraint=models.UniqueConstraint(fields=('user', 'title'), name='store_user_title_uniq'),
+        ),
+        migrations.RunPython(add_owner_to_fingerprints, remove_owner_from_fingerprints),
+    ]
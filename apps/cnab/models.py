@@ -1,7 +1,141 @@
-from django.db import models
-from .enum import TransactionType
+import hashlib
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction, connections
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .enum import TransactionType, JobStatus
 from apps.accounts.models import User
 
+logger = logging.getLogger(__name__)
+
+# Precisão dos totais do livro de saldos
+AMOUNT = {"max_digits": 20, "decimal_places": 3}
+
+
+def cnab_fingerprint(user_id, title, transaction_type, transaction_signal, date, time, value, card):
+    """
+    Impressão digital de uma transação: SHA-1 da chave natural do CNAB
+    (dono e título da loja, tipo, sinal, data, hora, valor e cartão). Usa
+    o usuário e o título da loja, e não o id, para que possa ser calculada
+    antes das lojas existirem.
+    """
+
+    key = "|".join((
+        str(user_id), title, transaction_type, transaction_signal,
+        date.isoformat(), time.isoformat(), f"{value:.2f}", card
+    ))
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class StoreQuerySet(models.QuerySet):
+    """
+    Consultas das lojas.
+    """
+
+    def of_user(self, user):
+        """
+        Lojas do usuário, usando o índice (user, created_at).
+        """
+
+        return self.filter(user=user)
+
+    def with_totals(self):
+        """
+        Anota o saldo de cada loja a partir do livro de saldos (créditos
+        menos débitos), sem percorrer as transações.
+        """
+
+        return self.annotate(total=models.ExpressionWrapper(
+            models.F("credit_total") - models.F("debit_total"),
+            output_field=models.DecimalField(**AMOUNT)
+        ))
+
+    def with_computed_totals(self):
+        """
+        Anota a quantidade de transações, os créditos, os débitos e o saldo
+        de cada loja calculados a partir das transações no banco de dados.
+        """
+
+        # O Django não aplica o Meta.ordering em consultas agregadas
+        queryset = self if self.query.order_by else self.order_by(*self.model._meta.ordering)
+
+        def amount(signal):
+            return Coalesce(
+                models.Sum("cnabs__value", filter=models.Q(cnabs__transaction_signal=signal)),
+                models.Value(0),
+                output_field=models.DecimalField(**AMOUNT)
+            )
+
+        return queryset.annotate(
+            computed_count=models.Count("cnabs"),
+            computed_credit=amount("+"),
+            computed_debit=amount("-")
+        ).annotate(total=models.ExpressionWrapper(
+            models.F("computed_credit") - models.F("computed_debit"),
+            output_field=models.DecimalField(**AMOUNT)
+        ))
+
+    def with_balance_mismatches(self):
+        """
+        Lojas cujo livro de saldos difere do calculado pelas transações.
+        """
+
+        return self.with_computed_totals().exclude(
+            transactions_count=models.F("computed_count"),
+            credit_total=models.F("computed_credit"),
+            debit_total=models.F("computed_debit")
+        )
+
+    def apply_balances(self, deltas):
+        """
+        Soma ao livro de saldos a quantidade de transações, os créditos e os
+        débitos de cada loja ({id: (quantidade, créditos, débitos)}) com um
+        único UPDATE.
+        """
+
+        if not deltas:
+            return 0
+
+        def increment(field, index, output_field):
+            return models.F(field) + models.Case(
+                *[models.When(pk=pk, then=models.Value(delta[index])) for pk, delta in deltas.items()],
+                default=models.Value(0),
+                output_field=output_field
+            )
+
+        return self.filter(pk__in=deltas).update(
+            transactions_count=increment("transactions_count", 0, models.IntegerField()),
+            credit_total=increment("credit_total", 1, models.DecimalField(**AMOUNT)),
+            debit_total=increment("debit_total", 2, models.DecimalField(**AMOUNT)),
+            updated_at=timezone.now()
+        )
+
+    def rebuild_balances(self):
+        """
+        Recalcula o livro de saldos das lojas a partir das transações.
+        """
+
+        cnabs = CNAB.objects.filter(store=models.OuterRef("pk")).order_by().values("store")
+
+        def aggregate(queryset, function, output_field):
+            return Coalesce(
+                models.Subquery(queryset.annotate(result=function).values("result")[:1], output_field=output_field),
+                models.Value(0),
+                output_field=output_field
+            )
+
+        amount = models.DecimalField(**AMOUNT)
+
+        return self.update(
+            transactions_count=aggregate(cnabs, models.Count("id"), models.IntegerField()),
+            credit_total=aggregate(cnabs.filter(transaction_signal="+"), models.Sum("value"), amount),
+            debit_total=aggregate(cnabs.filter(transaction_signal="-"), models.Sum("value"), amount),
+            updated_at=timezone.now()
+        )
+
 
 class Store(models.Model):
     """
@@ -14,16 +148,27 @@ class Store(models.Model):
         on_delete=models.CASCADE
     )
 
-    title = models.CharField(max_length=19, unique=True)
+    title = models.CharField(max_length=19)
 
     cpf = models.CharField(max_length=14)
 
     owner = models.CharField(max_length=14)
 
+    # Livro de saldos da loja, mantido pela ingestão junto com cada lote
+    # de transações inseridas: créditos são as entradas (+) e débitos as
+    # saídas (-).
+    transactions_count = models.PositiveIntegerField(default=0)
+
+    credit_total = models.DecimalField(**AMOUNT, default=0)
+
+    debit_total = models.DecimalField(**AMOUNT, default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = StoreQuerySet.as_manager()
+
     def __str__(self):
         """
         Representação da modelo como string.
@@ -31,6 +176,14 @@ class Store(models.Model):
 
         return self.store
 
+    @property
+    def balance(self):
+        """
+        Saldo da loja lido do livro de saldos.
+        """
+
+        return self.credit_total - self.debit_total
+
     class Meta:
         """
         Informações adicionais do modelo.
@@ -38,6 +191,12 @@ class Store(models.Model):
 
         db_table = "store"
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='store_user_created_at_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'title'), name='store_user_title_uniq'),
+        ]
 
 
 class CNAB(models.Model):
@@ -64,6 +223,8 @@ class CNAB(models.Model):
 
     time = models.TimeField()
 
+    fingerprint = models.CharField(max_length=40, unique=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     updated_at = models.DateTimeField(auto_now=True)
@@ -81,4 +242,201 @@ class CNAB(models.Model):
         """
 
         db_table = "cnab"
-        ordering = ('-date', '-time')
+        ordering = ('-date', '-time', '-id')
+        indexes = [
+            models.Index(fields=['date', 'time', 'id'], name='cnab_date_time_id_idx'),
+            models.Index(fields=['store', 'date', 'time', 'id'], name='cnab_store_date_time_idx'),
+            models.Index(fields=['card', 'date', 'time', 'id'], name='cnab_card_date_time_idx'),
+        ]
+
+
+class UploadJobManager(models.Manager):
+    """
+    Fila de jobs de importação armazenada no banco de dados.
+    """
+
+    def claim_next(self):
+        """
+        Reserva o próximo job da fila: um pendente ou um em processamento
+        cujo lease (updated_at, renovado pelo worker) venceu há mais de
+        CNAB_JOB_LEASE segundos, abandonado por um worker que parou sem
+        terminá-lo. No PostgreSQL usa SELECT ... FOR UPDATE SKIP LOCKED
+        para que vários workers não disputem a mesma linha; nos demais
+        bancos a atualização condicional do status e do updated_at garante
+        que apenas um worker reserve o job.
+        """
+
+        expired = timezone.now() - timedelta(seconds=settings.CNAB_JOB_LEASE)
+        available = models.Q(status=JobStatus.PENDING) | models.Q(status=JobStatus.RUNNING, updated_at__lt=expired)
+        with transaction.atomic(using=self.db):
+            queryset = self.filter(available).order_by('created_at', 'id')
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+
+            job = queryset.first()
+            if job is None:
+                return None
+
+            now = timezone.now()
+            claimed = self.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+                status=JobStatus.RUNNING,
+                started_at=now,
+                updated_at=now
+            )
+
+        if not claimed:
+            return None
+
+        if job.status == JobStatus.RUNNING:
+            logger.warning("Job de CNAB %s retomado após o lease vencer", job.pk)
+
+        job.refresh_from_db()
+
+        return job
+
+    def queued(self, user, sha256):
+        """
+        Job do usuário, pendente ou em processamento, do arquivo com o SHA-256 informado.
+        """
+
+        return self.filter(
+            user=user,
+            sha256=sha256,
+            status__in=(JobStatus.PENDING, JobStatus.RUNNING)
+        ).order_by('created_at', 'id').first()
+
+
+class UploadJob(models.Model):
+    """
+    Job de importação assíncrona de um arquivo de CNAB.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name="upload_jobs",
+        on_delete=models.CASCADE
+    )
+
+    file = models.FileField(upload_to="cnab/jobs/")
+
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+
+    size = models.PositiveBigIntegerField(default=0)
+
+    status = models.CharField(max_length=20, choices=JobStatus.choices, default=JobStatus.PENDING)
+
+    total_lines = models.PositiveIntegerField(default=0)
+
+    lines = models.PositiveIntegerField(default=0)
+
+    inserted = models.PositiveIntegerField(default=0)
+
+    duplicates = models.PositiveIntegerField(default=0)
+
+    rejected = models.PositiveIntegerField(default=0)
+
+    error = models.TextField(blank=True, default="")
+
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = UploadJobManager()
+
+    def __str__(self):
+        """
+        Representação da modelo como string.
+        """
+
+        return f"{self.file.name} - {self.status}"
+
+    @property
+    def progress(self):
+        """
+        Percentual das linhas do arquivo já importadas.
+        """
+
+        if self.status == JobStatus.DONE:
+            return 100
+
+        if not self.total_lines:
+            return 0
+
+        return min(99, self.lines * 100 // self.total_lines)
+
+    class Meta:
+        """
+        Informações adicionais do modelo.
+        """
+
+        db_table = "upload_job"
+        ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['user', 'sha256'], name='upload_job_user_sha256_idx'),
+        ]
+
+
+class CNABUploadManager(models.Manager):
+    """
+    Registro dos arquivos de CNAB já importados.
+    """
+
+    def register(self, user, sha256, size, lines):
+        """
+        Registra um arquivo importado com sucesso pelo usuário. Se outro
+        envio do mesmo arquivo pelo usuário terminou antes, mantém o
+        registro existente.
+        """
+
+        upload, _ = self.get_or_create(
+            user=user,
+            sha256=sha256,
+            defaults={"size": size, "lines": lines}
+        )
+
+        return upload
+
+
+class CNABUpload(models.Model):
+    """
+    Arquivo de CNAB importado por um usuário, identificado pelo SHA-256
+    do seu conteúdo.
+    """
+
+    user = models.ForeignKey(
+        User,
+        related_name="cnab_uploads",
+        on_delete=models.CASCADE
+    )
+
+    sha256 = models.CharField(max_length=64)
+
+    size = models.PositiveBigIntegerField(default=0)
+
+    lines = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = CNABUploadManager()
+
+    def __str__(self):
+        """
+        Representação da modelo como string.
+        """
+
+        return f"{self.sha256} - {self.lines} linhas"
+
+    class Meta:
+        """
+        Informações adicionais do modelo.
+        """
+
+        db_table = "cnab_upload"
+        ordering = ('-created_at',)
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'sha256'), name='cnab_upload_user_sha256_uniq'),
+        ]
@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connection, connections
+from apps.accounts.models import User
+from .cache import bump_versions
+from .ingestion import CNABIngestion, create_stores
+from .models import Store
+from .parser import parse_record, InvalidRecord
+from .reader import invalid_record
+
+logger = logging.getLogger(__name__)
+
+# Estatísticas somadas entre os shards
+STATS_FIELDS = ("lines", "inserted", "duplicates", "rejected")
+
+
+def is_parallel(size):
+    """
+    Verifica se um arquivo do tamanho informado deve ser ingerido em paralelo.
+    """
+
+    return settings.CNAB_WORKERS > 1 and size >= settings.CNAB_PARALLEL_MIN_SIZE
+
+
+def split_file(path, shards):
+    """
+    Divide o arquivo em até shards intervalos de bytes [início, fim) que
+    começam sempre no início de um registro. Cada ponto de corte é
+    estimado pelo tamanho do arquivo e avançado até a próxima quebra de
+    linha, sem precisar ler o arquivo inteiro.
+    """
+
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as file:
+        for shard in range(1, shards):
+            offset = size * shard // shards
+            if offset <= bounds[-1]:
+                continue
+
+            file.seek(offset - 1)
+            file.readline()
+            position = file.tell()
+            if bounds[-1] < position < size:
+                bounds.append(position)
+
+    bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_shard(path, start, end):
+    """
+    Lê as linhas de um intervalo de bytes do arquivo.
+    """
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        position = start
+        for line in file:
+            if position >= end:
+                return
+
+            position += len(line)
+            yield line
+
+
+def scan_shard(path, start, end):
+    """
+    Primeira fase, executada em cada worker: valida os registros do shard
+    e coleta as lojas na ordem em que aparecem, sem tocar no banco.
+    Retorna a quantidade de linhas, as lojas (título -> cpf, dono) e o
+    erro do primeiro registro inválido, com a linha relativa ao shard.
+    """
+
+    stores = {}
+    lines = 0
+    for lines, line in enumerate(iter_shard(path, start, end), start=1):
+        try:
+            record = parse_record(line)
+        except InvalidRecord as error:
+            error.line = lines
+            return {"lines": lines, "stores": stores, "error": error}
+
+        if record["store"] not in stores:
+            stores[record["store"]] = (record["cpf"], record["owner"])
+
+    return {"lines": lines, "stores": stores, "error": None}
+
+
+def ingest_shard(path, start, end, user_id, stores, batch_size):
+    """
+    Segunda fase, executada em cada worker com a sua própria conexão:
+    insere os CNABs do shard com as lojas já resolvidas. As lojas de cada
+    lote são bloqueadas para que dois shards não insiram a mesma transação.
+    """
+
+    ingestion = CNABIngestion(User(pk=user_id), batch_size=batch_size, atomic=False, stores=stores)
+    ingestion.run(parse_record(line) for line in iter_shard(path, start, end))
+
+    return ingestion.stats()
+
+
+class SerialExecutor:
+    """
+    Executor que roda as tarefas no próprio processo, usado com um único
+    worker ou em bancos que não aceitam escritas concorrentes (SQLite).
+    """
+
+    def map(self, function, *iterables):
+        """
+        Aplica a função a cada conjunto de argumentos.
+        """
+
+        return map(function, *iterables)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class ParallelIngestion:
+    """
+    Ingestão paralela de arquivos grandes de CNAB, usada pelo worker de
+    importação.
+
+    O arquivo é dividido em shards nos limites dos registros e cada shard
+    é validado e inserido por um processo do ProcessPoolExecutor. Entre as
+    duas fases o processo principal cria as lojas novas de uma só vez,
+    evitando que dois shards disputem o título da loja, único por usuário.
+    """
+
+    def __init__(self, user, workers=None, batch_size=None):
+        """
+        Construtor.
+        """
+
+        self.user = user
+        self.workers = workers or settings.CNAB_WORKERS
+        self.batch_size = batch_size or settings.CNAB_BATCH_SIZE
+        self.stores_created = 0
+        self.store_ids = set()
+
+    def executor(self):
+        """
+        Cria o pool de processos. Os processos precisam ser criados com
+        fork para herdar o Django já inicializado: com spawn (padrão no
+        macOS a partir do Python 3.8) o processo filho importaria este
+        módulo, e os models, antes do django.setup(). Por isso o contexto
+        fork é passado explicitamente; no Python 3.6 o ProcessPoolExecutor
+        não aceita mp_context, mas o contexto padrão já é fork em todo
+        sistema POSIX. As conexões abertas são fechadas antes do fork para
+        que cada processo abra a sua, e a ingestão paralela roda apenas no
+        worker de importação, fora de uma requisição ou transação.
+        """
+
+        if self.workers <= 1 or connection.vendor == "sqlite":
+            return SerialExecutor()
+
+        connections.close_all()
+        if sys.version_info < (3, 7):
+            return ProcessPoolExecutor(max_workers=self.workers)
+
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+
+    def run(self, path):
+        """
+        Ingere o arquivo e retorna as estatísticas somadas dos shards.
+        """
+
+        start = time.perf_counter()
+        shards = split_file(path, self.workers)
+        paths = [path] * len(shards)
+        starts = [shard[0] for shard in shards]
+        ends = [shard[1] for shard in shards]
+
+        with self.executor() as executor:
+            scans = list(executor.map(scan_shard, paths, starts, ends))
+            stores = self.merge_stores(scans)
+            self.store_ids = set(stores.values())
+            results = list(executor.map(
+                ingest_shard, paths, starts, ends,
+                [self.user.pk] * len(shards),
+                [stores] * len(shards),
+                [self.batch_size] * len(shards)
+            ))
+
+        # Os workers invalidam o cache nos seus processos; aqui a
+        # invalidação vale também para caches locais ao processo
+        bump_versions(Store.objects.filter(id__in=self.store_ids))
+
+        seconds = time.perf_counter() - start
+        stats = {field: sum(result[field] for result in results) for field in STATS_FIELDS}
+        stats.update({
+            "stores_created": self.stores_created,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(stats["lines"] / seconds, 2) if seconds else 0.0,
+            "workers": len(shards)
+        })
+        logger.info("CNAB ingerido em paralelo: %s", stats)
+
+        return stats
+
+    def merge_stores(self, scans):
+        """
+        Interrompe a ingestão no primeiro registro inválido do arquivo e
+        cria, de uma vez, as lojas do usuário que ainda não existem,
+        mantendo os dados da primeira ocorrência de cada loja no arquivo.
+        """
+
+        line = 0
+        titles = {}
+        for scan in scans:
+            if scan["error"] is not None:
+                scan["error"].line += line
+                raise invalid_record(scan["error"])
+
+            line += scan["lines"]
+            for title, data in scan["stores"].items():
+                titles.setdefault(title, data)
+
+        stores = dict(Store.objects.filter(user=self.user, title__in=titles).values_list("title", "id"))
+        missing = [
+            Store(user=self.user, title=title, cpf=cpf, owner=owner)
+            for title, (cpf, owner) in titles.items() if title not in stores
+        ]
+
+        if missing:
+            self.stores_created = create_stores(self.user, missing, self.batch_size)
+            stores.update(
+                Store.objects.filter(user=self.user, title__in=[store.title for store in missing])
+                .values_list("title", "id")
+            )
+
+        return stores
@@ -0,0 +1,107 @@
+from datetime import date, time
+from operator import itemgetter
+from .enum import TransactionType, TransactionSignal
+
+# Layout de cada registro do CNAB: (campo, início, fim).
+# Os campos até a hora são ASCII, então seus offsets valem tanto para
+# caracteres quanto para bytes. Os nomes do dono e da loja podem conter
+# caracteres acentuados e são os únicos decodificados como texto.
+LAYOUT = (
+    ("transaction_type", 0, 1),
+    ("date", 1, 9),
+    ("value", 9, 19),
+    ("cpf", 19, 30),
+    ("card", 30, 42),
+    ("time", 42, 48),
+    ("owner", 48, 62),
+    ("store", 62, 80),
+)
+
+OFFSETS = {field: (start, end) for field, start, end in LAYOUT}
+
+# Início dos campos de texto e quantidade de caracteres esperada
+# a partir dele, incluindo a quebra de linha
+TEXT_START = OFFSETS["owner"][0]
+TEXT_LENGTH = OFFSETS["store"][1] - TEXT_START + 1
+OWNER_LENGTH = OFFSETS["owner"][1] - OFFSETS["owner"][0]
+
+# Tipo de transação indexado pelo byte do primeiro campo do registro
+TRANSACTION_CODES = {
+    b"1": "DEBIT",
+    b"2": "BILL",
+    b"3": "FINANCING",
+    b"4": "CREDIT",
+    b"5": "RECEIVEMENT",
+    b"6": "SALES",
+    b"7": "TED",
+    b"8": "DOC",
+    b"9": "RENT",
+}
+
+TRANSACTIONS = {
+    code[0]: (TransactionType[name].value, TransactionSignal[name].value)
+    for code, name in TRANSACTION_CODES.items()
+}
+
+# Extrai de uma vez os pedaços numéricos do registro:
+# ano, mês, dia, valor, cpf, cartão, hora, minuto e segundo
+_NUMERIC_FIELDS = itemgetter(
+    slice(1, 5), slice(5, 7), slice(7, 9), slice(9, 19), slice(19, 30),
+    slice(30, 42), slice(42, 44), slice(44, 46), slice(46, 48)
+)
+
+
+class InvalidRecord(ValueError):
+    """
+    Registro do CNAB com conteúdo inválido.
+    """
+
+    def __init__(self, line=None):
+        """
+        Construtor, recebe opcionalmente o número da linha inválida.
+        """
+
+        super(InvalidRecord, self).__init__(line)
+        self.line = line
+
+
+class InvalidRecordLength(InvalidRecord):
+    """
+    Registro do CNAB com tamanho diferente do layout.
+    """
+
+
+def parse_record(record):
+    """
+    Converte um registro do CNAB (bytes ou memoryview) nos tipos do banco:
+    data como date, hora como time e valor em centavos como inteiro.
+    """
+
+    if isinstance(record, memoryview):
+        record = record.tobytes()
+
+    try:
+        text = record[TEXT_START:].decode()
+    except UnicodeDecodeError:
+        raise InvalidRecordLength()
+
+    if len(text) != TEXT_LENGTH:
+        raise InvalidRecordLength()
+
+    try:
+        transaction_type, transaction_signal = TRANSACTIONS[record[0]]
+        year, month, day, value, cpf, card, hour, minute, second = _NUMERIC_FIELDS(record)
+        cpf = cpf.decode("ascii")
+        return {
+            "transaction_type": transaction_type,
+            "transaction_signal": transaction_signal,
+            "date": date(int(year), int(month), int(day)),
+            "value": int(value),
+            "cpf": f"{cpf[0:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:11]}",
+            "card": card.decode("ascii"),
+            "time": time(int(hour), int(minute), int(second)),
+            "owner": text[:OWNER_LENGTH].strip(),
+            "store": text[OWNER_LENGTH:].strip()
+        }
+    except (KeyError, ValueError):
+        raise InvalidRecord()
@@ -0,0 +1,140 @@
+import hashlib
+from django.conf import settings
+from rest_framework.views import status
+from shared.exception import GenericException
+from .metrics import PARSE_ERRORS
+from .parser import parse_record, InvalidRecordLength, InvalidRecord
+from . import vectorized
+
+
+def validate_content_type(file):
+    """
+    Valida se o arquivo de CNAB é do tipo text/plain.
+    """
+
+    if file.content_type != "text/plain":
+        raise GenericException(
+            "Formato de arquivo inválido, deve ser do tipo text/plain.",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+
+def fingerprint(file):
+    """
+    Calcula o SHA-256 do conteúdo do arquivo lendo-o em chunks, sem
+    carregá-lo inteiro em memória, e volta ao início do arquivo.
+    """
+
+    digest = hashlib.sha256()
+    for chunk in file.chunks(settings.CNAB_CHUNK_SIZE):
+        digest.update(chunk)
+
+    file.seek(0)
+
+    return digest.hexdigest()
+
+
+def iter_lines(file):
+    """
+    Lê o arquivo em chunks e entrega uma linha (em bytes) por vez,
+    sem carregar o arquivo inteiro em memória.
+    """
+
+    try:
+        for line in file:
+            yield line
+    finally:
+        file.close()
+
+
+def iter_chunks(file, size):
+    """
+    Lê o arquivo em blocos de aproximadamente size bytes que terminam
+    sempre em uma quebra de linha, ou seja, sem cortar registros.
+    """
+
+    remainder = b""
+    try:
+        for chunk in file.chunks(size):
+            chunk = remainder + chunk
+            cut = chunk.rfind(b"\n") + 1
+            remainder = chunk[cut:]
+            if cut:
+                yield chunk[:cut]
+
+        if remainder:
+            yield remainder
+    finally:
+        file.close()
+
+
+def read_records(file):
+    """
+    Pipeline de leitura do CNAB: lê, valida e converte cada linha
+    do arquivo sob demanda, usando o parser vetorizado quando
+    configurado e disponível.
+    """
+
+    validate_content_type(file)
+
+    return parse_file(file)
+
+
+def parse_file(file):
+    """
+    Converte as linhas de um arquivo de CNAB já validado sob demanda.
+    """
+
+    if settings.CNAB_PARSER == "numpy" and vectorized.is_available():
+        return parse_chunks(iter_chunks(file, settings.CNAB_CHUNK_SIZE))
+
+    return parse_lines(iter_lines(file))
+
+
+def invalid_record(error):
+    """
+    Converte o erro do parser na exceção da API.
+    """
+
+    PARSE_ERRORS.inc()
+    if isinstance(error, InvalidRecordLength):
+        return GenericException(
+            "O tamanho de cada linha do cnab deve conter exatamente 81 caracteres.",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+
+    return GenericException(
+        f"O registro da linha {error.line} do cnab é inválido.",
+        status_code=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def parse_lines(lines):
+    """
+    Converte as linhas do CNAB em registros, interrompendo no primeiro
+    registro inválido.
+    """
+
+    for number, line in enumerate(lines, start=1):
+        try:
+            yield parse_record(line)
+        except InvalidRecord as error:
+            error.line = number
+            raise invalid_record(error)
+
+
+def parse_chunks(chunks):
+    """
+    Converte os blocos do CNAB em registros com o parser vetorizado,
+    interrompendo no primeiro registro inválido.
+    """
+
+    line = 1
+    for chunk in chunks:
+        try:
+            columns = vectorized.parse_chunk(chunk, first_line=line)
+        except InvalidRecord as error:
+            raise invalid_record(error)
+
+        line += len(columns["store"])
+        yield from vectorized.iter_column_records(columns)
@@ -1,5 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
-from .models import CNAB, Store
+from .enum import TransactionType
+from .models import CNAB, Store, UploadJob, CNABUpload, cnab_fingerprint
+from .cache import bump_versions, fragment_key
+from .ingestion import balance_deltas
+from .metrics import DUPLICATES, INSERTED, STORES_CREATED, STORE_FRAGMENTS
+
+
+class StoreListSerializer(serializers.ListSerializer):
+    """
+    Serialização de uma lista de lojas montada a partir dos fragmentos
+    de cada loja guardados no cache. Apenas as lojas alteradas desde a
+    última serialização têm os seus CNABs carregados e formatados.
+    """
+
+    def to_representation(self, data):
+        """
+        Formata os dados de saída.
+        """
+
+        stores = list(data.all() if hasattr(data, "all") else data)
+        keys = [fragment_key(store) for store in stores]
+        fragments = cache.get_many(keys)
+
+        missing = [store for key, store in zip(keys, stores) if key not in fragments]
+        if missing:
+            prefetch_related_objects(missing, "cnabs")
+            rendered = {fragment_key(store): self.child.to_representation(store) for store in missing}
+            cache.set_many(rendered, settings.CNAB_CACHE_TIMEOUT)
+            fragments.update(rendered)
+
+        STORE_FRAGMENTS.inc(len(stores) - len(missing), result="hit")
+        STORE_FRAGMENTS.inc(len(missing), result="miss")
+
+        return [fragments[key] for key in keys]
 
 
 class StoreSerializer(serializers.Serializer):
@@ -88,18 +124,30 @@ class StoreSerializer(serializers.Serializer):
         }
     )
 
+    class Meta:
+        """
+        Informações adicionais do serializer.
+        """
+
+        list_serializer_class = StoreListSerializer
+
     def to_representation(self, instance):
         """
-        Formata os dados de saída.
+        Formata os dados de saída. Com many=True os CNABs das lojas fora
+        do cache são carregados em uma única consulta. O saldo vem do
+        livro de saldos da loja.
         """
 
-        signal_map = {"+": 1, "-": -1}
+        cnabs = instance.cnabs.all()
+        total = getattr(instance, "total", None)
+        if total is None:
+            total = instance.balance
 
         return {
             "title": instance.title,
             "cpf": instance.cpf,
             "owner": instance.owner,
-            "total": round(float(sum([cnab.value * signal_map[cnab.transaction_signal] for cnab in instance.cnabs.all()])), 2),
+            "total": round(float(total), 2),
             "cnabs": [{
                 "transaction_type": cnab.transaction_type,
                 "transaction_signal": cnab.transaction_signal,
@@ -107,7 +155,7 @@ class StoreSerializer(serializers.Serializer):
                 "value": round(float(cnab.value), 2),
                 "card": cnab.card,
                 "time": cnab.time.strftime("%H:%M:%S")
-            } for cnab in instance.cnabs.all()]
+            } for cnab in cnabs]
         }
 
     def create(self, validated_data):
@@ -115,23 +163,214 @@ class StoreSerializer(serializers.Serializer):
         Cria as instâncias
         """
 
-        store, created = Store.objects.get_or_create(
+        store, store_created = Store.objects.get_or_create(
+            user=self.context.get('user'),
             title=validated_data['store'],
             defaults={
-                "user": self.context.get('user'),
                 "cpf": validated_data['cpf'],
                 "owner": validated_data['owner']
             }
         )
 
-        CNAB.objects.get_or_create(
-            store=store,
-            transaction_type=validated_data['transaction_type'],
-            transaction_signal=validated_data['transaction_signal'],
-            date=validated_data['date'],
-            time=validated_data['time'],
-            value=validated_data['value'],
-            card=validated_data['card']
+        fields = {
+            name: CNAB._meta.get_field(name).to_python(validated_data[name])
+            for name in ("transaction_type", "transaction_signal", "date", "time", "value", "card")
+        }
+        fingerprint = cnab_fingerprint(
+            store.user_id, store.title, fields["transaction_type"], fields["transaction_signal"],
+            fields["date"], fields["time"], fields["value"], fields["card"]
+        )
+
+        cnab, created = CNAB.objects.get_or_create(
+            fingerprint=fingerprint,
+            defaults={"store": store, **fields}
         )
 
+        if store_created:
+            STORES_CREATED.inc()
+
+        if created:
+            Store.objects.apply_balances(balance_deltas([cnab]))
+            bump_versions(Store.objects.filter(pk=store.pk))
+            INSERTED.inc()
+        else:
+            DUPLICATES.inc()
+
         return store
+
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    """
+    Serialização da situação de um job de importação de CNAB.
+    """
+
+    progress = serializers.IntegerField(
+        read_only=True,
+        label="Progresso",
+        help_text="Percentual das linhas do arquivo já importadas."
+    )
+
+    class Meta:
+        """
+        Informações adicionais do serializer.
+        """
+
+        model = UploadJob
+        fields = (
+            "id", "status", "progress", "size", "total_lines", "lines",
+            "inserted", "duplicates", "rejected", "error",
+            "created_at", "started_at", "finished_at"
+        )
+        read_only_fields = fields
+
+
+class CNABUploadSerializer(serializers.ModelSerializer):
+    """
+    Serialização do registro de um arquivo de CNAB já importado.
+    """
+
+    class Meta:
+        """
+        Informações adicionais do serializer.
+        """
+
+        model = CNABUpload
+        fields = ("id", "sha256", "size", "lines", "created_at")
+        read_only_fields = fields
+
+
+class StoreFilterSerializer(serializers.Serializer):
+    """
+    Validação dos filtros e da ordenação da listagem de lojas.
+    """
+
+    ORDERING = ("total", "-total", "title", "-title", "created_at", "-created_at")
+
+    ordering = serializers.ChoiceField(
+        choices=ORDERING,
+        required=False,
+        label="Ordenação",
+        help_text="Campo de ordenação das lojas. Ex: -total",
+        error_messages={"invalid_choice": "Ordenação inválida, use um dos valores: " + ", ".join(ORDERING)}
+    )
+
+    min_total = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        required=False,
+        label="Saldo mínimo",
+        help_text="Lista apenas as lojas com saldo maior ou igual ao valor.",
+        error_messages={"invalid": "O saldo mínimo deve ser um número."}
+    )
+
+    max_total = serializers.DecimalField(
+        max_digits=20,
+        decimal_places=2,
+        required=False,
+        label="Saldo máximo",
+        help_text="Lista apenas as lojas com saldo menor ou igual ao valor.",
+        error_messages={"invalid": "O saldo máximo deve ser um número."}
+    )
+
+    def filter(self, queryset):
+        """
+        Aplica os filtros validados na consulta das lojas com saldo.
+        """
+
+        data = self.validated_data
+        if "min_total" in data:
+            queryset = queryset.filter(total__gte=data["min_total"])
+
+        if "max_total" in data:
+            queryset = queryset.filter(total__lte=data["max_total"])
+
+        if "ordering" in data:
+            queryset = queryset.order_by(data["ordering"], "-id")
+
+        return queryset
+
+
+class CNABSerializer(serializers.Serializer):
+    """
+    Serialização de uma transação do CNAB, no mesmo formato dos CNABs
+    da listagem de lojas. Use select_related("store") na consulta.
+    """
+
+    def to_representation(self, instance):
+        """
+        Formata os dados de saída.
+        """
+
+        return {
+            "id": instance.id,
+            "store": instance.store.title,
+            "transaction_type": instance.transaction_type,
+            "transaction_signal": instance.transaction_signal,
+            "date": instance.date.strftime("%d/%m/%Y"),
+            "value": round(float(instance.value), 2),
+            "card": instance.card,
+            "time": instance.time.strftime("%H:%M:%S")
+        }
+
+
+class CNABFilterSerializer(serializers.Serializer):
+    """
+    Validação dos filtros da listagem de transações.
+    """
+
+    store = serializers.CharField(
+        required=False,
+        label="Loja",
+        help_text="Nome da loja. Ex: BAR DO JOÃO"
+    )
+
+    date_from = serializers.DateField(
+        required=False,
+        label="Data inicial",
+        help_text="Lista apenas as transações a partir da data. Ex: 2019-03-01",
+        error_messages={"invalid": "A data inicial deve estar no formato AAAA-MM-DD."}
+    )
+
+    date_to = serializers.DateField(
+        required=False,
+        label="Data final",
+        help_text="Lista apenas as transações até a data. Ex: 2019-03-31",
+        error_messages={"invalid": "A data final deve estar no formato AAAA-MM-DD."}
+    )
+
+    transaction_type = serializers.ChoiceField(
+        choices=TransactionType.choices,
+        required=False,
+        label="Tipo",
+        help_text="Tipo de transação. Ex: Aluguel",
+        error_messages={"invalid_choice": "Tipo de transação inválido."}
+    )
+
+    card = serializers.CharField(
+        required=False,
+        label="Cartão",
+        help_text="Cartão utilizado na transação. Ex: 1234****6678"
+    )
+
+    def filter(self, queryset):
+        """
+        Aplica os filtros validados na consulta das transações.
+        """
+
+        data = self.validated_data
+        if "store" in data:
+            queryset = queryset.filter(store__title=data["store"])
+
+        if "date_from" in data:
+            queryset = queryset.filter(date__gte=data["date_from"])
+
+        if "date_to" in data:
+            queryset = queryset.filter(date__lte=data["date_to"])
+
+        if "transaction_type" in data:
+            queryset = queryset.filter(transaction_type=data["transaction_type"])
+
+        if "card" in data:
+            queryset = queryset.filter(card=data["card"])
+
+        return queryset
@@ -0,0 +1,264 @@
+import csv
+import io
+import logging
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from shared.timing import phase
+from .cache import bump_versions
+from .ingestion import CNABIngestion, normalize, timed_batches
+from .models import Store, cnab_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Colunas da tabela temporária, na ordem em que as linhas são carregadas
+STAGING_COLUMNS = (
+    "line", "title", "cpf", "owner", "transaction_type",
+    "transaction_signal", "date", "time", "value", "card", "fingerprint"
+)
+
+CREATE_STAGING = """
+    CREATE TEMPORARY TABLE cnab_staging (
+        line integer NOT NULL,
+        title varchar(19) NOT NULL,
+        cpf varchar(14) NOT NULL,
+        owner varchar(14) NOT NULL,
+        transaction_type varchar(50) NOT NULL,
+        transaction_signal varchar(1) NOT NULL,
+        date date NOT NULL,
+        time time NOT NULL,
+        value numeric(9, 3) NOT NULL,
+        card varchar(12) NOT NULL,
+        fingerprint varchar(40) NOT NULL,
+        is_new boolean NOT NULL DEFAULT false
+    )
+"""
+
+# Lojas novas do usuário, com os dados da primeira linha de cada uma no arquivo
+INSERT_STORES = """
+    INSERT INTO store (user_id, title, cpf, owner, transactions_count, credit_total, debit_total, created_at, updated_at)
+    SELECT %s, s.title, s.cpf, s.owner, 0, 0, 0, %s, %s
+    FROM cnab_staging s
+    WHERE s.line IN (SELECT MIN(line) FROM cnab_staging GROUP BY title)
+    AND NOT EXISTS (SELECT 1 FROM store WHERE store.user_id = %s AND store.title = s.title)
+    ORDER BY s.line
+"""
+
+LOCK_STORES = """
+    SELECT id FROM store
+    WHERE user_id = %s AND title IN (SELECT title FROM cnab_staging)
+    ORDER BY id
+    FOR UPDATE
+"""
+
+# Primeira ocorrência de cada transação que ainda não está no banco
+MARK_NEW = """
+    UPDATE cnab_staging SET is_new = %s
+    WHERE line IN (SELECT MIN(line) FROM cnab_staging GROUP BY fingerprint)
+    AND NOT EXISTS (SELECT 1 FROM cnab WHERE cnab.fingerprint = cnab_staging.fingerprint)
+"""
+
+INSERT_CNABS = """
+    INSERT INTO cnab (store_id, transaction_type, transaction_signal, date, time, value, card, fingerprint, created_at, updated_at)
+    SELECT store.id, s.transaction_type, s.transaction_signal, s.date, s.time, s.value, s.card, s.fingerprint, %s, %s
+    FROM cnab_staging s
+    JOIN store ON store.user_id = %s AND store.title = s.title
+    WHERE s.is_new = %s
+    ORDER BY s.line
+"""
+
+UPDATE_BALANCES = """
+    UPDATE store SET
+        transactions_count = transactions_count + (
+            SELECT COUNT(*) FROM cnab_staging s WHERE s.title = store.title AND s.is_new = %s
+        ),
+        credit_total = credit_total + COALESCE((
+            SELECT SUM(s.value) FROM cnab_staging s
+            WHERE s.title = store.title AND s.is_new = %s AND s.transaction_signal = '+'
+        ), 0),
+        debit_total = debit_total + COALESCE((
+            SELECT SUM(s.value) FROM cnab_staging s
+            WHERE s.title = store.title AND s.is_new = %s AND s.transaction_signal = '-'
+        ), 0),
+        updated_at = %s
+    WHERE user_id = %s AND title IN (SELECT title FROM cnab_staging WHERE is_new = %s)
+"""
+
+STORE_IDS = "SELECT id FROM store WHERE user_id = %s AND title IN (SELECT title FROM cnab_staging)"
+
+
+def get_ingestion(user, on_batch=None, atomic=True):
+    """
+    Cria o motor de ingestão configurado em CNAB_INGESTION_BACKEND:
+    "orm" (padrão, CNABIngestion) ou "copy" (StagingIngestion, que é
+    sempre executada em uma única transação).
+    """
+
+    if settings.CNAB_INGESTION_BACKEND == "copy":
+        return StagingIngestion(user, on_batch=on_batch)
+
+    return CNABIngestion(user, on_batch=on_batch, atomic=atomic)
+
+
+class StagingIngestion:
+    """
+    Ingestão de arquivos grandes de CNAB por uma tabela temporária.
+
+    As linhas convertidas são carregadas na tabela cnab_staging, com
+    COPY FROM STDIN no PostgreSQL e com executemany nos demais bancos
+    (ex: SQLite nos testes), e depois mescladas em store e cnab com poucos
+    comandos SQL sobre o conjunto inteiro: lojas novas, transações novas
+    (pela impressão digital) e livro de saldos. Tudo roda em uma única
+    transação, então o on_batch é chamado apenas ao final.
+    """
+
+    def __init__(self, user, batch_size=None, on_batch=None):
+        """
+        Construtor.
+        """
+
+        self.user = user
+        self.batch_size = batch_size or settings.CNAB_BATCH_SIZE
+        self.on_batch = on_batch
+        self.store_ids = set()
+        self.lines = 0
+        self.loaded = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.stores_created = 0
+        self.seconds = 0.0
+
+    @property
+    def uses_copy(self):
+        """
+        Verifica se o banco aceita COPY FROM STDIN (PostgreSQL).
+        """
+
+        return connection.vendor == "postgresql"
+
+    def run(self, records):
+        """
+        Ingere os registros convertidos pelo parser do CNAB e retorna as estatísticas.
+        """
+
+        start = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("DROP TABLE IF EXISTS cnab_staging")
+            cursor.execute(CREATE_STAGING)
+            for batch in timed_batches(self.__rows(records), self.batch_size):
+                with phase("write"):
+                    self.__load(cursor, batch)
+
+            with phase("write"):
+                cursor.execute("CREATE INDEX cnab_staging_title ON cnab_staging (title)")
+                self.__merge(cursor)
+                cursor.execute("DROP TABLE cnab_staging")
+
+        if self.store_ids:
+            bump_versions(Store.objects.filter(id__in=self.store_ids))
+
+        self.seconds = time.perf_counter() - start
+        stats = self.stats()
+        logger.info(
+            "CNAB ingerido via tabela temporária: %(lines)s linhas, %(inserted)s inseridas, "
+            "%(duplicates)s duplicadas, %(rejected)s rejeitadas em %(seconds)ss (%(rows_per_second)s linhas/s)",
+            stats
+        )
+
+        if self.on_batch:
+            self.on_batch(self)
+
+        return stats
+
+    def stats(self):
+        """
+        Estatísticas da ingestão, no mesmo formato do CNABIngestion.
+        """
+
+        return {
+            "lines": self.lines,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "stores_created": self.stores_created,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.lines / self.seconds, 2) if self.seconds else 0.0
+        }
+
+    def __rows(self, records):
+        """
+        Valida os registros e gera as linhas da tabela temporária.
+        """
+
+        for record in records:
+            self.lines += 1
+            row = normalize(record)
+            if row is None:
+                self.rejected += 1
+                continue
+
+            yield (
+                self.lines, row["store"], row["cpf"], row["owner"], row["transaction_type"],
+                row["transaction_signal"], row["date"], row["time"], row["value"], row["card"],
+                cnab_fingerprint(
+                    self.user.pk, row["store"], row["transaction_type"], row["transaction_signal"],
+                    row["date"], row["time"], row["value"], row["card"]
+                )
+            )
+
+    def __load(self, cursor, rows):
+        """
+        Carrega um lote de linhas na tabela temporária.
+        """
+
+        self.loaded += len(rows)
+        columns = ", ".join(STAGING_COLUMNS)
+        if self.uses_copy:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY cnab_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            return
+
+        ops = connection.ops
+        cursor.executemany(
+            f"INSERT INTO cnab_staging ({columns}) VALUES ({', '.join(['%s'] * len(STAGING_COLUMNS))})",
+            [
+                row[:6] + (
+                    ops.adapt_datefield_value(row[6]),
+                    ops.adapt_timefield_value(row[7]),
+                    ops.adapt_decimalfield_value(row[8], 9, 3)
+                ) + row[9:]
+                for row in rows
+            ]
+        )
+
+    def __merge(self, cursor):
+        """
+        Mescla a tabela temporária nas lojas do usuário e em cnab.
+        """
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        insert_stores = INSERT_STORES
+        if self.uses_copy:
+            insert_stores += " ON CONFLICT (user_id, title) DO NOTHING"
+
+        user_id = self.user.pk
+        cursor.execute(insert_stores, [user_id, now, now, user_id])
+        self.stores_created = max(cursor.rowcount, 0)
+
+        # Serializa a deduplicação com ingestões concorrentes das mesmas lojas
+        if connection.features.has_select_for_update:
+            cursor.execute(LOCK_STORES, [user_id])
+
+        cursor.execute(MARK_NEW, [True])
+        cursor.execute(INSERT_CNABS, [now, now, user_id, True])
+        self.inserted = max(cursor.rowcount, 0)
+        self.duplicates = self.loaded - self.inserted
+
+        cursor.execute(UPDATE_BALANCES, [True, True, True, now, user_id, True])
+        cursor.execute(STORE_IDS, [user_id])
+        self.store_ids = {row[0] for row in cursor.fetchall()}
@@ -1,14 +1,58 @@
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+from decimal import Decimal
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.files.uploadhandler import StopFutureHandlers
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.exceptions import IrreversibleError
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.http import UnreadablePostError
+from django.test import RequestFactory, TransactionTestCase, modify_settings, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
+from django.utils import timezone
+from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.tokens import RefreshToken
 from apps.accounts.models import User
-from .models import CNAB, Store
-from .views import CNABViewSet
-from .enum import TransactionType, TransactionSignal
+from config.asgi import application
+from shared.exception import GenericException
+from shared import renderers
+from shared.renderers import FastJSONRenderer
+from shared.pagination import KeysetPagination
+from .models import CNAB, Store, UploadJob, CNABUpload, cnab_fingerprint
+from .enum import TransactionType, TransactionSignal, JobStatus
 from .serializers import StoreSerializer
+from .cache import bump_version
+from .ingestion import CNABIngestion, create_stores
+from .staging import StagingIngestion, get_ingestion
+from .reader import read_records
+from .parser import parse_record, InvalidRecord, InvalidRecordLength
+from .handlers import parse_on_receive
+from .jobs import process_job
+from .parallel import ParallelIngestion, split_file, iter_shard
+from . import vectorized
+from .generator import generate_records, parse_type_mix
 
+# Os testes usam um cache em memória, limpo antes de cada teste
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
 
+
+@override_settings(CACHES=LOCMEM_CACHE)
 class CNABTestCase(APITestCase):
     """
     Testes unitários para verificar o comportamento
@@ -20,6 +64,7 @@ class CNABTestCase(APITestCase):
         Roda antes de cada método.
         """
 
+        cache.clear()
         self.user = User.objects.create_user(
             name='Fulano',
             email='fulano@gmail.com',
@@ -57,25 +102,97 @@ class CNABTestCase(APITestCase):
         self.assertEqual(Store.objects.count(), len(response.data['results']))
         self.assertEqual(CNAB.objects.count(), 21)
 
+    def test_upload_and_listing_queries_do_not_grow_with_stores(self):
+        """
+        O upload e a listagem de lojas carregam lojas e CNABs com um número
+        fixo de consultas, independente da quantidade de lojas, com os
+        fragmentos das lojas fora do cache (cold) ou já em cache (warm).
+        """
+
+        self.client.force_authenticate(self.user)
+        upload = f"{reverse('cnab-upload')}?full=true"
+        stores = reverse('cnab-stores')
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   {:<18}\n"
+
+        for count in (1, 5):
+            cache.clear()
+            lines = "".join(line.format(f"LOJA {count} {store}") for store in range(count))
+            file = SimpleUploadedFile("CNAB.txt", lines.encode(), content_type="text/plain")
+            with self.assertNumQueries(19):
+                response = self.client.post(upload, data={"file": file}, format="multipart")
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), Store.objects.count())
+
+            cache.clear()
+            with self.assertNumQueries(2):
+                response = self.client.get(stores)
+
+            self.assertEqual(len(response.data['results']), Store.objects.count())
+            self.assertEqual(sum(len(store['cnabs']) for store in response.data['results']), CNAB.objects.count())
+
+            bump_version(self.user.pk)
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(stores).data, response.data)
+
+            file = SimpleUploadedFile("CNAB.txt", line.format(f"LOJA {count} 0").encode() * 2, content_type="text/plain")
+            with self.assertNumQueries(12):
+                response = self.client.post(upload, data={"file": file}, format="multipart")
+
+            self.assertEqual(response.data['ingestion']['duplicates'], 2)
+
+    def test_upload_response_only_has_stores_of_the_file(self):
+        """
+        A resposta do upload traz apenas as lojas do arquivo enviado,
+        a não ser que todas as lojas sejam pedidas com ?full=true.
+        """
+
+        Store.objects.create(user=self.user, title="OUTRA LOJA", cpf="000.000.000-00", owner="FULANO")
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        titles = {store['title'] for store in response.data['results']}
+        self.assertNotIn("OUTRA LOJA", titles)
+        self.assertEqual(len(titles), Store.objects.count() - 1)
+        self.assertEqual(response.data['ingestion']['inserted'], 21)
+
+        CNABUpload.objects.all().delete()
+        self.cnab.seek(0)
+        response = self.client.post(url + "?full=true", data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.data['ingestion']['duplicates'], 21)
+        self.assertEqual(len(response.data['results']), Store.objects.count())
+
     def test_cnab_line_formater(self):
         """
         Testando a transformação de uma linha do qnab em objeto
         para armazenar no banco.
         """
 
-        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO"
-        formated_data = CNABViewSet()._CNABViewSet__extract_data_from_line(line)
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        formated_data = parse_record(line)
         self.assertEqual(formated_data, {
             "transaction_type": TransactionType.FINANCING.value,
             "transaction_signal": TransactionSignal.FINANCING.value,
-            "date": "2019-03-01",
-            "value": 142.0,
+            "date": datetime.date(2019, 3, 1),
+            "value": 14200,
             "cpf": "096.206.760-17",
             "card": "4753****3153",
-            "time": "15:34:53",
+            "time": datetime.time(15, 34, 53),
             "owner": "JOÃO MACEDO",
             "store": "BAR DO JOÃO"
         })
+        self.assertEqual(parse_record(memoryview(line)), formated_data)
+
+    def test_cnab_line_invalid_record(self):
+        """
+        Registros com tamanho ou conteúdo inválido são recusados pelo parser.
+        """
+
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n"
+        self.assertRaises(InvalidRecordLength, parse_record, line[:70].encode())
+        self.assertRaises(InvalidRecord, parse_record, ("0" + line[1:]).encode())
+        self.assertRaises(InvalidRecord, parse_record, line.replace("20190301", "20191301").encode())
 
     def test_not_get_cnab_by_not_logged_user(self):
         """
@@ -199,3 +316,1362 @@ class CNABTestCase(APITestCase):
         """
 
         self.error_serializer_tests("store", "O nome da loja não pode está em branco.")
+
+    def test_upload_same_cnab_twice_does_not_duplicate(self):
+        """
+        Reenviar o mesmo CNAB não deve duplicar lojas nem transações,
+        mesmo quando o arquivo não está no registro de uploads.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.data['ingestion']['inserted'], 21)
+        self.assertEqual(response.data['ingestion']['duplicates'], 0)
+        stores = Store.objects.count()
+
+        CNABUpload.objects.all().delete()
+        self.cnab.seek(0)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ingestion']['lines'], 21)
+        self.assertEqual(response.data['ingestion']['inserted'], 0)
+        self.assertEqual(response.data['ingestion']['duplicates'], 21)
+        self.assertEqual(response.data['ingestion']['stores_created'], 0)
+        self.assertEqual(Store.objects.count(), stores)
+        self.assertEqual(CNAB.objects.count(), 21)
+
+    def test_identical_file_is_answered_from_upload_registry(self):
+        """
+        Um arquivo idêntico a outro já importado é marcado como duplicado
+        sem que as suas linhas sejam lidas.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertFalse(response.data['duplicate'])
+        self.assertEqual(response.data['upload']['lines'], 21)
+        self.assertEqual(response.data['upload']['size'], os.path.getsize("./apps/cnab/mocks/CNAB.txt"))
+
+        self.cnab.seek(0)
+        with mock.patch("apps.cnab.uploads.read_records") as read:
+            response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+
+        read.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(CNABUpload.objects.count(), 1)
+        self.assertEqual(CNAB.objects.count(), 21)
+
+    def test_users_with_the_same_file_have_their_own_stores(self):
+        """
+        O título da loja é único por usuário: o mesmo arquivo enviado por
+        outro usuário, por qualquer motor de ingestão, cria as lojas e as
+        transações dele, sem tocar nas do primeiro.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.data['ingestion']['inserted'], 21)
+        stores = Store.objects.filter(user=self.user).count()
+        totals = sorted((store['title'], store['total']) for store in response.data['results'])
+
+        for backend, email in (("orm", "ciclano@gmail.com"), ("copy", "beltrano@gmail.com")):
+            with self.subTest(backend=backend), override_settings(CNAB_INGESTION_BACKEND=backend):
+                other = User.objects.create_user(name='Outro', email=email, password='django1234')
+                self.client.force_authenticate(other)
+                self.cnab.seek(0)
+                response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['ingestion']['inserted'], 21)
+                self.assertEqual(response.data['ingestion']['duplicates'], 0)
+                self.assertEqual(response.data['ingestion']['stores_created'], stores)
+                self.assertEqual(sorted((store['title'], store['total']) for store in response.data['results']), totals)
+                self.assertEqual(CNAB.objects.filter(store__user=other).count(), 21)
+
+        self.assertEqual(CNAB.objects.filter(store__user=self.user).count(), 21)
+        self.assertEqual(Store.objects.filter(user=self.user).count(), stores)
+        self.assertFalse(Store.objects.with_balance_mismatches().exists())
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('cnab-stores'))
+        self.assertEqual(sorted((store['title'], store['total']) for store in response.data['results']), totals)
+
+    def test_upload_registry_is_per_user(self):
+        """
+        O registro de uploads é por usuário: o arquivo já importado por
+        outro usuário é lido e registrado para quem o enviou.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        first = self.client.post(url, data={"file": self.cnab}, format="multipart")
+
+        other = User.objects.create_user(name='Ciclano', email='ciclano@gmail.com', password='django1234')
+        self.client.force_authenticate(other)
+        self.cnab.seek(0)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['duplicate'])
+        self.assertNotEqual(response.data['upload']['id'], first.data['upload']['id'])
+        self.assertEqual(response.data['ingestion']['lines'], 21)
+        self.assertEqual(CNABUpload.objects.filter(user=other).count(), 1)
+        self.assertEqual(CNABUpload.objects.count(), 2)
+
+    @override_settings(CNAB_PARSE_ON_RECEIVE=True, CNAB_BATCH_SIZE=5)
+    def test_upload_is_parsed_on_receive(self):
+        """
+        Com CNAB_PARSE_ON_RECEIVE o arquivo é ingerido em lotes enquanto é
+        recebido, sem passar pelo leitor do arquivo armazenado.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        with mock.patch("apps.cnab.uploads.read_records") as read:
+            response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+
+        read.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ingestion']['lines'], 21)
+        self.assertEqual(response.data['ingestion']['inserted'], 21)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(CNAB.objects.count(), 21)
+        self.assertEqual(CNABUpload.objects.get().size, os.path.getsize("./apps/cnab/mocks/CNAB.txt"))
+
+        CNAB.objects.order_by('id').last().delete()
+        self.cnab.seek(0)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(CNAB.objects.count(), 20)
+
+    @override_settings(CNAB_PARSE_ON_RECEIVE=True, CNAB_BATCH_SIZE=5)
+    def test_upload_parsed_on_receive_rejects_invalid_files(self):
+        """
+        Arquivos grandes demais, de outro tipo ou com um registro inválido
+        são recusados durante o recebimento, sem gravar nenhuma transação.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        lines = self.cnab.read().splitlines(True)
+        lines[11] = b"X" + lines[11][1:]
+
+        file = SimpleUploadedFile("CNAB.txt", b"".join(lines), content_type="text/plain")
+        response = self.client.post(url, data={"file": file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['detail'], "O registro da linha 12 do cnab é inválido.")
+        self.assertFalse(CNAB.objects.exists())
+        self.assertFalse(Store.objects.exists())
+        self.assertFalse(CNABUpload.objects.exists())
+
+        file = SimpleUploadedFile("CNAB.txt", b"1" * 1000, content_type="text/plain")
+        response = self.client.post(url, data={"file": file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        file = SimpleUploadedFile("CNAB.csv", b"".join(lines), content_type="text/csv")
+        response = self.client.post(url, data={"file": file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with override_settings(CNAB_UPLOAD_MAX_SIZE=100):
+            self.cnab.seek(0)
+            response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(CNAB.objects.exists())
+
+    @override_settings(CNAB_PARSE_ON_RECEIVE=True, CNAB_BATCH_SIZE=5)
+    def test_upload_interrupted_on_receive_is_rolled_back(self):
+        """
+        Se a leitura do corpo falhar depois de lotes já ingeridos, a
+        ingestão do arquivo é desfeita.
+        """
+
+        request = RequestFactory().post(reverse('cnab-upload'))
+        with self.assertRaises(UnreadablePostError):
+            with parse_on_receive(request, self.user, {}):
+                handler = request.upload_handlers[0]
+                with self.assertRaises(StopFutureHandlers):
+                    handler.new_file("file", "CNAB.txt", "text/plain", None)
+
+                handler.receive_data_chunk(b"".join(self.cnab.readlines()[:12]), 0)
+                self.assertEqual(CNAB.objects.count(), 10)
+                raise UnreadablePostError("Conexão interrompida.")
+
+        self.assertFalse(CNAB.objects.exists())
+        self.assertFalse(Store.objects.exists())
+
+    @modify_settings(MIDDLEWARE={"prepend": "shared.timing.ServerTimingMiddleware"})
+    def test_upload_reports_server_timing(self):
+        """
+        Com o ServerTimingMiddleware o upload envia o tempo de cada fase e
+        das consultas SQL no Server-Timing e em uma linha de log JSON.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        with self.assertLogs("shared.timing", level="INFO") as logs:
+            response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = [metric.split(";")[0] for metric in response["Server-Timing"].split(", ")]
+        self.assertEqual(
+            metrics,
+            ["auth", "receive", "read", "parse", "write", "serialize", "render", "sql", "total"]
+        )
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record["path"], url)
+        self.assertEqual(record["status"], status.HTTP_200_OK)
+        self.assertGreater(record["phases"]["write"]["sql_queries"], 0)
+        self.assertGreaterEqual(record["sql_queries"], sum(phase["sql_queries"] for phase in record["phases"].values()))
+
+    def test_ingestion_rejects_blank_fields_and_dedupes_in_batch(self):
+        """
+        Linhas com campos em branco são rejeitadas e linhas repetidas
+        no mesmo arquivo são inseridas uma única vez.
+        """
+
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        stats = CNABIngestion(self.user, batch_size=2).run([
+            parse_record(line), parse_record(line), dict(parse_record(line), owner="")
+        ])
+        self.assertEqual(stats['lines'], 3)
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['stores_created'], 1)
+        self.assertEqual(Store.objects.get().user, self.user)
+        self.assertEqual(CNAB.objects.count(), 1)
+
+    def test_store_created_by_a_concurrent_ingestion_is_reused(self):
+        """
+        Uma loja criada por outra ingestão do usuário entre a busca e o
+        INSERT é reaproveitada, sem erro de integridade nem contagem dupla.
+        """
+
+        def create_concurrently(user, stores, batch_size):
+            Store.objects.create(user=user, title="BAR DO JOÃO", cpf="096.206.760-17", owner="JOÃO MACEDO")
+            return create_stores(user, stores, batch_size)
+
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        with mock.patch("apps.cnab.ingestion.create_stores", side_effect=create_concurrently):
+            stats = CNABIngestion(self.user).run([parse_record(line)])
+
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['stores_created'], 0)
+        self.assertEqual(Store.objects.get().transactions_count, 1)
+
+    def test_transactions_are_deduplicated_by_fingerprint(self):
+        """
+        Cada transação tem uma impressão digital única, respeitada pela
+        ingestão em lote e pelo StoreSerializer.
+        """
+
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        CNABIngestion(self.user).run([parse_record(line)])
+        cnab = CNAB.objects.get()
+        self.assertEqual(cnab.fingerprint, cnab_fingerprint(
+            self.user.pk, "BAR DO JOÃO", cnab.transaction_type, cnab.transaction_signal,
+            cnab.date, cnab.time, cnab.value, cnab.card
+        ))
+
+        data = {
+            "transaction_type": cnab.transaction_type,
+            "transaction_signal": cnab.transaction_signal,
+            "date": "2019-03-01",
+            "value": "142.00",
+            "cpf": "096.206.760-17",
+            "card": cnab.card,
+            "time": "15:34:53",
+            "owner": "JOÃO MACEDO",
+            "store": "BAR DO JOÃO"
+        }
+        serializer = StoreSerializer(data=data, context={"user": self.user})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(CNAB.objects.count(), 1)
+        self.assertEqual(Store.objects.get().transactions_count, 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CNAB.objects.create(
+                store=cnab.store, transaction_type=cnab.transaction_type,
+                transaction_signal=cnab.transaction_signal, date=cnab.date,
+                time=cnab.time, value=cnab.value, card=cnab.card,
+                fingerprint=cnab.fingerprint
+            )
+
+    @override_settings(CNAB_INGESTION_BACKEND="copy")
+    def test_upload_with_staging_backend(self):
+        """
+        O motor com tabela temporária (executemany no SQLite) armazena os
+        mesmos dados e mantém a deduplicação e o livro de saldos.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ingestion']['inserted'], 21)
+        self.assertEqual(response.data['ingestion']['stores_created'], Store.objects.count())
+        self.assertEqual(CNAB.objects.count(), 21)
+        self.assertEqual(len(response.data['results']), Store.objects.count())
+        self.assertFalse(Store.objects.with_balance_mismatches().exists())
+        self.assertEqual(Store.objects.get(title="BAR DO JOÃO").user, self.user)
+        self.assertEqual(float(Store.objects.get(title="BAR DO JOÃO").balance), -102.0)
+
+        line = "3201903010000014300096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        existing = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        ingestion = get_ingestion(self.user)
+        self.assertIsInstance(ingestion, StagingIngestion)
+        stats = ingestion.run([
+            parse_record(line), parse_record(line), parse_record(existing), dict(parse_record(line), card="")
+        ])
+        self.assertEqual(stats['lines'], 4)
+        self.assertEqual(stats['inserted'], 1)
+        self.assertEqual(stats['duplicates'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['stores_created'], 0)
+        self.assertEqual(CNAB.objects.count(), 22)
+        self.assertFalse(Store.objects.with_balance_mismatches().exists())
+        self.assertEqual(float(Store.objects.get(title="BAR DO JOÃO").balance), -245.0)
+
+    def test_invalid_line_after_valid_lines_rolls_back(self):
+        """
+        Uma linha inválida no meio do arquivo interrompe a leitura
+        e desfaz tudo que já foi ingerido.
+        """
+
+        content = self.cnab.read() + "3201903010000014200096206760174753****3153153453JOÃO\n".encode()
+        file = SimpleUploadedFile("CNAB.txt", content, content_type="text/plain")
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('cnab-upload'), data={"file": file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('detail'), "O tamanho de cada linha do cnab deve conter exatamente 81 caracteres.")
+        self.assertEqual(CNAB.objects.count(), 0)
+        self.assertEqual(Store.objects.count(), 0)
+
+    def test_read_lines_is_lazy(self):
+        """
+        As linhas são lidas sob demanda e o erro só ocorre ao alcançar
+        o registro inválido.
+        """
+
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n"
+        file = SimpleUploadedFile("CNAB.txt", (line + "invalida\n" + line).encode(), content_type="text/plain")
+        records = read_records(file)
+        self.assertEqual(next(records)["store"], "BAR DO JOÃO")
+        self.assertRaises(GenericException, next, records)
+
+    @skipUnless(vectorized.is_available(), "NumPy não está instalado")
+    def test_vectorized_parser_matches_python_parser(self):
+        """
+        O parser vetorizado deve produzir os mesmos registros do parser
+        linha a linha e apontar a linha do primeiro registro inválido.
+        """
+
+        content = self.cnab.read()
+        columns = vectorized.parse_chunk(content)
+        self.assertEqual(len(columns["value"]), 21)
+        self.assertEqual(
+            list(vectorized.iter_column_records(columns)),
+            [parse_record(line) for line in content.splitlines(True)]
+        )
+
+        lines = content.splitlines(True)
+        with self.assertRaises(InvalidRecord) as error:
+            vectorized.parse_chunk(b"".join(lines[:3] + [b"x" + lines[3][1:]] + lines[4:]), first_line=10)
+        self.assertEqual(error.exception.line, 13)
+
+        with self.assertRaises(InvalidRecordLength) as error:
+            vectorized.parse_chunk(b"".join(lines[:5]) + lines[5][:60])
+        self.assertEqual(error.exception.line, 6)
+
+        # Um byte que não é UTF-8 nos nomes, sem alterar a quantidade de caracteres
+        invalid = lines[4].replace("JOÃO MACEDO".encode(), b"JO\xffO MACEDO")
+        with self.assertRaises(InvalidRecord) as error:
+            vectorized.parse_chunk(b"".join(lines[:4] + [invalid] + lines[5:]), first_line=10)
+        self.assertEqual(error.exception.line, 14)
+
+        with override_settings(CNAB_PARSER="numpy"):
+            self.client.force_authenticate(self.user)
+            response = self.client.post(reverse('cnab-upload'), data={
+                "file": SimpleUploadedFile("CNAB.txt", b"".join(lines[:4] + [invalid]), content_type="text/plain")
+            }, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('detail'), "O registro da linha 5 do cnab é inválido.")
+
+    @override_settings(CNAB_PARSER="numpy", CNAB_CHUNK_SIZE=1000)
+    def test_upload_with_vectorized_parser(self):
+        """
+        O upload com o parser vetorizado armazena os mesmos dados e
+        volta para o parser em Python quando o NumPy não está disponível.
+        """
+
+        url = reverse('cnab-upload')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ingestion']['inserted'], 21)
+        self.assertEqual(CNAB.objects.count(), 21)
+
+        CNABUpload.objects.all().delete()
+        self.cnab.seek(0)
+        with mock.patch.object(vectorized, "np", None):
+            response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ingestion']['duplicates'], 21)
+
+        self.cnab.close()
+        self.cnab = open("./apps/cnab/mocks/CNAB_wrong.txt", "rb")
+        response = self.client.post(url, data={"file": self.cnab}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('detail'), "O tamanho de cada linha do cnab deve conter exatamente 81 caracteres.")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CACHES=LOCMEM_CACHE)
+class UploadJobTestCase(APITestCase):
+    """
+    Testes da importação assíncrona de CNAB por meio da fila de jobs.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            name='Fulano',
+            email='fulano@gmail.com',
+            password='django1234'
+        )
+
+        self.client.force_authenticate(self.user)
+
+    def enqueue(self, path):
+        """
+        Envia o arquivo no modo assíncrono e retorna a resposta.
+        """
+
+        with open(path, "rb") as cnab:
+            return self.client.post(f"{reverse('cnab-upload')}?mode=async", data={"file": cnab}, format="multipart")
+
+    def test_async_upload_is_processed_by_worker(self):
+        """
+        O upload assíncrono só enfileira o arquivo e o worker faz a
+        importação, removendo o arquivo ao terminar.
+        """
+
+        response = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['job']['status'], JobStatus.PENDING)
+        self.assertEqual(CNAB.objects.count(), 0)
+
+        url = reverse('job-detail', args=[response.data['job']['id']])
+        path = UploadJob.objects.get().file.path
+        self.assertTrue(os.path.exists(path))
+        call_command("process_cnab_jobs", "--once", stdout=io.StringIO())
+        self.assertIsNone(UploadJob.objects.claim_next())
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(UploadJob.objects.get().file)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], JobStatus.DONE)
+        self.assertEqual(response.data['progress'], 100)
+        self.assertEqual(response.data['total_lines'], 21)
+        self.assertEqual(response.data['inserted'], 21)
+        self.assertEqual(CNAB.objects.count(), 21)
+        self.assertEqual(CNABUpload.objects.get().lines, 21)
+
+        response = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(UploadJob.objects.count(), 1)
+
+    def test_async_upload_of_a_queued_file_returns_the_existing_job(self):
+        """
+        Reenviar um arquivo que ainda está na fila retorna o job existente,
+        sem criar outro. Outro usuário com o mesmo arquivo tem o seu job.
+        """
+
+        first = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        self.assertFalse(first.data['duplicate'])
+
+        response = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertTrue(response.data['duplicate'])
+        self.assertEqual(response.data['job']['id'], first.data['job']['id'])
+        self.assertEqual(UploadJob.objects.count(), 1)
+
+        other = User.objects.create_user(name='Ciclano', email='ciclano@gmail.com', password='django1234')
+        self.client.force_authenticate(other)
+        response = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        self.assertFalse(response.data['duplicate'])
+        self.assertEqual(UploadJob.objects.count(), 2)
+
+    def test_async_upload_with_invalid_file(self):
+        """
+        Um arquivo com linhas inválidas marca o job como falho sem importar
+        nada, mantendo o arquivo.
+        """
+
+        response = self.enqueue("./apps/cnab/mocks/CNAB_wrong.txt")
+        job = UploadJob.objects.claim_next()
+        self.assertEqual(job.pk, response.data['job']['id'])
+        self.assertEqual(job.status, JobStatus.RUNNING)
+
+        process_job(job)
+        response = self.client.get(reverse('job-detail', args=[job.pk]))
+        self.assertEqual(response.data['status'], JobStatus.FAILED)
+        self.assertEqual(response.data['error'], "O tamanho de cada linha do cnab deve conter exatamente 81 caracteres.")
+        self.assertEqual(CNAB.objects.count(), 0)
+        self.assertTrue(os.path.exists(job.file.path))
+        job.file.delete(save=False)
+
+    @override_settings(CNAB_JOB_LEASE=60)
+    def test_job_abandoned_by_a_worker_is_claimed_again(self):
+        """
+        Um job em processamento cujo lease venceu (o worker parou sem
+        terminar) é reservado de novo; com o lease em dia, não.
+        """
+
+        response = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        job = UploadJob.objects.claim_next()
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertIsNone(UploadJob.objects.claim_next())
+
+        UploadJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - datetime.timedelta(seconds=30))
+        self.assertIsNone(UploadJob.objects.claim_next())
+
+        UploadJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - datetime.timedelta(seconds=61))
+        with self.assertLogs("apps.cnab.models", "WARNING"):
+            job = UploadJob.objects.claim_next()
+        self.assertEqual(job.pk, response.data['job']['id'])
+        self.assertEqual(job.status, JobStatus.RUNNING)
+        self.assertIsNone(UploadJob.objects.claim_next())
+
+        job = process_job(job)
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.inserted, 21)
+        self.assertIsNone(UploadJob.objects.claim_next())
+
+    def test_job_of_another_user_is_not_found(self):
+        """
+        Um usuário não pode ver o job de outro usuário.
+        """
+
+        response = self.enqueue("./apps/cnab/mocks/CNAB.txt")
+        other = User.objects.create_user(name='Ciclano', email='ciclano@gmail.com', password='django1234')
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('job-detail', args=[response.data['job']['id']]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FingerprintMigrationTestCase(TransactionTestCase):
+    """
+    Testes da migração que torna a impressão digital das transações única.
+    """
+
+    def tearDown(self):
+        """
+        Volta o banco para a última migração.
+        """
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicated_transactions_are_removed_before_the_unique_index(self):
+        """
+        As transações repetidas inseridas antes da deduplicação são
+        removidas, mantendo a primeira, e o livro de saldos é recalculado.
+        """
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([("cnab", "0010_cnab_fingerprint")])
+        apps = executor.loader.project_state([("cnab", "0010_cnab_fingerprint")]).apps
+        user = apps.get_model("accounts", "User").objects.create(name="Fulano", email="fulano@gmail.com", password="x")
+        Store = apps.get_model("cnab", "Store")
+        HistoricalCNAB = apps.get_model("cnab", "CNAB")
+        store = Store.objects.create(
+            user=user, title="BAR DO JOÃO", cpf="096.206.760-17", owner="JOÃO MACEDO",
+            transactions_count=4, credit_total=Decimal("426"), debit_total=Decimal("10")
+        )
+        other = Store.objects.create(
+            user=user, title="MERCADO DA AVENIDA", cpf="556.418.150-63", owner="JOSÉ COSTA",
+            transactions_count=1, credit_total=Decimal("5")
+        )
+
+        def create(store, signal, value, hour=15):
+            return HistoricalCNAB.objects.create(
+                store=store, transaction_type="Débito", transaction_signal=signal,
+                date=datetime.date(2019, 3, 1), time=datetime.time(hour, 34, 53),
+                value=Decimal(value), card="1234****3153"
+            )
+
+        first = create(store, "+", "142")
+        create(store, "+", "142")
+        create(store, "+", "142")
+        debit = create(store, "-", "10")
+        single = create(other, "+", "5")
+
+        executor.loader.build_graph()
+        executor.migrate([("cnab", "0012_alter_cnab_fingerprint")])
+
+        self.assertEqual(
+            set(HistoricalCNAB.objects.values_list("id", flat=True)),
+            {first.id, debit.id, single.id}
+        )
+        store.refresh_from_db()
+        self.assertEqual(store.transactions_count, 2)
+        self.assertEqual(store.credit_total, Decimal("142"))
+        self.assertEqual(store.debit_total, Decimal("10"))
+        other.refresh_from_db()
+        self.assertEqual(other.transactions_count, 1)
+        self.assertEqual(other.credit_total, Decimal("5"))
+
+    def test_store_per_user_is_irreversible_with_shared_titles(self):
+        """
+        A migração das lojas por usuário só é desfeita enquanto nenhum
+        título de loja se repete entre usuários.
+        """
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([("cnab", "0016_store_unique_per_user")])
+        apps = executor.loader.project_state([("cnab", "0016_store_unique_per_user")]).apps
+        HistoricalUser = apps.get_model("accounts", "User")
+        Store = apps.get_model("cnab", "Store")
+        for email in ("fulano@gmail.com", "ciclano@gmail.com"):
+            user = HistoricalUser.objects.create(name="Fulano", email=email, password="x")
+            Store.objects.create(user=user, title="BAR DO JOÃO", cpf="096.206.760-17", owner="JOÃO MACEDO")
+
+        executor.loader.build_graph()
+        with self.assertRaisesMessage(IrreversibleError, "BAR DO JOÃO pertencem a mais de um usuário"):
+            executor.migrate([("cnab", "0015_cnab_upload_per_user")])
+
+        Store.objects.filter(user__email="ciclano@gmail.com").update(title="BAR DO CICLANO")
+        executor.loader.build_graph()
+        executor.migrate([("cnab", "0015_cnab_upload_per_user")])
+        self.assertEqual(Store.objects.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ParallelIngestionTestCase(APITestCase):
+    """
+    Testes da ingestão paralela por shards do arquivo de CNAB.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            name='Fulano',
+            email='fulano@gmail.com',
+            password='django1234'
+        )
+
+        with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+            self.content = cnab.read()
+
+    def write(self, content):
+        """
+        Grava o conteúdo em um arquivo temporário e retorna o caminho.
+        """
+
+        file = tempfile.NamedTemporaryFile(suffix=".txt", delete=False)
+        file.write(content)
+        file.close()
+        self.addCleanup(os.remove, file.name)
+
+        return file.name
+
+    def test_split_file_on_record_boundaries(self):
+        """
+        Os shards começam sempre no início de um registro e cobrem o arquivo inteiro.
+        """
+
+        path = self.write(self.content)
+        for shards in (1, 2, 5, 21, 50):
+            bounds = split_file(path, shards)
+            self.assertLessEqual(len(bounds), shards)
+            self.assertEqual(bounds[0][0], 0)
+            self.assertEqual(bounds[-1][1], len(self.content))
+            lines = [line for start, end in bounds for line in iter_shard(path, start, end)]
+            self.assertEqual(lines, self.content.splitlines(True))
+
+    def test_parallel_ingestion(self):
+        """
+        A ingestão por shards cria cada loja uma única vez e mantém a deduplicação.
+        """
+
+        path = self.write(self.content + self.content)
+        stats = ParallelIngestion(self.user, workers=4, batch_size=5).run(path)
+        self.assertEqual(stats['lines'], 42)
+        self.assertEqual(stats['inserted'], 21)
+        self.assertEqual(stats['duplicates'], 21)
+        self.assertEqual(stats['stores_created'], Store.objects.count())
+        self.assertEqual(CNAB.objects.count(), 21)
+
+    def test_parallel_ingestion_uses_the_stores_of_the_user(self):
+        """
+        A ingestão por shards resolve as lojas pelo usuário e pelo título.
+        """
+
+        path = self.write(self.content)
+        ParallelIngestion(self.user, workers=4, batch_size=5).run(path)
+        other = User.objects.create_user(name='Ciclano', email='ciclano@gmail.com', password='django1234')
+        stats = ParallelIngestion(other, workers=4, batch_size=5).run(path)
+        self.assertEqual(stats['inserted'], 21)
+        self.assertEqual(stats['stores_created'], Store.objects.filter(user=self.user).count())
+        self.assertEqual(CNAB.objects.filter(store__user=self.user).count(), 21)
+        self.assertEqual(CNAB.objects.filter(store__user=other).count(), 21)
+
+    def test_parallel_ingestion_reports_global_line(self):
+        """
+        O erro aponta a linha do arquivo, e não a linha dentro do shard,
+        e nada é gravado.
+        """
+
+        lines = self.content.splitlines(True)
+        lines[14] = b"0" + lines[14][1:]
+        path = self.write(b"".join(lines))
+        with self.assertRaises(GenericException) as error:
+            ParallelIngestion(self.user, workers=4).run(path)
+
+        self.assertEqual(error.exception.detail, "O registro da linha 15 do cnab é inválido.")
+        self.assertEqual(Store.objects.count(), 0)
+
+    def test_only_stores_inserted_are_counted(self):
+        """
+        As lojas criadas ao mesmo tempo por outra ingestão não são contadas.
+        """
+
+        Store.objects.create(user=self.user, title="BAR DO JOÃO", cpf="096.206.760-17", owner="JOÃO MACEDO")
+        created = create_stores(self.user, [
+            Store(user=self.user, title="BAR DO JOÃO", cpf="096.206.760-17", owner="JOÃO MACEDO"),
+            Store(user=self.user, title="LOJA DO Ó - MATRIZ", cpf="232.702.980-56", owner="MARIA JOSEFINA")
+        ], batch_size=10)
+        self.assertEqual(created, 1)
+        self.assertEqual(Store.objects.count(), 2)
+
+    @override_settings(CNAB_WORKERS=3, CNAB_PARALLEL_MIN_SIZE=0, FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_only_the_job_worker_uses_parallel_ingestion(self):
+        """
+        Os uploads síncronos são ingeridos no processo da requisição, mesmo
+        grandes; os arquivos grandes da fila são ingeridos em paralelo pelo worker.
+        """
+
+        self.client.force_authenticate(self.user)
+        with mock.patch("apps.cnab.jobs.ParallelIngestion", wraps=ParallelIngestion) as parallel:
+            with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+                response = self.client.post(reverse('cnab-upload'), data={"file": cnab}, format="multipart")
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('workers', response.data['ingestion'])
+            self.assertEqual(response.data['ingestion']['inserted'], 21)
+
+            other = User.objects.create_user(name='Ciclano', email='ciclano@gmail.com', password='django1234')
+            self.client.force_authenticate(other)
+            with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+                self.client.post(f"{reverse('cnab-upload')}?mode=async", data={"file": cnab}, format="multipart")
+
+            job = process_job(UploadJob.objects.claim_next())
+
+        parallel.assert_called_once_with(other)
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.inserted, 21)
+        self.assertEqual(CNAB.objects.count(), 42)
+
+    @skipUnless(sys.version_info >= (3, 7), "O ProcessPoolExecutor aceita mp_context a partir do Python 3.7.")
+    def test_process_pool_is_created_with_fork(self):
+        """
+        O pool de processos usa explicitamente o contexto fork, independente
+        do método padrão da plataforma.
+        """
+
+        with mock.patch("apps.cnab.parallel.connection") as database, \
+                mock.patch("apps.cnab.parallel.ProcessPoolExecutor") as pool:
+            database.vendor = "postgresql"
+            ParallelIngestion(self.user, workers=2).executor()
+
+        self.assertEqual(pool.call_args[1]["max_workers"], 2)
+        self.assertEqual(pool.call_args[1]["mp_context"].get_start_method(), "fork")
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StoreListTestCase(APITestCase):
+    """
+    Testes da listagem de lojas com saldo calculado no banco.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            name='Fulano',
+            email='fulano@gmail.com',
+            password='django1234'
+        )
+
+        self.client.force_authenticate(self.user)
+        with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+            self.client.post(reverse('cnab-upload'), data={"file": cnab}, format="multipart")
+
+    def test_totals_are_computed_in_the_database(self):
+        """
+        O saldo anotado pelo banco é igual ao calculado a partir das transações.
+        """
+
+        signal_map = {"+": 1, "-": -1}
+        for store in Store.objects.with_totals():
+            expected = sum(cnab.value * signal_map[cnab.transaction_signal] for cnab in store.cnabs.all())
+            self.assertEqual(round(float(store.total), 2), round(float(expected), 2))
+
+        response = self.client.get(reverse('cnab-stores'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        totals = {store['title']: store['total'] for store in response.data['results']}
+        self.assertEqual(totals['BAR DO JOÃO'], -102.0)
+        self.assertEqual(totals['MERCADO DA AVENIDA'], 489.2)
+
+    def test_order_and_filter_stores_by_total(self):
+        """
+        A ordenação e o filtro por saldo são feitos no servidor.
+        """
+
+        response = self.client.get(reverse('cnab-stores'), data={"ordering": "-total"})
+        totals = [store['total'] for store in response.data['results']]
+        self.assertEqual(totals, sorted(totals, reverse=True))
+
+        response = self.client.get(reverse('cnab-stores'), data={"min_total": "0", "ordering": "total"})
+        totals = [store['total'] for store in response.data['results']]
+        self.assertTrue(totals)
+        self.assertTrue(all(total >= 0 for total in totals))
+        self.assertEqual(totals, sorted(totals))
+
+        response = self.client.get(reverse('cnab-stores'), data={"ordering": "saldo"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_balance_ledger_is_maintained_by_ingestion(self):
+        """
+        A ingestão mantém o livro de saldos igual ao calculado pelas transações,
+        inclusive ao reenviar o arquivo.
+        """
+
+        with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+            self.client.post(reverse('cnab-upload'), data={"file": cnab}, format="multipart")
+
+        self.assertFalse(Store.objects.with_balance_mismatches().exists())
+        self.assertEqual(sum(Store.objects.values_list("transactions_count", flat=True)), 21)
+        store = Store.objects.get(title="MERCADO DA AVENIDA")
+        self.assertEqual(float(store.balance), 489.2)
+        call_command("cnab_balances", stdout=io.StringIO())
+
+    def test_rebuild_balance_ledger(self):
+        """
+        O comando de verificação acusa divergências e o --rebuild as corrige.
+        """
+
+        Store.objects.update(transactions_count=0, credit_total=0, debit_total=0)
+        with self.assertRaises(CommandError):
+            call_command("cnab_balances", stdout=io.StringIO())
+
+        call_command("cnab_balances", "--rebuild", stdout=io.StringIO())
+        self.assertFalse(Store.objects.with_balance_mismatches().exists())
+        self.assertEqual(float(Store.objects.get(title="BAR DO JOÃO").balance), -102.0)
+
+    def test_transactions_keyset_pagination(self):
+        """
+        A listagem de transações percorre todas as páginas pelo cursor,
+        na ordem de data, hora e id, sem repetir nem pular transações.
+        """
+
+        expected = list(CNAB.objects.values_list("id", flat=True))
+        url = reverse('cnab-transactions') + "?limit=4"
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 4)
+            ids += [cnab['id'] for cnab in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), 21)
+
+        response = self.client.get(reverse('cnab-transactions'), {"cursor": "invalido"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('detail'), "Cursor inválido.")
+
+        # O primeiro campo tem um limite simples, que permite percorrer o índice a partir do cursor
+        paginator = KeysetPagination()
+        paginator.fields = CNAB._meta.ordering
+        date, time = datetime.date(2019, 3, 1), datetime.time(15, 34, 53)
+        condition = Q(date__lte=date) & (
+            Q(date__lt=date) | Q(date=date, time__lt=time) | Q(date=date, time=time, id__lt=7)
+        )
+        self.assertEqual(
+            str(CNAB.objects.filter(paginator.after(CNAB, ["2019-03-01", "15:34:53", "7"])).query),
+            str(CNAB.objects.filter(condition).query)
+        )
+
+    def test_filter_transactions(self):
+        """
+        As transações são filtradas por loja, período, tipo e cartão.
+        """
+
+        url = reverse('cnab-transactions')
+        cnab = CNAB.objects.select_related("store").first()
+        filters = {
+            "store": ({"store": cnab.store.title}, {"store": cnab.store}),
+            "date": ({"date_from": cnab.date, "date_to": cnab.date}, {"date": cnab.date}),
+            "transaction_type": ({"transaction_type": cnab.transaction_type}, {"transaction_type": cnab.transaction_type}),
+            "card": ({"card": cnab.card}, {"card": cnab.card})
+        }
+        for name, (params, lookup) in filters.items():
+            with self.subTest(name):
+                response = self.client.get(url, dict(params, limit=100))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    [item['id'] for item in response.data['results']],
+                    list(CNAB.objects.filter(**lookup).values_list("id", flat=True))
+                )
+
+        response = self.client.get(url, {"date_from": "01/03/2019"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reads_are_scoped_to_the_user(self):
+        """
+        Cada usuário lista apenas as suas lojas e transações.
+        """
+
+        other = User.objects.create_user(name='Ciclano', email='ciclano@gmail.com', password='django1234')
+        store = Store.objects.create(user=other, title="LOJA DO CICLANO", cpf="000.000.000-00", owner="CICLANO")
+        CNAB.objects.create(
+            store=store, transaction_type=TransactionType.CREDIT, transaction_signal="+",
+            date=datetime.date(2019, 3, 1), time=datetime.time(10), value=10, card="1234****6678",
+            fingerprint="0" * 40
+        )
+
+        response = self.client.get(reverse('cnab-stores'))
+        titles = {store['title'] for store in response.data['results']}
+        self.assertNotIn("LOJA DO CICLANO", titles)
+        self.assertEqual(len(titles), Store.objects.filter(user=self.user).count())
+
+        response = self.client.get(reverse('cnab-transactions'), {"limit": 100})
+        self.assertEqual(len(response.data['results']), 21)
+
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('cnab-stores'))
+        self.assertEqual([store['title'] for store in response.data['results']], ["LOJA DO CICLANO"])
+
+    def test_conditional_get_of_cached_stores(self):
+        """
+        A listagem de lojas envia o ETag e responde 304 sem consultar o
+        banco enquanto nenhuma importação alterar os dados do usuário.
+        """
+
+        url = reverse('cnab-stores')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["ETag"], etag)
+
+        line = "3201903010000014200096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n"
+        file = SimpleUploadedFile("CNAB.txt", line.replace("14200", "14300").encode(), content_type="text/plain")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('cnab-upload'), data={"file": file}, format="multipart")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        totals = {store['title']: store['total'] for store in response.data['results']}
+        self.assertEqual(totals['BAR DO JOÃO'], -245.0)
+
+    def test_store_fragments_are_reused_until_the_store_changes(self):
+        """
+        A listagem reaproveita a representação em cache das lojas e
+        carrega os CNABs apenas das lojas alteradas pela ingestão.
+        """
+
+        stores = Store.objects.of_user(self.user).with_totals()
+        results = StoreSerializer(stores, many=True).data
+        with self.assertNumQueries(1):
+            self.assertEqual(StoreSerializer(stores.all(), many=True).data, results)
+
+        line = "3201903010000014300096206760174753****3153153453JOÃO MACEDO   BAR DO JOÃO       \n".encode()
+        CNABIngestion(self.user).run([parse_record(line)])
+
+        with self.assertNumQueries(2):
+            updated = StoreSerializer(stores.all(), many=True).data
+
+        for before, after in zip(results, updated):
+            if before['title'] == "BAR DO JOÃO":
+                self.assertEqual(after['total'], -245.0)
+                self.assertEqual(len(after['cnabs']), len(before['cnabs']) + 1)
+            else:
+                self.assertEqual(after, before)
+
+    def test_fast_json_renderer(self):
+        """
+        O renderer com orjson gera o mesmo JSON do módulo json da
+        biblioteca padrão, usado quando o orjson não está instalado.
+        """
+
+        data = {"total": Decimal("10.50"), "date": datetime.date(2019, 3, 1), "title": "BAR DO JOÃO"}
+        fast = FastJSONRenderer().render(data)
+        with mock.patch.object(renderers, "orjson", None):
+            fallback = FastJSONRenderer().render(data)
+
+        self.assertEqual(json.loads(fast), json.loads(fallback))
+        self.assertEqual(json.loads(fallback), {"total": 10.5, "date": "2019-03-01", "title": "BAR DO JOÃO"})
+
+        response = self.client.get(reverse('cnab-stores'))
+        self.assertEqual(json.loads(response.content)['results'], response.data['results'])
+
+    def test_ndjson_streaming_listings(self):
+        """
+        Com ?format=ndjson as listagens são enviadas aos poucos, um
+        objeto JSON por linha.
+        """
+
+        response = self.client.get(reverse('cnab-stores'))
+        stores = response.data['results']
+
+        response = self.client.get(reverse('cnab-stores'), {"format": "ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], stores)
+
+        response = self.client.get(reverse('cnab-transactions'), {"format": "ndjson", "store": "BAR DO JOÃO"})
+        lines = b"".join(response.streaming_content).splitlines()
+        self.assertEqual(
+            [json.loads(line)['id'] for line in lines],
+            list(CNAB.objects.filter(store__title="BAR DO JOÃO").values_list("id", flat=True))
+        )
+
+    def test_export_transactions_to_csv(self):
+        """
+        A exportação gera o CSV aos poucos, compactado ou não, pelo
+        endpoint e pelo comando export_cnab.
+        """
+
+        response = self.client.get(reverse('cnab-export'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content)
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0][:2], ["id", "loja"])
+        self.assertEqual(len(rows), 22)
+        row = next(row for row in rows[1:] if row[1] == "BAR DO JOÃO" and row[7] == "15:34:53")
+        self.assertEqual(row[4:10], ["Financiamento", "-", "2019-03-01", "15:34:53", "142.00", "4753****3153"])
+
+        response = self.client.get(reverse('cnab-export'), {"gzip": "true", "store": "BAR DO JOÃO"})
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        rows = list(csv.reader(io.StringIO(gzip.decompress(b"".join(response.streaming_content)).decode())))
+        self.assertEqual(len(rows), 4)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "transacoes.csv.gz")
+            call_command("export_cnab", "--gzip", "--output", path, "--user", self.user.email)
+            with gzip.open(path, "rb") as exported:
+                self.assertEqual(exported.read(), content)
+
+    def test_export_negotiates_csv_by_accept_header(self):
+        """
+        A exportação aceita Accept: text/csv e Accept: application/gzip, e
+        os erros são respondidos no formato aceito.
+        """
+
+        response = self.client.get(reverse('cnab-export'), HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(len(list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))), 22)
+
+        response = self.client.get(reverse('cnab-export'), {"store": "BAR DO JOÃO"}, HTTP_ACCEPT="application/gzip")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(len(gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()), 4)
+
+        response = self.client.get(reverse('cnab-export'), {"date_from": "data"}, HTTP_ACCEPT="text/csv")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(next(csv.reader(io.StringIO(response.content.decode()))), ["detail"])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class AsyncUploadTestCase(TransactionTestCase):
+    """
+    Testes do upload assíncrono pela aplicação ASGI. O processamento roda
+    em outra thread e por isso precisa de dados confirmados no banco.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            name='Fulano',
+            email='fulano@gmail.com',
+            password='django1234'
+        )
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    async def request(self, method, headers=(), body=b""):
+        """
+        Envia uma requisição para a aplicação ASGI e retorna o status e o corpo.
+        """
+
+        communicator = ApplicationCommunicator(application, {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": reverse('cnab-upload-async'),
+            "query_string": b"",
+            "headers": [(b"host", b"testserver")] + list(headers),
+        })
+        await communicator.send_input({"type": "http.request", "body": body})
+        start = await communicator.receive_output(timeout=30)
+        content = await communicator.receive_output(timeout=30)
+
+        return start["status"], content["body"]
+
+    def post(self, *headers):
+        """
+        Envia o CNAB de exemplo em um formulário multipart.
+        """
+
+        with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+            body = encode_multipart(BOUNDARY, {"file": SimpleUploadedFile("CNAB.txt", cnab.read())})
+
+        headers += (
+            (b"content-type", MULTIPART_CONTENT.encode()),
+            (b"content-length", str(len(body)).encode()),
+        )
+
+        return async_to_sync(self.request)("POST", headers, body)
+
+    def test_async_upload(self):
+        """
+        O upload assíncrono passa pela view do upload síncrono (autenticação,
+        permissões e tratamento de exceções do DRF) e responde igual a ele.
+        """
+
+        code, content = self.post()
+        self.assertEqual(code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(json.loads(content), self.client.post(reverse('cnab-upload')).json())
+        self.assertEqual(CNAB.objects.count(), 0)
+
+        code, content = self.post((b"authorization", f"Bearer {self.token}".encode()))
+        self.assertEqual(code, status.HTTP_200_OK)
+        data = json.loads(content)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['ingestion']['inserted'], 21)
+        self.assertEqual(CNAB.objects.count(), 21)
+        self.assertEqual(Store.objects.filter(user=self.user).count(), 5)
+
+        code, content = async_to_sync(self.request)("GET", [(b"authorization", f"Bearer {self.token}".encode())])
+        self.assertEqual(code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MetricsTestCase(APITestCase):
+    """
+    Testes das métricas expostas no formato do Prometheus.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            name='Fulano',
+            email='fulano@gmail.com',
+            password='django1234'
+        )
+        self.staff = User.objects.create_superuser(
+            name='Admin',
+            email='admin@gmail.com',
+            password='django1234'
+        )
+
+    def scrape(self):
+        """
+        Busca as métricas como staff e retorna as amostras: {nome{labels}: valor}.
+        """
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+
+        return dict(
+            line.rsplit(" ", 1) for line in response.content.decode().splitlines()
+            if not line.startswith("#")
+        )
+
+    def test_metrics_are_staff_only(self):
+        """
+        Apenas usuários staff autenticados acessam as métricas.
+        """
+
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_upload_updates_metrics(self):
+        """
+        O upload atualiza os contadores da ingestão, o tamanho dos arquivos
+        e a latência por view.
+        """
+
+        before = self.scrape()
+        self.client.force_authenticate(self.user)
+        with open("./apps/cnab/mocks/CNAB.txt", "rb") as cnab:
+            self.client.post(reverse('cnab-upload'), data={"file": cnab}, format="multipart")
+
+        after = self.scrape()
+
+        def delta(sample):
+            return float(after[sample]) - float(before.get(sample, 0))
+
+        self.assertEqual(delta('cnab_uploads_total{result="ingested"}'), 1)
+        self.assertEqual(delta("cnab_lines_total"), 21)
+        self.assertEqual(delta("cnab_transactions_inserted_total"), 21)
+        self.assertEqual(delta('cnab_upload_bytes_bucket{le="10240"}'), 1)
+        self.assertEqual(delta('cnab_store_fragments_total{result="miss"}'), 5)
+        self.assertEqual(delta('cnab_ingestion_seconds_count{source="upload"}'), 1)
+        self.assertEqual(
+            delta('http_request_duration_seconds_count{view="cnab-upload",method="POST",status="200"}'), 1
+        )
+
+    def test_metrics_are_aggregated_across_processes(self):
+        """
+        Com METRICS_DIR as métricas gravadas por outros processos são somadas.
+        """
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            own = float(self.scrape().get("cnab_lines_total", 0))
+            with open(os.path.join(directory, "metrics-999999.json"), "w") as other:
+                json.dump({
+                    "cnab_lines_total": [[[], 100]],
+                    "cnab_ingestion_rows_per_second": [[["other"], [50.0, 0]]],
+                    "unknown_metric": [[[], 1]]
+                }, other)
+
+            samples = self.scrape()
+            self.assertTrue(os.path.exists(os.path.join(directory, f"metrics-{os.getpid()}.json")))
+
+        self.assertEqual(float(samples["cnab_lines_total"]), own + 100)
+        self.assertEqual(float(samples['cnab_ingestion_rows_per_second{source="other"}']), 50.0)
+        self.assertNotIn("unknown_metric", samples)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class GeneratorTestCase(APITestCase):
+    """
+    Testes do gerador de CNAB sintético e do benchmark da importação.
+    """
+
+    def setUp(self):
+        """
+        Roda antes de cada método.
+        """
+
+        cache.clear()
+
+    def test_generated_records_are_valid(self):
+        """
+        As linhas geradas têm 81 bytes, são aceitas pelo parser e seguem a
+        quantidade de lojas, a proporção de tipos e a semente.
+        """
+
+        lines = list(generate_records(2000, stores=3, types=parse_type_mix("1=3,4=1"), seed=7))
+        self.assertEqual(len(lines), 2000)
+        self.assertEqual({len(line) for line in lines}, {81})
+        self.assertEqual(lines, list(generate_records(2000, stores=3, types={"1": 3, "4": 1}, seed=7)))
+
+        records = [parse_record(line) for line in lines]
+        self.assertEqual({record["store"] for record in records}, {"LOJA 0001", "LOJA 0002", "LOJA 0003"})
+        types = [record["transaction_type"] for record in records]
+        self.assertEqual(set(types), {TransactionType.DEBIT.value, TransactionType.CREDIT.value})
+        self.assertGreater(types.count(TransactionType.DEBIT.value), 1300)
+        self.assertEqual(len(set(lines)), 2000)
+
+        with self.assertRaises(ValueError):
+            parse_type_mix("0=1")
+
+        with self.assertRaises(ValueError):
+            list(generate_records(1, prefix="UM NOME DE LOJA LONGO"))
+
+    def test_generated_duplicates_are_skipped_by_ingestion(self):
+        """
+        O arquivo gerado pelo comando generate_cnab é importado pelo upload,
+        com as linhas duplicadas ignoradas.
+        """
+
+        user = User.objects.create_user(name='Fulano', email='fulano@gmail.com', password='django1234')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "CNAB.txt")
+            call_command("generate_cnab", "--lines", "500", "--stores", "4", "--duplicates", "0.2", "--seed", "1", "--output", path)
+            with open(path, "rb") as cnab:
+                unique = len(set(cnab.readlines()))
+
+            self.client.force_authenticate(user)
+            with open(path, "rb") as cnab:
+                response = self.client.post(reverse('cnab-upload'), data={"file": cnab}, format="multipart")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLess(unique, 450)
+        self.assertEqual(response.data['ingestion']['inserted'], unique)
+        self.assertEqual(response.data['ingestion']['duplicates'], 500 - unique)
+        self.assertEqual(Store.objects.count(), 4)
+
+    def test_benchmark_command_writes_json_report(self):
+        """
+        O benchmark grava em JSON as medições de cada tamanho.
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "benchmark.json")
+            call_command(
+                "benchmark_cnab", "--sizes", "100,300", "--stores", "3", "--current-database",
+                "--tracemalloc", "--output", path, stderr=io.StringIO()
+            )
+            with open(path) as output:
+                report = json.load(output)
+
+        self.assertEqual(report["seed"], 42)
+        self.assertEqual([result["lines"] for result in report["results"]], [100, 300])
+        result = report["results"][1]
+        self.assertEqual(result["file_bytes"], 300 * 81)
+        self.assertEqual(result["ingestion"]["inserted"], 300)
+        self.assertGreater(result["parse"]["lines_per_second"], 0)
+        self.assertGreater(result["ingestion"]["queries"], 0)
+        self.assertEqual(set(result["ingestion"]["phases"]), {"parse", "write"})
+        self.assertGreater(result["response"]["bytes"], 0)
+        self.assertGreater(result["memory"]["peak_traced_mb"], 0)
+        self.assertEqual(Store.objects.count(), 6)
@@ -0,0 +1,104 @@
+from rest_framework.views import status
+from shared.exception import GenericException
+from shared.timing import phase
+from .handlers import ReceivedCNAB
+from .jobs import enqueue
+from .metrics import UPLOADS, UPLOAD_BYTES, record_ingestion
+from .models import Store, CNABUpload
+from .reader import read_records, validate_content_type, fingerprint
+from .serializers import StoreSerializer, UploadJobSerializer, CNABUploadSerializer
+from .staging import get_ingestion
+
+
+def represent_stores(user, store_ids=None):
+    """
+    Formata os dados de saída: lojas do usuário com o saldo calculado no
+    banco, montadas a partir dos fragmentos em cache, e os CNABs apenas
+    das lojas alteradas. Com store_ids, apenas essas lojas.
+    """
+
+    stores = Store.objects.of_user(user).with_totals()
+    if store_ids is not None:
+        stores = stores.filter(id__in=store_ids)
+
+    return StoreSerializer(stores, many=True).data
+
+
+def ingest_file(user, file):
+    """
+    Ingere o arquivo enviado e retorna as estatísticas e os ids das
+    lojas do arquivo. A ingestão é feita no próprio processo da
+    requisição; a ingestão paralela fica restrita ao worker de importação
+    (?mode=async), para não criar processos dentro do servidor web.
+    """
+
+    ingestion = get_ingestion(user)
+    stats = ingestion.run(read_records(file))
+
+    record_ingestion(stats, "upload")
+
+    return stats, ingestion.store_ids
+
+
+def handle_upload(user, file, params):
+    """
+    Extrai os dados do CNAB e armazena no banco, retornando os dados e o
+    status da resposta. Com mode=async o arquivo é apenas armazenado e
+    importado por um worker, a não ser que o usuário já tenha enviado o
+    mesmo arquivo e ele ainda esteja na fila. Um arquivo idêntico a outro
+    já importado pelo usuário é respondido pelo registro de uploads, sem
+    ler as suas linhas. A resposta
+    traz apenas as lojas do arquivo, ou todas as lojas do usuário com full=true.
+    O arquivo já ingerido durante o recebimento (ReceivedCNAB) é apenas
+    conferido no registro de uploads, pois a sua ingestão foi desfeita se
+    ele já estava registrado.
+    """
+
+    if file is None:
+        raise GenericException("O arquivo de CNAB é obrigatório.", status_code=status.HTTP_400_BAD_REQUEST)
+
+    received = isinstance(file, ReceivedCNAB)
+    if received:
+        sha256 = file.sha256
+    else:
+        with phase("read"):
+            validate_content_type(file)
+            sha256 = fingerprint(file)
+
+    UPLOAD_BYTES.observe(file.size)
+    upload = CNABUpload.objects.filter(user=user, sha256=sha256).first()
+    if upload is not None:
+        UPLOADS.inc(result="duplicate")
+        return (
+            {"success": True, "duplicate": True, "upload": CNABUploadSerializer(upload).data, "results": []},
+            status.HTTP_200_OK
+        )
+
+    if received:
+        ingestion, store_ids = file.stats, file.store_ids
+    elif params.get("mode") == "async":
+        job, created = enqueue(user, file, sha256)
+        UPLOADS.inc(result="queued" if created else "duplicate")
+        return (
+            {"success": True, "duplicate": not created, "job": UploadJobSerializer(job).data},
+            status.HTTP_202_ACCEPTED
+        )
+    else:
+        ingestion, store_ids = ingest_file(user, file)
+
+    upload = CNABUpload.objects.register(user, sha256, file.size, ingestion["lines"])
+    UPLOADS.inc(result="ingested")
+    full = params.get("full", "").lower() in ("true", "1")
+    with phase("serialize"):
+        results = represent_stores(user, None if full else store_ids)
+
+    return (
+        {
+            "success": True,
+            "duplicate": False,
+            "upload": CNABUploadSerializer(upload).data,
+            "ingestion": ingestion,
+            "results": results
+        },
+        status.HTTP_200_OK
+    )
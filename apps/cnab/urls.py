@@ -1,8 +1,12 @@
+from django.urls import path
 from rest_framework import routers
-from . import views
+from . import views, async_views
 
 
 router = routers.SimpleRouter()
+router.register('jobs', views.UploadJobViewSet, basename="job")
 router.register('', views.CNABViewSet, basename="cnab")
 
-urlpatterns = router.urls
+urlpatterns = [
+    path('upload/async/', async_views.upload, name="cnab-upload-async"),
+] + router.urls
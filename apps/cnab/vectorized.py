@@ -0,0 +1,170 @@
+from datetime import time
+from .parser import (
+    OFFSETS, TEXT_START, TEXT_LENGTH, OWNER_LENGTH, TRANSACTIONS,
+    InvalidRecord, InvalidRecordLength
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Quantidade de caracteres de cada registro, incluindo a quebra de linha
+RECORD_LENGTH = TEXT_START + TEXT_LENGTH
+
+NEWLINE = ord("\n")
+ZERO = ord("0")
+
+# Colunas do registro que devem conter apenas dígitos
+DIGIT_COLUMNS = [
+    column
+    for field in ("date", "value", "cpf", "time")
+    for column in range(*OFFSETS[field])
+]
+
+# Cada caractere do CPF formatado (000.000.000-00): a coluna do registro
+# de onde vem o dígito ou o separador fixo
+CPF_FORMAT = (19, 20, 21, ".", 22, 23, 24, ".", 25, 26, 27, "-", 28, 29)
+
+
+def is_available():
+    """
+    Verifica se o NumPy está instalado.
+    """
+
+    return np is not None
+
+
+def _number(matrix, field):
+    """
+    Converte as colunas de dígitos de um campo em um vetor de inteiros.
+    """
+
+    start, end = OFFSETS[field]
+    digits = matrix[:, start:end].astype(np.int64) - ZERO
+    powers = 10 ** np.arange(end - start - 1, -1, -1, dtype=np.int64)
+
+    return digits @ powers
+
+
+def _split(buffer):
+    """
+    Retorna o início e o fim (exclusivo) de cada registro do buffer.
+    """
+
+    ends = np.flatnonzero(buffer == NEWLINE) + 1
+    if not len(ends) or ends[-1] != len(buffer):
+        ends = np.append(ends, len(buffer))
+
+    starts = np.concatenate(([0], ends[:-1]))
+
+    return starts, ends
+
+
+def parse_chunk(data, first_line=1):
+    """
+    Converte um bloco de registros inteiros do CNAB em colunas, validando
+    o tamanho, o tipo de transação e os campos numéricos de todas as
+    linhas de uma vez. O número da primeira linha do bloco é usado
+    apenas nas mensagens de erro.
+    """
+
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    starts, ends = _split(buffer)
+
+    # Quantidade de caracteres UTF-8: bytes que não são de continuação
+    chars = np.add.reduceat(((buffer & 0xC0) != 0x80).astype(np.int64), starts)
+    invalid_length = np.flatnonzero(chars != RECORD_LENGTH)
+    valid = invalid_length[0] if len(invalid_length) else len(starts)
+
+    matrix = buffer[starts[:valid, None] + np.arange(TEXT_START)]
+    codes = matrix[:, 0]
+    digits = matrix[:, DIGIT_COLUMNS]
+    invalid = (
+        (codes < ord("1")) | (codes > ord("9")) |
+        (digits < ZERO).any(axis=1) | (digits > ZERO + 9).any(axis=1) |
+        (matrix >= 0x80).any(axis=1)
+    )
+
+    date = _number(matrix, "date")
+    years, months, days = date // 10000, date // 100 % 100, date % 100
+    clock = _number(matrix, "time")
+    hours, minutes, seconds = clock // 10000, clock // 100 % 100, clock % 100
+    months_since_epoch = ((years - 1970) * 12 + np.clip(months, 1, 12) - 1).astype("datetime64[M]")
+    dates = months_since_epoch.astype("datetime64[D]") + (days - 1)
+    invalid |= (
+        (years < 1) | (months < 1) | (months > 12) | (days < 1) |
+        (dates.astype("datetime64[M]") != months_since_epoch) |
+        (hours > 23) | (minutes > 59) | (seconds > 59)
+    )
+
+    invalid_content = np.flatnonzero(invalid)
+    if len(invalid_content):
+        raise InvalidRecord(line=first_line + int(invalid_content[0]))
+
+    if valid < len(starts):
+        raise InvalidRecordLength(line=first_line + int(valid))
+
+    cpf = np.empty((valid, len(CPF_FORMAT)), dtype=np.uint8)
+    for index, source in enumerate(CPF_FORMAT):
+        cpf[:, index] = ord(source) if isinstance(source, str) else matrix[:, source]
+
+    card_start, card_end = OFFSETS["card"]
+    card = np.ascontiguousarray(matrix[:, card_start:card_end])
+
+    # Os campos anteriores aos nomes são ASCII, então depois de decodificar
+    # o bloco inteiro de uma vez os offsets em caracteres continuam valendo
+    try:
+        text = data.decode()
+    except UnicodeDecodeError as error:
+        raise InvalidRecord(line=first_line + data.count(b"\n", 0, error.start))
+
+    lines = text.split("\n")[:valid]
+    owner_end = TEXT_START + OWNER_LENGTH
+    owners = [line[TEXT_START:owner_end].strip() for line in lines]
+    stores = [line[owner_end:].strip() for line in lines]
+
+    return {
+        "transaction_type": [TRANSACTIONS[code][0] for code in codes.tolist()],
+        "transaction_signal": [TRANSACTIONS[code][1] for code in codes.tolist()],
+        "date": dates,
+        "value": _number(matrix, "value"),
+        "cpf": cpf.view(f"S{len(CPF_FORMAT)}").ravel(),
+        "card": card.view(f"S{card_end - card_start}").ravel(),
+        "time": hours * 3600 + minutes * 60 + seconds,
+        "owner": owners,
+        "store": stores
+    }
+
+
+def iter_column_records(columns):
+    """
+    Converte as colunas de um bloco nos mesmos registros produzidos
+    pelo parse_record. A hora vem em segundos desde a meia-noite.
+    """
+
+    seconds = columns["time"].tolist()
+    fields = zip(
+        columns["transaction_type"],
+        columns["transaction_signal"],
+        columns["date"].tolist(),
+        columns["value"].tolist(),
+        [cpf.decode("ascii") for cpf in columns["cpf"].tolist()],
+        [card.decode("ascii") for card in columns["card"].tolist()],
+        [time(value // 3600, value // 60 % 60, value % 60) for value in seconds],
+        columns["owner"],
+        columns["store"]
+    )
+
+    for transaction_type, signal, date, value, cpf, card, hour, owner, store in fields:
+        yield {
+            "transaction_type": transaction_type,
+            "transaction_signal": signal,
+            "date": date,
+            "value": value,
+            "cpf": cpf,
+            "card": card,
+            "time": hour,
+            "owner": owner,
+            "store": store
+        }
@@ -1,52 +1,151 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework.viewsets import ViewSet
 from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework.views import status
 from rest_framework.response import Response
-from shared.exception import GenericException
+from rest_framework.settings import api_settings
 from drf_spectacular.utils import (
     extend_schema_view, extend_schema, inline_serializer,
-    OpenApiResponse, OpenApiExample
+    OpenApiResponse, OpenApiExample, OpenApiParameter
 )
 from .permissions import RetrieveLoggedPermission
-from .enum import TransactionType, TransactionSignal
-from .serializers import StoreSerializer
-from .models import Store
+from shared.pagination import KeysetPagination
+from shared.renderers import CSVRenderer, GzipCSVRenderer, NDJSONRenderer, stream_ndjson
+from shared.timing import phase
+from .serializers import (
+    StoreSerializer, StoreFilterSerializer, UploadJobSerializer,
+    CNABSerializer, CNABFilterSerializer
+)
+from .ingestion import batched
+from .handlers import parse_on_receive
+from .uploads import handle_upload
+from .cache import cached_response
+from .export import export_csv
+from .models import CNAB, Store, UploadJob
+
+
+STORE_RESPONSE = inline_serializer(
+    name="Response",
+    fields={
+        "title": serializers.CharField(label="Loja", help_text="Nome da loja"),
+        "cpf": serializers.CharField(label="CPF", help_text="CPF do beneficiário"),
+        "owner": serializers.CharField(label="Nome", help_text="Nome do representante da loja"),
+        "total": serializers.CharField(label="Total", help_text="Totalizador do saldo em conta"),
+        "cnabs": inline_serializer(
+            name="CNABs",
+            fields={
+                "transaction_type": serializers.CharField(label="Tipo", help_text="Tipos de transações. Ex: Aluguel"),
+                "transaction_signal": serializers.CharField(label="Sinal", help_text="Sinal de operação da transação. Ex: + ou -"),
+                "date": serializers.CharField(label="Data", help_text="Data da ocorrência da transação"),
+                "value": serializers.CharField(label="Valor", help_text="Valor da movimentação."),
+                "card": serializers.CharField(label="Cartão", help_text="Cartão utilizado na transação"),
+                "time": serializers.CharField(label="Hora da ocorrência", help_text="Hora da ocorrência atendendo ao fuso de UTC-3")
+            }
+        )
+    }
+)
+
+TRANSACTIONS_RESPONSE = inline_serializer(
+    name="Transactions",
+    fields={
+        "success": serializers.BooleanField(label="Sucesso"),
+        "next": serializers.URLField(label="Próxima página", help_text="URL da próxima página ou null na última."),
+        "results": inline_serializer(
+            name="Transaction",
+            many=True,
+            fields={
+                "id": serializers.IntegerField(label="Id"),
+                "store": serializers.CharField(label="Loja", help_text="Nome da loja"),
+                "transaction_type": serializers.CharField(label="Tipo", help_text="Tipos de transações. Ex: Aluguel"),
+                "transaction_signal": serializers.CharField(label="Sinal", help_text="Sinal de operação da transação. Ex: + ou -"),
+                "date": serializers.CharField(label="Data", help_text="Data da ocorrência da transação"),
+                "value": serializers.FloatField(label="Valor", help_text="Valor da movimentação."),
+                "card": serializers.CharField(label="Cartão", help_text="Cartão utilizado na transação"),
+                "time": serializers.CharField(label="Hora da ocorrência", help_text="Hora da ocorrência atendendo ao fuso de UTC-3")
+            }
+        )
+    }
+)
+
+# Renderers das listagens: os padrões da API e o NDJSON enviado aos poucos
+LISTING_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
+
+EXPORT_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + [CSVRenderer, GzipCSVRenderer]
+
+ERROR_RESPONSE = inline_serializer(
+    name="BAD REQUEST",
+    fields={"detail": serializers.CharField(label="Erro", help_text="Mensagem de erro.")}
+)
 
 
 @extend_schema_view(
+    stores=extend_schema(
+        operation_id="Listagem das lojas",
+        description="Endpoint responsável por listar as lojas com o saldo calculado no banco de dados, com filtros e ordenação por saldo.",
+        tags=["CNAB"],
+        parameters=[StoreFilterSerializer],
+        responses={
+            200: OpenApiResponse(response=STORE_RESPONSE, description="OK"),
+            400: OpenApiResponse(response=ERROR_RESPONSE, description="BAD REQUEST")
+        }
+    ),
+    transactions=extend_schema(
+        operation_id="Listagem das transações",
+        description="Endpoint responsável por listar as transações, com filtros e paginação por cursor na ordem de data, hora e id.",
+        tags=["CNAB"],
+        parameters=[
+            CNABFilterSerializer,
+            OpenApiParameter(name="cursor", type=str, description="Cursor da próxima página, retornado no campo next."),
+            OpenApiParameter(name="limit", type=int, description="Quantidade de transações por página.")
+        ],
+        responses={
+            200: OpenApiResponse(response=TRANSACTIONS_RESPONSE, description="OK"),
+            400: OpenApiResponse(response=ERROR_RESPONSE, description="BAD REQUEST")
+        }
+    ),
+    export=extend_schema(
+        operation_id="Exportação das transações",
+        description="Endpoint responsável por exportar em CSV as transações das lojas do usuário, com os mesmos filtros da listagem de transações.",
+        tags=["CNAB"],
+        parameters=[
+            CNABFilterSerializer,
+            OpenApiParameter(name="gzip", type=bool, description="Use true para receber o CSV compactado com gzip.")
+        ],
+        responses={
+            (200, "text/csv"): OpenApiResponse(description="Arquivo CSV."),
+            400: OpenApiResponse(response=ERROR_RESPONSE, description="BAD REQUEST")
+        }
+    ),
     cnab=extend_schema(
         operation_id="Upload do CNAB",
         description="Endpoint responsável por realizar o upload do CNAB e armazenar seus dados no banco de dados.",
         tags=["CNAB"],
+        parameters=[
+            OpenApiParameter(
+                name="mode",
+                description="Use async para apenas enfileirar a importação e receber o id do job.",
+                required=False,
+                type=str,
+                enum=["async"]
+            ),
+            OpenApiParameter(
+                name="full",
+                description="Use true para receber todas as lojas do banco, e não apenas as lojas do arquivo enviado.",
+                required=False,
+                type=bool
+            )
+        ],
         request=inline_serializer(
             name="CNAB",
             fields={"file": serializers.FileField(label="CNAB", help_text="Arquivo de CNAB.")}
         ),
-        responses={200: OpenApiResponse(response=inline_serializer(
-            name="Response",
-            fields={
-                "title": serializers.CharField(label="Loja", help_text="Nome da loja"),
-                "cpf": serializers.CharField(label="CPF", help_text="CPF do beneficiário"),
-                "owner": serializers.CharField(label="Nome", help_text="Nome do representante da loja"),
-                "total": serializers.CharField(label="Total", help_text="Totalizador do saldo em conta"),
-                "cnabs": inline_serializer(
-                    name="CNABs",
-                    fields={
-                        "transaction_type": serializers.CharField(label="Tipo", help_text="Tipos de transações. Ex: Aluguel"),
-                        "transaction_signal": serializers.CharField(label="Sinal", help_text="Sinal de operação da transação. Ex: + ou -"),
-                        "date": serializers.CharField(label="Data", help_text="Data da ocorrência da transação"),
-                        "value": serializers.CharField(label="Valor", help_text="Valor da movimentação."),
-                        "card": serializers.CharField(label="Cartão", help_text="Cartão utilizado na transação"),
-                        "time": serializers.CharField(label="Hora da ocorrência", help_text="Hora da ocorrência atendendo ao fuso de UTC-3")
-                    }
-                )
-            }
-        ), description="OK"),
-        400: OpenApiResponse(response=inline_serializer(
-            name="BAD REQUEST",
-            fields={"detail": serializers.CharField(label="Erro", help_text="Mensagem de erro.")}
-        ), description="BAD REQUEST")},
+        responses={
+            200: OpenApiResponse(response=STORE_RESPONSE, description="OK"),
+            400: OpenApiResponse(response=ERROR_RESPONSE, description="BAD REQUEST")
+        },
         examples=[
             OpenApiExample("Request Ex", value={"file": "..."}, request_only=True),
             OpenApiExample("400", status_codes=["400"], value={
@@ -137,101 +236,150 @@ class CNABViewSet(ViewSet):
     permission_classes = (RetrieveLoggedPermission,)
     serializer_class = StoreSerializer
 
-    def __open_file(self, data):
+    def initial(self, request, *args, **kwargs):
         """
-        Abre o arquivo de CNAB e decodifica as suas linhas.
+        Mede a autenticação, as permissões e a negociação de conteúdo.
         """
 
-        if data['file'].content_type != "text/plain":
-            raise GenericException(
-                "Formato de arquivo inválido, deve ser do tipo text/plain.",
-                status_code=status.HTTP_400_BAD_REQUEST
-            )
-
-        lines = []
-        for line in data['file'].readlines():
-            if len(line.decode()) != 81:
-                raise GenericException(
-                    "O tamanho de cada linha do cnab deve conter exatamente 81 caracteres.",
-                    status_code=status.HTTP_400_BAD_REQUEST
-                )
-
-            lines.append(line.decode())
+        with phase("auth"):
+            super(CNABViewSet, self).initial(request, *args, **kwargs)
 
-        data['file'].close()
+    def __iter_stores(self, stores):
+        """
+        Serializa as lojas lidas do cursor do banco em blocos, para que os
+        fragmentos em cache e os CNABs sejam carregados um bloco por vez.
+        """
 
-        return lines
+        size = settings.CNAB_STREAM_CHUNK_SIZE
+        for chunk in batched(stores.iterator(chunk_size=size), size):
+            yield from StoreSerializer(chunk, many=True).data
 
-    def __extract_data_from_line(self, line):
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path="stores",
+        url_name="stores",
+        renderer_classes=LISTING_RENDERERS
+    )
+    @cached_response
+    def stores(self, request, *args, **kwargs):
         """
-        Extrai os dados por linha.
+        Lista as lojas do usuário com o saldo calculado, filtrado e ordenado
+        no banco. Com ?format=ndjson as lojas são enviadas uma por linha, aos poucos.
         """
 
-        transaction_map = {
-            "1": {"type": TransactionType.DEBIT.value, "signal": TransactionSignal.DEBIT.value},
-            "2": {"type": TransactionType.BILL.value, "signal": TransactionSignal.BILL.value},
-            "3": {"type": TransactionType.FINANCING.value, "signal": TransactionSignal.FINANCING.value},
-            "4": {"type": TransactionType.CREDIT.value, "signal": TransactionSignal.CREDIT.value},
-            "5": {"type": TransactionType.RECEIVEMENT.value, "signal": TransactionSignal.RECEIVEMENT.value},
-            "6": {"type": TransactionType.SALES.value, "signal": TransactionSignal.SALES.value},
-            "7": {"type": TransactionType.TED.value, "signal": TransactionSignal.TED.value},
-            "8": {"type": TransactionType.DOC.value, "signal": TransactionSignal.DOC.value},
-            "9": {"type": TransactionType.RENT.value, "signal": TransactionSignal.RENT.value},
-        }
+        with phase("validate"):
+            filters = StoreFilterSerializer(data=request.query_params)
+            filters.is_valid(raise_exception=True)
 
-        result = {
-            "transaction_type": transaction_map[line[0:1]]["type"],
-            "transaction_signal": transaction_map[line[0:1]]["signal"],
-            "date": f"{line[1:5]}-{line[5:7]}-{line[7:9]}",
-            "value": round(float(line[9:19]) / 100, 2),
-            "cpf": f"{line[19:22]}.{line[22:25]}.{line[25:28]}-{line[28:30]}",
-            "card": line[30:42],
-            "time": f"{line[42:44]}:{line[44:46]}:{line[46:48]}",
-            "owner": line[48:62].strip(),
-            "store": line[62:].strip().replace("\n", "")
-        }
+        stores = filters.filter(Store.objects.of_user(request.user).with_totals())
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            return stream_ndjson(self.__iter_stores(stores))
+
+        with phase("serialize"):
+            results = StoreSerializer(stores, many=True).data
 
-        return result
+        return Response({"success": True, "results": results}, status=status.HTTP_200_OK)
 
-    def __create_stores_and_cnabs(self, user, cnabs):
+    @action(
+        detail=False,
+        methods=['get'],
+        url_path="transactions",
+        url_name="transactions",
+        renderer_classes=LISTING_RENDERERS
+    )
+    @cached_response
+    def transactions(self, request, *args, **kwargs):
         """
-        Cria as lojas e cnabs
+        Lista as transações das lojas do usuário, filtradas e paginadas por
+        cursor em (data, hora, id). Com ?format=ndjson todas as transações
+        filtradas são enviadas uma por linha, sem paginação.
         """
 
-        for cnab in cnabs:
-            serializer = StoreSerializer(data=cnab, context={"user": user})
-            if serializer.is_valid():
-                serializer.save()
+        with phase("validate"):
+            filters = CNABFilterSerializer(data=request.query_params)
+            filters.is_valid(raise_exception=True)
 
-    def __to_representation(self):
+        queryset = filters.filter(CNAB.objects.filter(store__user=request.user).select_related("store"))
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            serializer = CNABSerializer()
+            cnabs = queryset.iterator(chunk_size=settings.CNAB_STREAM_CHUNK_SIZE)
+            return stream_ndjson(serializer.to_representation(cnab) for cnab in cnabs)
+
+        paginator = KeysetPagination()
+        with phase("query"):
+            cnabs = paginator.paginate_queryset(queryset, request, view=self)
+
+        with phase("serialize"):
+            results = CNABSerializer(cnabs, many=True).data
+
+        return paginator.get_paginated_response(results)
+
+    @action(detail=False, methods=['get'], url_path="export", url_name="export", renderer_classes=EXPORT_RENDERERS)
+    def export(self, request, *args, **kwargs):
         """
-        Formata os dados de saída.
+        Exporta em CSV as transações filtradas das lojas do usuário. O
+        arquivo é gerado aos poucos e, com ?gzip=true ou
+        Accept: application/gzip, compactado.
         """
 
-        results = []
-        stores = Store.objects.all()
-        for store in stores:
-            serializer = StoreSerializer()
-            results.append(serializer.to_representation(store))
+        filters = CNABFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        queryset = filters.filter(CNAB.objects.filter(store__user=request.user))
+        compress = request.accepted_renderer.format == GzipCSVRenderer.format
+        if request.query_params.get("gzip", "").lower() in ("true", "1"):
+            compress = True
 
-        return results
+        response = StreamingHttpResponse(
+            export_csv(queryset, compress=compress),
+            content_type="application/gzip" if compress else "text/csv; charset=utf-8"
+        )
+        filename = "transacoes.csv.gz" if compress else "transacoes.csv"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+        return response
 
     @action(detail=False, methods=['post'], url_path="upload", url_name="upload")
     def cnab(self, request, *args, **kwargs):
         """
-        Extrai os dados do CNAB e armazena no banco
+        Extrai os dados do CNAB e armazena no banco. Com ?mode=async o
+        arquivo é apenas armazenado e importado por um worker. Um arquivo
+        idêntico a outro já importado é respondido pelo registro de uploads,
+        sem ler as suas linhas. A resposta traz apenas as lojas do arquivo,
+        ou todas as lojas do usuário com ?full=true. Com CNAB_PARSE_ON_RECEIVE
+        o arquivo é ingerido enquanto é recebido.
         """
 
-        lines = self.__open_file(request.data)
+        with phase("receive"), parse_on_receive(request._request, request.user, request.query_params):
+            file = request.data.get('file')
 
-        cnabs = []
-        for line in lines:
-            data = self.__extract_data_from_line(line)
-            cnabs.append(data)
+        data, code = handle_upload(request.user, file, request.query_params)
 
-        self.__create_stores_and_cnabs(request.user, cnabs)
+        return Response(data, status=code)
 
-        return Response(
-            {"success": True, "results": self.__to_representation()},
-            status=status.HTTP_200_OK
-        )
+
+@extend_schema_view(
+    retrieve=extend_schema(
+        operation_id="Situação do job de importação",
+        description="Endpoint responsável por informar o progresso, as contagens de linhas e os erros de um job de importação de CNAB.",
+        tags=["CNAB"],
+        parameters=[OpenApiParameter(name="id", type=int, location=OpenApiParameter.PATH, description="Id do job.")],
+        responses={200: UploadJobSerializer}
+    )
+)
+class UploadJobViewSet(ViewSet):
+    """
+    View set dos jobs de importação assíncrona de CNAB
+    """
+
+    permission_classes = (RetrieveLoggedPermission,)
+    serializer_class = UploadJobSerializer
+
+    def retrieve(self, request, pk=None):
+        """
+        Retorna a situação de um job do usuário autenticado.
+        """
+
+        job = get_object_or_404(UploadJob, pk=pk, user=request.user)
+
+        return Response(UploadJobSerializer(job).data, status=status.HTTP_200_OK)
@@ -0,0 +1,16 @@
+import os
+from decouple import config
+from .files import BASE_DIR
+
+# Cache das respostas de leitura da API. O backend padrão grava em disco,
+# para ser compartilhado entre os processos da API e o worker de importação
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default="django.core.cache.backends.filebased.FileBasedCache"),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache')),
+    }
+}
+
+# Tempo em segundos que uma resposta fica no cache. A resposta deixa de ser
+# usada antes disso quando uma importação altera os dados do usuário.
+CNAB_CACHE_TIMEOUT = config('CNAB_CACHE_TIMEOUT', default=300, cast=int)
@@ -0,0 +1,44 @@
+from decouple import config
+
+# Quantidade de linhas do CNAB processadas por lote durante a ingestão
+CNAB_BATCH_SIZE = config('CNAB_BATCH_SIZE', default=1000, cast=int)
+
+# Parser usado no upload: "python" (linha a linha) ou "numpy" (vetorizado por
+# bloco). O modo "numpy" é opcional e volta para o parser em Python quando o
+# NumPy não está instalado.
+CNAB_PARSER = config('CNAB_PARSER', default="python")
+
+# Tamanho em bytes de cada bloco lido do arquivo no parser vetorizado
+CNAB_CHUNK_SIZE = config('CNAB_CHUNK_SIZE', default=1024 * 1024, cast=int)
+
+# Motor de ingestão do upload: "orm" (bulk_create em lotes) ou "copy" (tabela
+# temporária carregada com COPY FROM STDIN no PostgreSQL, ou executemany nos
+# demais bancos, e mesclada em store e cnab com SQL sobre o conjunto inteiro)
+CNAB_INGESTION_BACKEND = config('CNAB_INGESTION_BACKEND', default="orm")
+
+# Quantidade de processos usados pelo worker de importação (process_cnab_jobs)
+# para ingerir arquivos grandes em paralelo. Com 1 (padrão) a ingestão é feita
+# no próprio processo do worker. Os uploads síncronos nunca usam processos.
+CNAB_WORKERS = config('CNAB_WORKERS', default=1, cast=int)
+
+# Segundos sem renovação depois dos quais um job em processamento é considerado
+# abandonado (ex: worker encerrado com SIGKILL) e pode ser reservado de novo.
+# O worker renova o lease a cada lote e a cada terço desse tempo.
+CNAB_JOB_LEASE = config('CNAB_JOB_LEASE', default=300, cast=int)
+
+# Tamanho mínimo em bytes para que um arquivo seja ingerido em paralelo
+CNAB_PARALLEL_MIN_SIZE = config('CNAB_PARALLEL_MIN_SIZE', default=50 * 1024 * 1024, cast=int)
+
+# Quantidade de linhas lidas por vez do cursor do banco nas listagens NDJSON
+CNAB_STREAM_CHUNK_SIZE = config('CNAB_STREAM_CHUNK_SIZE', default=2000, cast=int)
+
+# Quantidade de uploads processados ao mesmo tempo por processo no endpoint
+# assíncrono (ASGI). Os demais aguardam a sua vez sem ocupar threads.
+CNAB_ASYNC_UPLOADS = config('CNAB_ASYNC_UPLOADS', default=4, cast=int)
+
+# Ingere o CNAB enquanto o corpo do upload é recebido, sem armazenar o
+# arquivo (CNABUploadHandler). Cada lote é confirmado na sua própria transação.
+CNAB_PARSE_ON_RECEIVE = config('CNAB_PARSE_ON_RECEIVE', default=False, cast=bool)
+
+# Tamanho máximo em bytes do upload ingerido durante o recebimento
+CNAB_UPLOAD_MAX_SIZE = config('CNAB_UPLOAD_MAX_SIZE', default=512 * 1024 * 1024, cast=int)
@@ -1,4 +1,6 @@
+import os
 from decouple import config
+from .files import BASE_DIR
 
 POSTGRES = {
     'default': {
@@ -11,4 +13,13 @@ POSTGRES = {
     }
 }
 
-DATABASES = POSTGRES
+# Banco local em arquivo, ex: para rodar o benchmark_cnab sem o PostgreSQL
+SQLITE = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('SQLITE_PATH', default=os.path.join(BASE_DIR, 'db.sqlite3'))
+    }
+}
+
+# Banco usado pela API: "postgres" (padrão) ou "sqlite"
+DATABASES = SQLITE if config('DATABASE', default="postgres") == "sqlite" else POSTGRES
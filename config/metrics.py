@@ -0,0 +1,9 @@
+from decouple import config
+
+# Diretório compartilhado onde cada processo (workers do gunicorn e worker de
+# importação) grava as suas métricas, somadas em /metrics/. Vazio (padrão)
+# expõe apenas as métricas do processo que atende a requisição.
+METRICS_DIR = config('METRICS_DIR', default="")
+
+# Intervalo em segundos entre as gravações das métricas de cada processo
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=float)
@@ -1,4 +1,8 @@
+from decouple import config
+
 MIDDLEWARE = [
+    # Duração das requisições por view para as métricas (shared.metrics)
+    'shared.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -9,3 +13,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+
+# Mede as fases e as consultas SQL de cada requisição e envia os tempos no
+# cabeçalho Server-Timing e no log (shared.timing). Desativado por padrão.
+if config('SERVER_TIMING', default=False, cast=bool):
+    MIDDLEWARE.insert(0, 'shared.timing.ServerTimingMiddleware')
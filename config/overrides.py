@@ -1,8 +1,13 @@
+from django.http import HttpResponse
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
 from drf_spectacular.views import SpectacularYAMLAPIView
 from drf_spectacular.utils import extend_schema, inline_serializer, OpenApiResponse, OpenApiExample
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework import serializers
+from rest_framework.views import APIView
+from shared.metrics import CONTENT_TYPE, registry
+from shared.permissions import StaffPermission
 
 
 class CustomTokenSerializer(TokenObtainPairSerializer):
@@ -13,6 +18,14 @@ class CustomTokenSerializer(TokenObtainPairSerializer):
     default_error_messages = {'no_active_account': "Nenhuma conta ativa encontrada com as credenciais fornecidas"}
 
 
+class CachedJWTScheme(SimpleJWTScheme):
+    """
+    Documenta a autenticação JWT com cache de usuários como a do simplejwt.
+    """
+
+    target_class = 'apps.accounts.authentication.CachedJWTAuthentication'
+
+
 class ExcludedSpectacularYAMLAPIView(SpectacularYAMLAPIView):
     """
     Remove o endpoint schema/ da documentação redoc.
@@ -84,3 +97,19 @@ class AccessTokenRefreshView(TokenRefreshView):
         """
 
         return super(AccessTokenRefreshView, self).post(request, *args, **kwargs)
+
+
+class MetricsView(APIView):
+    """
+    Métricas de todos os processos no formato do Prometheus, apenas para staff.
+    """
+
+    permission_classes = (StaffPermission,)
+
+    @extend_schema(exclude=True)
+    def get(self, request, *args, **kwargs):
+        """
+        Exposição das métricas.
+        """
+
+        return HttpResponse(registry.expose(), content_type=CONTENT_TYPE)
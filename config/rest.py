@@ -1,9 +1,15 @@
 import datetime
+from decouple import config
 
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.accounts.authentication.CachedJWTAuthentication',
+    ),
+    # O FastJSONRenderer usa o orjson quando ele está instalado
+    'DEFAULT_RENDERER_CLASSES': (
+        'shared.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'EXCEPTION_HANDLER': 'config.exception.custom_exception_handler',
@@ -20,6 +26,13 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',)
 }
 
+# Cache em memória dos usuários autenticados pelo JWT: tempo de expiração
+# em segundos (0 desativa) e quantidade máxima de tokens por processo. As
+# alterações feitas sem os signals do model (ex: QuerySet.update) só são
+# vistas pelos processos depois desse tempo
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=1024, cast=int)
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'ByCoders CNAB API',
     'DESCRIPTION': 'API do desafio ByCoders',
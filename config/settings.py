@@ -8,6 +8,9 @@ from .secrets import *
 from .lang import *
 from .rest import *
 from .files import *
+from .cnab import *
+from .cache import *
+from .metrics import *
 from decouple import config
 
 DEBUG = config('ENVIRONMENT', default="development") == "development"
@@ -4,7 +4,7 @@ from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularRedocView
 from .overrides import (
     ExcludedSpectacularYAMLAPIView, TokenView,
-    AccessTokenRefreshView
+    AccessTokenRefreshView, MetricsView
 )
 
 
@@ -13,7 +13,8 @@ urlpatterns = [
     path('schema/', ExcludedSpectacularYAMLAPIView.as_view(), name='schema'),
     path('auth/', TokenView.as_view(), name='token_obtain_pair'),
     path('auth/refresh/', AccessTokenRefreshView.as_view(), name='token_refresh'),
-    path('cnab/', include('apps.cnab.urls'))
+    path('cnab/', include('apps.cnab.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics')
 ]
 
 if settings.DEBUG:
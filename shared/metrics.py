@@ -0,0 +1,388 @@
+import abc
+import atexit
+import glob
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+
+# Content-Type do formato de texto do Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Faixas, em segundos, dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_value(value):
+    """
+    Formata um valor no formato de texto do Prometheus.
+    """
+
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values, extra=()):
+    """
+    Formata os labels de uma amostra. Ex: {method="GET",view="cnab-stores"}
+    """
+
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in pairs
+    )
+
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metric(abc.ABC):
+    """
+    Métrica do registro, com um valor por combinação de labels. Cada
+    tipo de métrica define como combinar os valores dos processos.
+    """
+
+    type = None
+
+    def __init__(self, registry, name, documentation, labels=()):
+        """
+        Construtor.
+        """
+
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def key(self, labels):
+        """
+        Valores dos labels na ordem em que foram declarados.
+        """
+
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abc.abstractmethod
+    def merge(self, current, value):
+        """
+        Combina os valores da mesma amostra de processos diferentes.
+        """
+
+    def samples(self, values):
+        """
+        Linhas das amostras no formato de texto do Prometheus.
+        """
+
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{format_labels(self.labels, key)} {format_value(value)}"
+
+
+class Counter(Metric):
+    """
+    Contador que só aumenta. Os processos são somados.
+    """
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        Soma amount ao contador.
+        """
+
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+        self.registry.changed()
+
+    def merge(self, current, value):
+        """
+        Soma os contadores.
+        """
+
+        return current + value
+
+
+class Gauge(Metric):
+    """
+    Valor que sobe e desce. Entre os processos vale o último valor gravado.
+    """
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        """
+        Define o valor.
+        """
+
+        key = self.key(labels)
+        with self.registry.lock:
+            self.values[key] = [value, time.time()]
+
+        self.registry.changed()
+
+    def merge(self, current, value):
+        """
+        Mantém o valor gravado por último.
+        """
+
+        return value if value[1] > current[1] else current
+
+    def samples(self, values):
+        """
+        Linhas das amostras, sem o instante de cada valor.
+        """
+
+        return super(Gauge, self).samples({key: value[0] for key, value in values.items()})
+
+
+class Histogram(Metric):
+    """
+    Histograma com faixas fixas: a quantidade de observações em cada
+    faixa e a soma dos valores. Os processos são somados.
+    """
+
+    type = "histogram"
+
+    def __init__(self, registry, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Construtor.
+        """
+
+        super(Histogram, self).__init__(registry, name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Registra uma observação.
+        """
+
+        key = self.key(labels)
+        with self.registry.lock:
+            # Quantidade de cada faixa, a faixa +Inf e a soma
+            totals = self.values.setdefault(key, [0] * (len(self.buckets) + 2))
+            totals[bisect_left(self.buckets, value)] += 1
+            totals[-1] += value
+
+        self.registry.changed()
+
+    def merge(self, current, value):
+        """
+        Soma as faixas e as somas.
+        """
+
+        return [a + b for a, b in zip(current, value)]
+
+    def samples(self, values):
+        """
+        Linhas das faixas acumuladas, da soma e da quantidade de observações.
+        """
+
+        for key, totals in sorted(values.items()):
+            count = 0
+            for bound, observations in zip(self.buckets + (math.inf,), totals):
+                count += observations
+                le = format_labels(self.labels, key, [("le", format_value(bound))])
+                yield f"{self.name}_bucket{le} {count}"
+
+            labels = format_labels(self.labels, key)
+            yield f"{self.name}_sum{labels} {format_value(float(totals[-1]))}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    """
+    Registro das métricas do processo.
+
+    Com METRICS_DIR, cada processo (ex: workers do gunicorn e o worker de
+    importação) grava o seu estado completo em metrics-<pid>.json nesse
+    diretório, a cada METRICS_FLUSH_INTERVAL segundos em uma thread e ao
+    terminar, e a exposição soma os arquivos de todos os processos. Sem
+    METRICS_DIR, expõe apenas as métricas do próprio processo.
+    """
+
+    def __init__(self):
+        """
+        Construtor.
+        """
+
+        self.metrics = {}
+        self.lock = threading.RLock()
+        self.dirty = False
+        self.flusher = None
+
+    def register(self, metric):
+        """
+        Registra a métrica, ou retorna a já registrada com o mesmo nome.
+        """
+
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        """
+        Registra um contador.
+        """
+
+        return self.register(Counter(self, name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        """
+        Registra um gauge.
+        """
+
+        return self.register(Gauge(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Registra um histograma.
+        """
+
+        return self.register(Histogram(self, name, documentation, labels, buckets))
+
+    def changed(self):
+        """
+        Marca que há valores a gravar e inicia a thread de gravação do processo.
+        """
+
+        self.dirty = True
+        if not settings.METRICS_DIR or (self.flusher is not None and self.flusher[0] == os.getpid()):
+            return
+
+        with self.lock:
+            if self.flusher is None or self.flusher[0] != os.getpid():
+                thread = threading.Thread(target=self.run_flusher, name="metrics-flusher", daemon=True)
+                self.flusher = (os.getpid(), thread)
+                thread.start()
+
+    def run_flusher(self):
+        """
+        Grava periodicamente o estado do processo.
+        """
+
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            if self.dirty:
+                self.flush()
+
+    def dump(self):
+        """
+        Estado do processo: {métrica: [[labels, valor], ...]}.
+        """
+
+        with self.lock:
+            return {
+                name: [[list(key), value] for key, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self):
+        """
+        Grava o estado do processo no METRICS_DIR, trocando o arquivo
+        anterior de uma vez para que a leitura nunca o veja pela metade.
+        """
+
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+
+        self.dirty = False
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(self.dump(), file)
+
+        os.replace(f"{path}.tmp", path)
+
+    def collect(self):
+        """
+        Combina os estados de todos os processos: {métrica: {labels: valor}}.
+        """
+
+        if not settings.METRICS_DIR:
+            states = [self.dump()]
+        else:
+            self.flush()
+            states = []
+            for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics-*.json")):
+                try:
+                    with open(path) as file:
+                        states.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+
+        collected = {name: {} for name in self.metrics}
+        for state in states:
+            for name, samples in state.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+
+                values = collected[name]
+                for key, value in samples:
+                    key = tuple(key)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+
+        return collected
+
+    def expose(self):
+        """
+        Métricas no formato de texto do Prometheus.
+        """
+
+        lines = []
+        for name, values in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.samples(values))
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+atexit.register(lambda: registry.dirty and registry.flush())
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "Duração das requisições, por view, método e status.",
+    labels=("view", "method", "status")
+)
+
+
+class MetricsMiddleware:
+    """
+    Registra a duração de cada requisição no histograma REQUEST_SECONDS,
+    de onde o Prometheus calcula os percentis (ex: p50 e p99) por view.
+    """
+
+    def __init__(self, get_response):
+        """
+        Construtor.
+        """
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Mede a requisição.
+        """
+
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            view=match.view_name if match else "unmatched",
+            method=request.method,
+            status=response.status_code
+        )
+
+        return response
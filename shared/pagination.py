@@ -0,0 +1,165 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import status
+from .exception import GenericException
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginação por chave (keyset): o cursor guarda os valores dos campos
+    de ordenação do último item da página e a próxima página é filtrada
+    a partir deles. Com um índice nos mesmos campos, uma página profunda
+    custa o mesmo que a primeira, ao contrário do LIMIT/OFFSET.
+
+    Sem um ordering definido, usa o Meta.ordering do modelo, cujo último
+    campo deve ser único (ex: id).
+    """
+
+    ordering = None
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    max_limit = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Retorna os itens da página indicada pelo cursor.
+        """
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.fields = tuple(self.ordering or queryset.model._meta.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        queryset = queryset.order_by(*self.fields)
+        if cursor:
+            queryset = queryset.filter(self.after(queryset.model, self.decode_cursor(cursor)))
+
+        # Um item a mais indica se existe uma próxima página
+        items = list(queryset[:self.limit + 1])
+        self.has_next = len(items) > self.limit
+        self.page = items[:self.limit]
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        """
+        Resposta paginada com o link para a próxima página.
+        """
+
+        return Response(
+            {"success": True, "next": self.get_next_link(), "results": data},
+            status=status.HTTP_200_OK
+        )
+
+    def get_limit(self, request):
+        """
+        Quantidade de itens por página, limitada ao max_limit.
+        """
+
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return settings.REST_FRAMEWORK["PAGE_SIZE"]
+
+        return min(max(limit, 1), self.max_limit)
+
+    def get_next_link(self):
+        """
+        URL da próxima página, com o cursor do último item desta página.
+        """
+
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        values = [getattr(last, field.lstrip("-")) for field in self.fields]
+        url = self.request.build_absolute_uri()
+
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values))
+
+    def get_previous_link(self):
+        """
+        Sem link anterior: a navegação por chave é apenas para frente.
+        """
+
+        return None
+
+    def encode_cursor(self, values):
+        """
+        Codifica os valores dos campos de ordenação no cursor.
+        """
+
+        data = json.dumps([str(value) for value in values])
+
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        """
+        Decodifica o cursor nos valores dos campos de ordenação.
+        """
+
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()).decode())
+        except (ValueError, TypeError):
+            values = None
+
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise GenericException("Cursor inválido.", status_code=status.HTTP_400_BAD_REQUEST)
+
+        return values
+
+    def after(self, model, values):
+        """
+        Condição dos itens posteriores ao cursor na ordenação. Para
+        (-date, -time, -id): date <= d E (date < d OU (date = d E time < t)
+        OU (date = d E time = t E id < i)). O limite no primeiro campo
+        permite que o banco percorra o índice a partir do cursor, em vez de
+        avaliar o OU em todas as linhas.
+        """
+
+        bound = Q()
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.fields, values):
+            name = field.lstrip("-")
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise GenericException("Cursor inválido.", status_code=status.HTTP_400_BAD_REQUEST)
+
+            descending = field.startswith("-")
+            if not equal:
+                bound = Q(**{f"{name}__{'lte' if descending else 'gte'}": value})
+
+            condition |= Q(**equal, **{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal[name] = value
+
+        return bound & condition
+
+    def get_schema_operation_parameters(self, view):
+        """
+        Parâmetros da paginação para a documentação.
+        """
+
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Cursor da próxima página, retornado no campo next.",
+                "schema": {"type": "string"}
+            },
+            {
+                "name": self.limit_query_param,
+                "required": False,
+                "in": "query",
+                "description": f"Quantidade de itens por página (máximo de {self.max_limit}).",
+                "schema": {"type": "integer"}
+            }
+        ]
@@ -1,6 +1,30 @@
+from rest_framework.permissions import BasePermission
+from rest_framework.views import status
+from .exception import GenericException
+
+
 def is_logged(request):
     """
     Verifica se o usuário está autenticado.
     """
 
     return bool(request.user and request.user.is_authenticated)
+
+
+class StaffPermission(BasePermission):
+    """
+    Permissão apenas para usuários staff autenticados.
+    """
+
+    def has_permission(self, request, view):
+        """
+        Verifica se o usuário autenticado é staff.
+        """
+
+        if not is_logged(request):
+            raise GenericException("Usuário precisa esta autenticado para realizar essa ação!", status_code=status.HTTP_401_UNAUTHORIZED)
+
+        if not request.user.is_staff:
+            raise GenericException("Usuário não tem permissão para realizar essa ação!", status_code=status.HTTP_403_FORBIDDEN)
+
+        return True
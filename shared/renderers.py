@@ -0,0 +1,135 @@
+import csv
+import gzip
+import io
+import json
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps(data):
+    """
+    Serializa os dados em JSON (bytes) com o orjson, quando instalado,
+    ou com o módulo json da biblioteca padrão. Os tipos que o orjson não
+    conhece (ex: Decimal) usam o mesmo encoder do DRF.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(data, default=JSONEncoder().default, option=orjson.OPT_UTC_Z)
+
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renderer JSON que usa o orjson quando disponível. Respostas indentadas
+    (ex: Accept: application/json; indent=4) usam o renderer do DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renderiza os dados em JSON.
+        """
+
+        if data is None:
+            return b""
+
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        return dumps(data)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renderer NDJSON (um objeto JSON por linha). As views que o aceitam
+    devolvem uma StreamingHttpResponse com stream_ndjson; o render é
+    usado apenas nas respostas comuns, como as de erro.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renderiza uma lista com um item por linha ou um único objeto.
+        """
+
+        if data is None:
+            return b""
+
+        items = data if isinstance(data, list) else [data]
+
+        return b"".join(dumps(item) + b"\n" for item in items)
+
+
+def stream_ndjson(items):
+    """
+    Resposta NDJSON enviada aos poucos, serializando cada item apenas
+    quando o cliente estiver pronto para recebê-lo.
+    """
+
+    return StreamingHttpResponse(
+        (dumps(item) + b"\n" for item in items),
+        content_type=NDJSONRenderer.media_type
+    )
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renderer CSV. As views que o aceitam devolvem uma StreamingHttpResponse
+    com o arquivo já gerado; o render é usado apenas nas respostas comuns,
+    como as de erro, com uma coluna por chave.
+    """
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renderiza um objeto ou uma lista de objetos, um por linha.
+        """
+
+        if data is None:
+            return b""
+
+        if isinstance(data, bytes):
+            return data
+
+        items = data if isinstance(data, list) else [data]
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=list(items[0]) if items else [])
+        writer.writeheader()
+        writer.writerows(items)
+
+        return buffer.getvalue().encode("utf-8")
+
+
+class GzipCSVRenderer(CSVRenderer):
+    """
+    Renderer do CSV compactado com gzip.
+    """
+
+    media_type = "application/gzip"
+    format = "gzip"
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renderiza o CSV e o compacta.
+        """
+
+        if data is None:
+            return b""
+
+        if isinstance(data, bytes):
+            return data
+
+        return gzip.compress(super(GzipCSVRenderer, self).render(data, accepted_media_type, renderer_context))
@@ -0,0 +1,185 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Medição da requisição atual de cada thread
+_local = threading.local()
+
+
+class RequestTimer:
+    """
+    Medição de uma requisição: tempo total, tempo de cada fase (somado
+    quando a fase se repete, ex: um por lote) e quantidade e tempo das
+    consultas SQL, atribuídas também à fase mais interna em andamento.
+    """
+
+    def __init__(self):
+        """
+        Construtor.
+        """
+
+        self.start = time.perf_counter()
+        self.phases = OrderedDict()
+        self.stack = []
+        self.queries = 0
+        self.sql = 0.0
+
+    def begin(self, name):
+        """
+        Inicia uma fase.
+        """
+
+        self.stack.append((name, time.perf_counter()))
+
+    def end(self):
+        """
+        Encerra a fase mais interna e soma o seu tempo.
+        """
+
+        name, start = self.stack.pop()
+        self.phase(name)[0] += time.perf_counter() - start
+
+    def phase(self, name):
+        """
+        Totais da fase: [segundos, consultas, segundos de SQL].
+        """
+
+        return self.phases.setdefault(name, [0.0, 0, 0.0])
+
+    def execute(self, execute, sql, params, many, context):
+        """
+        Wrapper das consultas do banco (connection.execute_wrapper).
+        """
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            self.queries += 1
+            self.sql += seconds
+            if self.stack:
+                totals = self.phase(self.stack[-1][0])
+                totals[1] += 1
+                totals[2] += seconds
+
+    def header(self, total):
+        """
+        Valor do cabeçalho Server-Timing, com os tempos em milissegundos.
+        """
+
+        metrics = [
+            f'{name};dur={seconds * 1000:.1f};desc="{queries} queries"'
+            for name, (seconds, queries, _) in self.phases.items()
+        ]
+        metrics.append(f'sql;dur={self.sql * 1000:.1f};desc="{self.queries} queries"')
+        metrics.append(f"total;dur={total * 1000:.1f}")
+
+        return ", ".join(metrics)
+
+    def record(self, request, response, total):
+        """
+        Dados da linha de log estruturada da requisição.
+        """
+
+        return {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "sql_queries": self.queries,
+            "sql_ms": round(self.sql * 1000, 1),
+            "phases": {
+                name: {"ms": round(seconds * 1000, 1), "sql_queries": queries, "sql_ms": round(sql * 1000, 1)}
+                for name, (seconds, queries, sql) in self.phases.items()
+            }
+        }
+
+
+@contextmanager
+def measure():
+    """
+    Mede as fases e as consultas SQL do bloco na thread atual, em todas
+    as conexões com o banco. Ex: with measure() as timer: ...
+    """
+
+    timer = RequestTimer()
+    _local.timer = timer
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer.execute))
+
+            yield timer
+
+            while timer.stack:
+                timer.end()
+    finally:
+        _local.timer = None
+
+
+@contextmanager
+def phase(name):
+    """
+    Mede uma fase da requisição atual. Fora do ServerTimingMiddleware e do
+    measure() (ex: no worker), não faz nada.
+    """
+
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        yield
+        return
+
+    timer.begin(name)
+    try:
+        yield
+    finally:
+        timer.end()
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware opcional (SERVER_TIMING) que mede cada requisição e envia os
+    tempos no cabeçalho Server-Timing e em uma linha de log JSON: as fases
+    marcadas com phase() nas views, a renderização da resposta e as
+    consultas SQL. O corpo das respostas enviadas aos poucos não é medido.
+    """
+
+    def __init__(self, get_response):
+        """
+        Construtor.
+        """
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Mede a requisição.
+        """
+
+        with measure() as timer:
+            response = self.get_response(request)
+
+        total = time.perf_counter() - timer.start
+        response["Server-Timing"] = timer.header(total)
+        logger.info(json.dumps(timer.record(request, response, total)))
+
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Inicia a fase de renderização, que termina quando a resposta
+        volta para o middleware.
+        """
+
+        timer = getattr(_local, "timer", None)
+        if timer is not None:
+            timer.begin("render")
+
+        return response
@@ -30,5 +30,15 @@ echo "Criando as migrações e inserindo no banco de dados PostgreSQL"
 python3 manage.py makemigrations
 python3 manage.py migrate
 
+echo "Removendo as métricas gravadas pelos processos anteriores"
+if [ -n "$METRICS_DIR" ]; then
+  rm -f "$METRICS_DIR"/metrics-*.json
+fi
+
 echo "Rodando o servidor"
-gunicorn config.wsgi --bind 0.0.0.0:8000 --reload --graceful-timeout=900 --timeout=900 --workers 1
+if [ "$ASGI" = "true" ]; then
+  # Servidor ASGI (uvicorn): habilita o upload assíncrono em /cnab/upload/async/
+  gunicorn config.asgi -k uvicorn.workers.UvicornWorker --bind 0.0.0.0:8000 --reload --graceful-timeout=900 --timeout=900 --workers 1
+else
+  gunicorn config.wsgi --bind 0.0.0.0:8000 --reload --graceful-timeout=900 --timeout=900 --workers 1
+fi